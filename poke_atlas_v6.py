@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+
+__author__ = 'Shamar D. Brown'
+__version__ = '6.0'
+
+import os
+import sys
+import ast
+import mmap
+import time
+from math import prod
+from multiprocessing import Pool
+from poke_cache_v6 import CACHE_DIR, chart_key, cached_tables, cached_combo_index
+from poke_functions_v6 import Pkmn, generate_type_combos
+from poke_profile_v6 import profiler
+from poke_render_v6 import member_record
+
+'''
+DESCRIPTION:
+    - precomputed coverage atlas for "poke_coverage": every member's coverage analysis, built once per chart
+    - one row per combo in generate_type_combos() order, for both modes:
+        default:   STAB ranking & the top-4 coverage options, each with weak/resist/immune counts
+        --optimal: the top-k move sets & their scores, plus the options counted against combos STAB can't hit
+    - rows are built in shards over a process pool, each shard writing its rows into one memory-mapped .npy file
+    - normal runs map the file & turn a member into a record with one dict lookup & one row read; no coverage math
+    - reading needs no NumPy: the .npy header is parsed & the rows are read as int16 straight from the mapping
+      (NumPy is only imported to build the atlas)
+    - the file name holds a hash of the chart & k; a changed chart builds (and looks up) a new file
+
+FUNCTIONS:
+from poke_atlas_v6 import CoverageAtlas, atlas_path, build_atlas, load_atlas
+'''
+
+
+########################################################################################################################
+#                                              C O N S T A N T S                                                       #
+########################################################################################################################
+
+# bump when the row layout changes
+ATLAS_VERSION = 1
+
+# move sets kept per combo
+ATLAS_TOP = 5
+
+# combos per shard
+ATLAS_SHARD = 32
+
+# .npy magic string
+NPY_MAGIC = b'\x93NUMPY'
+
+# per-process atlas build state; set by _init_atlas_worker()
+_atlas_state = {}
+
+
+########################################################################################################################
+#                                                      CLASSES                                                         #
+########################################################################################################################
+
+
+# Create the CoverageAtlas object; memory-mapped rows & the combo -> row lookup
+class CoverageAtlas:
+
+    # initialize atlas attributes
+    def __init__(self, all_types, all_swri, type_combos, values, top=ATLAS_TOP):
+
+        """ :param   all_types:  ['all pkmn types', ]
+            :param    all_swri:  [all_strengths, all_weaknesses, all_resistances, all_immunities]
+            :param type_combos:  [[type combos], ['type_1','type_2' or None], ] in row order
+            :param      values:  int16 values of every row, in atlas_fields() order (memory-mapped memoryview)
+            :param         top:  move sets kept per combo"""
+
+        self.all_types = all_types
+        self.all_swri = all_swri
+        self.values = values
+        self.top = top
+        self.n_combos = len(type_combos)
+        self.position = {tuple(combo): row for row, combo in enumerate(type_combos)}
+
+        # {'field': (first value in the row, values)}; a row is 'width' values
+        self.fields, self.width = {}, 0
+        for name, shape in atlas_fields(top):
+            self.fields[name] = (self.width, prod(shape))
+            self.width += prod(shape)
+
+    # Get the member record for 'pokemon' (member number 0); None if the combo is not in the atlas
+    def member(self, pokemon, optimal=False, top=3):
+
+        """ :param pokemon:  ('type1', 'type2' or None)
+            :param optimal:  True = the --optimal record
+            :param     top:  move sets listed by --optimal (at most self.top)"""
+
+        row = self.position.get(tuple(pokemon))
+        profiler.hit('atlas', row is not None)
+        if row is None or top > self.top:
+            return None
+
+        entry = self.values[row * self.width:(row + 1) * self.width].tolist()
+        entry = {name: entry[start:start + size] for name, (start, size) in self.fields.items()}
+        this_pkmn = Pkmn(self.all_types, list(pokemon), self.all_swri)
+        stab = self._coverage(entry['stab'], entry['stab_counts'])
+        if not optimal:
+            return member_record(0, pokemon, this_pkmn, stab, self._coverage(entry['options'], entry['option_counts']))
+
+        movesets = [entry['movesets'][rank * 4:(rank + 1) * 4] for rank in range(top)]
+        best_movesets = [(score, [self.all_types[t] for t in moveset if t >= 0])
+                         for score, moveset in zip(entry['scores'][:top], movesets)]
+        return member_record(0, pokemon, this_pkmn, stab,
+                             self._coverage(entry['optimal_options'], entry['optimal_counts']), best_movesets,
+                             self.n_combos)
+
+    # Convert stored (type index, counts) columns back to coverage_record()
+    def _coverage(self, types, counts):
+
+        """ :param  types:  [type index or -1, ]
+            :param counts:  [weak, resist, immune, ] per type, flattened"""
+
+        return [{'type': self.all_types[t], 'weak': counts[3 * c], 'resist': counts[3 * c + 1],
+                 'immune': counts[3 * c + 2]} for c, t in enumerate(types) if t >= 0]
+
+
+########################################################################################################################
+#                                                    FUNCTIONS                                                         #
+########################################################################################################################
+
+# Row layout; [('field', shape)], every value int16; type indexes are -1 when a column is empty
+def atlas_fields(top=ATLAS_TOP):
+
+    """ :param top:  move sets kept per combo"""
+
+    return [('stab', (2,)), ('stab_counts', (2, 3)), ('options', (4,)), ('option_counts', (4, 3)),
+            ('movesets', (top, 4)), ('scores', (top,)), ('optimal_options', (4,)), ('optimal_counts', (4, 3))]
+
+
+# Row layout as a NumPy dtype (building only)
+def atlas_dtype(top=ATLAS_TOP):
+
+    """ :param top:  move sets kept per combo"""
+
+    import numpy as np
+    return np.dtype([(name, '<i2', shape) for name, shape in atlas_fields(top)])
+
+
+# Path of the atlas for a chart & k
+def atlas_path(all_types, all_swri, unused_combos, top=ATLAS_TOP, cache_dir=CACHE_DIR):
+
+    """ :param     all_types:  ['all pkmn types', ]
+        :param      all_swri:  [all_strengths, all_weaknesses, all_resistances, all_immunities]
+        :param unused_combos:  [(type combos not used by legitimate Pokémon), ]
+        :param           top:  move sets kept per combo
+        :param     cache_dir:  'path_to_cache_directory'"""
+
+    key = chart_key(all_types, all_swri, unused_combos).hex()
+
+    return os.path.join(cache_dir, f'poke_atlas_v{ATLAS_VERSION}_{key[:32]}_k{top}.npy')
+
+
+# Build the atlas for every combo; shards of ATLAS_SHARD combos are computed over a process pool
+def build_atlas(all_types, all_swri, unused_combos, top=ATLAS_TOP, cache_dir=CACHE_DIR, processes=None):
+
+    """ :param     all_types:  ['all pkmn types', ]
+        :param      all_swri:  [all_strengths, all_weaknesses, all_resistances, all_immunities]
+        :param unused_combos:  [(type combos not used by legitimate Pokémon), ]
+        :param           top:  move sets kept per combo
+        :param     cache_dir:  'path_to_cache_directory'
+        :param     processes:  worker processes (None = os.cpu_count(); 1 = this process)
+
+        :return: 'path_to_atlas'"""
+
+    processes = processes or os.cpu_count() or 1
+    path = atlas_path(all_types, all_swri, unused_combos, top, cache_dir)
+    all_combos = cached_tables(all_types, all_swri, unused_combos, cache_dir)['all_combos']
+
+    # shards write into a temporary file; readers only ever see a finished atlas
+    import numpy as np
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_path = f'{path[:-len(".npy")]}.{os.getpid()}.tmp.npy'
+    np.lib.format.open_memmap(temp_path, mode='w+', dtype=atlas_dtype(top), shape=(len(all_combos),)).flush()
+
+    start = time.perf_counter()
+    state = {'chart': (all_types, all_swri, unused_combos), 'top': top, 'cache_dir': cache_dir, 'path': temp_path}
+    shards = range(0, len(all_combos), ATLAS_SHARD)
+    if processes == 1:
+        _init_atlas_worker(state)
+        done = sum(map(_atlas_shard, shards))
+    else:
+        with Pool(processes, initializer=_init_atlas_worker, initargs=(state,)) as pool:
+            done = sum(pool.imap_unordered(_atlas_shard, shards))
+    os.replace(temp_path, path)
+
+    print(f'** atlas: {done} combos in {time.perf_counter() - start:.2f}s -> {path}', file=sys.stderr)
+
+    return path
+
+
+# Map the atlas for a chart; None if it has not been built (or holds fewer than 'top' move sets)
+def load_atlas(all_types, all_swri, unused_combos, top=ATLAS_TOP, cache_dir=CACHE_DIR):
+
+    """ :param     all_types:  ['all pkmn types', ]
+        :param      all_swri:  [all_strengths, all_weaknesses, all_resistances, all_immunities]
+        :param unused_combos:  [(type combos not used by legitimate Pokémon), ]
+        :param           top:  move sets kept per combo
+        :param     cache_dir:  'path_to_cache_directory'"""
+
+    path = atlas_path(all_types, all_swri, unused_combos, top, cache_dir)
+    try:
+        with open(path, 'rb') as atlas_file:
+            mapped = mmap.mmap(atlas_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    # .npy v1: magic, version, uint16 header length; v2+: uint32 header length; the header is a dict literal
+    try:
+        if mapped[:6] != NPY_MAGIC:
+            return None
+        size = 2 if mapped[6] == 1 else 4
+        start = 8 + size + int.from_bytes(mapped[8:8 + size], 'little')
+        header = ast.literal_eval(mapped[8 + size:start].decode('latin-1'))
+    except (ValueError, SyntaxError, IndexError):
+        return None
+
+    all_combos = generate_type_combos(all_types, unused_combos)
+    descr = [(name, '<i2', shape) for name, shape in atlas_fields(top)]
+    if header.get('descr') != descr or header.get('shape') != (len(all_combos),) or header.get('fortran_order'):
+        return None
+
+    # rows are little-endian int16; a big-endian host reads a byte-swapped copy
+    width = sum(prod(shape) for _, shape in atlas_fields(top))
+    values = memoryview(mapped)[start:start + 2 * width * len(all_combos)]
+    if len(values) != 2 * width * len(all_combos):
+        return None
+    if sys.byteorder == 'little':
+        values = values.cast('h')
+    else:
+        from array import array
+        values = array('h', values)
+        values.byteswap()
+        values = memoryview(values)
+
+    return CoverageAtlas(all_types, all_swri, all_combos, values, top)
+
+
+# Set the per-process build state: the setup tables, one default & one --optimal session, the mapped output
+def _init_atlas_worker(state):
+
+    """ :param state:  {'chart', 'top', 'cache_dir', 'path'}"""
+
+    import numpy as np
+    from poke_session_v6 import TeamSession
+
+    all_types, all_swri, unused_combos = state['chart']
+    tables = cached_tables(all_types, all_swri, unused_combos, state['cache_dir'])
+    index = cached_combo_index(tables, all_types)
+    hit_bitsets = [index.bitsets['weak'][t] for t in all_types]
+
+    _atlas_state.clear()
+    _atlas_state.update(types=all_types, combos=tables['all_combos'], out=np.load(state['path'], mmap_mode='r+'),
+                        default=TeamSession(all_types, all_swri, tables['all_type_counts'], index),
+                        optimal=TeamSession(all_types, all_swri, tables['all_type_counts'], index, hit_bitsets,
+                                            state['top']))
+
+
+# Analyse one shard of combos & write its rows; returns the number of rows written
+def _atlas_shard(start):
+
+    """ :param start:  first combo of the shard"""
+
+    types, combos, out = _atlas_state['types'], _atlas_state['combos'], _atlas_state['out']
+    position = {t: i for i, t in enumerate(types)}
+    shard = combos[start:start + ATLAS_SHARD]
+
+    for row, combo in enumerate(shard, start):
+        pokemon = (combo[0], combo[1] if len(combo) > 1 else None)
+        default = _atlas_state['default']._analyse(pokemon)
+        optimal = _atlas_state['optimal']._analyse(pokemon)
+        entry = out[row]
+        entry['stab'], entry['stab_counts'] = _columns(default['stab'], position, 2)
+        entry['options'], entry['option_counts'] = _columns(default['options'], position, 4)
+        entry['optimal_options'], entry['optimal_counts'] = _columns(optimal['options'], position, 4)
+        entry['movesets'] = -1
+        entry['scores'] = -1
+        for rank, moveset in enumerate(optimal['movesets']):
+            entry['movesets'][rank, :len(moveset['types'])] = [position[t] for t in moveset['types']]
+            entry['scores'][rank] = moveset['hit']
+    out.flush()
+
+    return len(shard)
+
+
+# Convert coverage_record() columns to (type indexes, counts) padded with -1 to 'width'
+def _columns(coverage, position, width):
+
+    """ :param coverage:  coverage_record()
+        :param position:  {'type': index}
+        :param    width:  columns stored"""
+
+    types = [position[column['type']] for column in coverage] + [-1] * (width - len(coverage))
+    counts = [[column['weak'], column['resist'], column['immune']] for column in coverage]
+
+    return types, counts + [[0, 0, 0]] * (width - len(coverage))
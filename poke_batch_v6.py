@@ -0,0 +1,360 @@
+#!/usr/bin/env python
+
+__author__ = 'Shamar D. Brown'
+__version__ = '6.0'
+
+import os
+import sys
+import csv
+import json
+import time
+import queue
+from collections import deque
+from itertools import islice
+from multiprocessing import Pool
+import numpy as np
+from poke_matrix_v6 import SUPER_EFFECTIVE, POPCOUNT, build_type_matrix, build_combo_matrix
+from poke_functions_v6 import TEAM_SIZE
+
+'''
+DESCRIPTION:
+    - batch/streaming team analysis for "poke_coverage"
+    - teams stream from a JSONL or CSV file (or stdin) through generators, in fixed-size chunks
+    - each chunk is scored with array operations against tables built once per process
+    - one result row per team is written as it is ready; memory does not grow with the input
+    - given several charts' tables, each chunk is scored against every chart in the same pass (one row per chart)
+    - tables with a 'usage' entry (load_usage() weights) also get 'stab_usage', the % of usage the STAB types hit
+    - tables with a 'defense' entry (build_defense_tables()) also get the team defense columns (poke_defense_v6)
+
+    JSONL:  ["fighting steel", "dragon", ...]  or  {"id": "team-1", "team": [["fighting", "steel"], ["dragon"], ...]}
+    CSV:    fighting steel,dragon,fairy dark,...  (one member per cell; "fighting/steel" also works)
+
+FUNCTIONS:
+from poke_batch_v6 import (parse_member, read_teams, chunked, build_batch_tables, encode_teams, evaluate_chunk,
+                           evaluate_charts, evaluate_teams, write_rows, run_batch)
+'''
+
+
+########################################################################################################################
+#                                              C O N S T A N T S                                                       #
+########################################################################################################################
+
+# CSV result columns
+CSV_FIELDS = ['id', 'team', 'stab_hit', 'stab_missed', 'stacked_weaknesses', 'shared_weaknesses', 'nonstab_types',
+              'error']
+
+# per-process batch tables; set by _init_batch_worker()
+_batch_tables = {}
+
+
+########################################################################################################################
+#                                                    FUNCTIONS                                                         #
+########################################################################################################################
+
+# Convert one member ('fire grass', 'fire/grass', ['fire', 'grass'] or 'dragon') to ['type1', 'type2' or None]
+def parse_member(member):
+
+    """ :param member:  'type1 type2' or ['type1', 'type2' or None]
+
+        raises ValueError for anything else & for more than two types"""
+
+    if isinstance(member, str):
+        types = member.replace('/', ' ').split()
+    elif isinstance(member, (list, tuple)) and all(t is None or isinstance(t, str) for t in member):
+        types = [t for t in member if t]
+    else:
+        raise ValueError(f"bad member {member!r}; expected 'type1 type2' or ['type1', 'type2']")
+    if len(types) > 2:
+        raise ValueError(f'member {member!r} has more than two types')
+
+    return [t.lower() for t in types] + [None] * (2 - len(types))
+
+
+# Stream (team id, [[type1, type2 or None], ]) from a JSONL or CSV file object; blank members are dropped
+# a line that can't be read is streamed as (team id, 'error message') & becomes an error row; the stream goes on
+def read_teams(stream, fmt='jsonl'):
+
+    """ :param stream:  open text file (or sys.stdin)
+        :param    fmt:  'jsonl' or 'csv'"""
+
+    rows = csv.reader(stream) if fmt == 'csv' else (line for line in stream if line.strip())
+    for count, row in enumerate(rows, 1):
+        team_id = count
+        try:
+            if fmt != 'csv':
+                row = json.loads(row)
+                if isinstance(row, dict):
+                    team_id, row = row.get('id', count), row.get('team', [])
+            if not isinstance(row, list):
+                raise ValueError(f'a team is a list of members, not {type(row).__name__}')
+            members = [parse_member(member) for member in row if member]
+        except json.JSONDecodeError as row_error:
+            yield team_id, f'bad JSON: {row_error}'
+            continue
+        except ValueError as row_error:
+            yield team_id, str(row_error)
+            continue
+        yield team_id, [member for member in members if member[0]]
+
+
+# Group an iterable into lists of 'size' items; only one chunk is held at a time
+def chunked(iterable, size):
+
+    """ :param iterable:  any iterable
+        :param     size:  items per chunk"""
+
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+# Build the tables shared by every chunk; any (type1, type2 or None) pair can be a member, not only 'type_combos'
+def build_batch_tables(all_types, all_swri, type_combos, chart=None):
+
+    """ :param   all_types:  ['all pkmn types', ]
+        :param    all_swri:  [all_strengths, all_weaknesses, all_resistances, all_immunities]
+        :param type_combos:  [[type combos], ['type_1','type_2' or None], ] that coverage is counted against
+        :param       chart:  'chart name' added to every row when several charts are evaluated together"""
+
+    type_matrix = build_type_matrix(all_types, all_swri)
+    n = len(all_types)
+
+    # stab rows: packed bits of the combos each type does (2*damage) to; row n (None) hits nothing
+    hits = build_combo_matrix(type_matrix, all_types, type_combos) >= SUPER_EFFECTIVE
+    stab_rows = np.packbits(np.vstack([hits, np.zeros((1, len(type_combos)), dtype=bool)]), axis=1)
+
+    # weak rows: [member pair, attacking type] flags; pair = type1 * (n + 1) + type2 (n = None), last row = no member
+    pairs = [[t1, t2] for t1 in all_types for t2 in all_types + [None]]
+    pair_matrix = build_combo_matrix(type_matrix, all_types, pairs)
+    weak_rows = np.vstack([(pair_matrix >= SUPER_EFFECTIVE).T, np.zeros((1, n), dtype=bool)])
+
+    return {'types': list(all_types), 'index': {t: i for i, t in enumerate(all_types)}, 'stab_rows': stab_rows,
+            'weak_rows': weak_rows, 'n_combos': len(type_combos), 'chart': chart}
+
+
+# Encode a chunk of teams as a [team, member, type] index array (n = None / empty slot)
+def encode_teams(tables, teams):
+
+    """ :param tables:  build_batch_tables()
+        :param  teams:  [[['type1', 'type2' or None], ] or 'error message' (read_teams()), ]
+
+        :return: (index array, [error message or None per team])"""
+
+    index, n = tables['index'], len(tables['types'])
+    encoded = np.full((len(teams), TEAM_SIZE, 2), n, dtype=np.intp)
+    errors = [None] * len(teams)
+
+    for row, team in enumerate(teams):
+        if isinstance(team, str):
+            errors[row] = team
+            continue
+        unknown = [t for member in team for t in member if t is not None and t not in index]
+        if unknown:
+            errors[row] = f'unknown types: {unknown}'
+        elif len(team) > TEAM_SIZE:
+            errors[row] = f'more than {TEAM_SIZE} members'
+        elif any(member[0] is None for member in team):
+            errors[row] = 'member without a type'
+        else:
+            for slot, (t1, t2) in enumerate(team):
+                encoded[row, slot] = index[t1], index.get(t2, n)
+
+    return encoded, errors
+
+
+# Score one chunk of (team id, team) pairs; returns one result row (dict) per team
+def evaluate_chunk(chunk, tables=None):
+
+    """ :param  chunk:  [(team id, [['type1', 'type2' or None], ]), ]
+        :param tables:  build_batch_tables() (default: this process's tables)"""
+
+    tables = tables or _batch_tables
+    types, n = tables['types'], len(tables['types'])
+    encoded, errors = encode_teams(tables, [team for _, team in chunk])
+
+    # offense: OR the packed stab rows of all 12 type slots, then popcount
+    covered = np.bitwise_or.reduce(tables['stab_rows'][encoded.reshape(len(chunk), -1)], axis=1)
+    stab_hit = POPCOUNT[covered].sum(axis=1, dtype=np.intp)
+
+    # defense: members weak to each attacking type; empty slots use the all-False row
+    pair = np.where(encoded[:, :, 0] == n, n * (n + 1), encoded[:, :, 0] * (n + 1) + encoded[:, :, 1])
+    weak_counts = tables['weak_rows'][pair].sum(axis=1)
+    stacked = np.clip(weak_counts - 1, 0, None).sum(axis=1)
+
+    # types on the team; the rest don't do stab damage
+    present = np.zeros((len(chunk), n + 1), dtype=bool)
+    np.put_along_axis(present, encoded.reshape(len(chunk), -1), True, axis=1)
+
+    rows = []
+    for row, (team_id, team) in enumerate(chunk):
+        if isinstance(team, str):
+            rows.append({'id': team_id, 'error': errors[row]})
+            continue
+        if errors[row]:
+            rows.append({'id': team_id, 'team': team, 'error': errors[row]})
+            continue
+        rows.append({'id': team_id, 'team': team, 'stab_hit': int(stab_hit[row]),
+                     'stab_missed': tables['n_combos'] - int(stab_hit[row]), 'stacked_weaknesses': int(stacked[row]),
+                     'shared_weaknesses': [types[t] for t in np.flatnonzero(weak_counts[row] >= 2)],
+                     'nonstab_types': [types[t] for t in np.flatnonzero(~present[row, :n])]})
+
+    # usage-weighted stab coverage (--usage): the covered bits times the combo weights
+    if tables.get('usage') is not None:
+        usage = np.unpackbits(covered, axis=1, count=tables['n_combos']) @ tables['usage'] * 100
+        for row, result in enumerate(rows):
+            if not result.get('error'):
+                result['stab_usage'] = round(float(usage[row]), 3)
+
+    # team defense columns (--defense); same encoding, so the index array is reused
+    if tables.get('defense'):
+        from poke_defense_v6 import evaluate_defense
+        evaluate_defense(tables['defense'], encoded, rows)
+
+    return rows
+
+
+# Score one chunk against several charts in one pass; one row per (team, chart), grouped by team
+def evaluate_charts(chunk, chart_tables=None):
+
+    """ :param        chunk:  [(team id, [['type1', 'type2' or None], ]), ]
+        :param chart_tables:  [build_batch_tables(..., chart='name'), ] (default: this process's tables)"""
+
+    chart_tables = chart_tables or _batch_tables['charts']
+    chart_rows = []
+    for tables in chart_tables:
+        chart_rows.append([{'chart': tables['chart'], **row} for row in evaluate_chunk(chunk, tables)])
+
+    return [row for team_rows in zip(*chart_rows) for row in team_rows]
+
+
+# Set the per-process batch tables; a list of tables is kept as {'charts': [tables, ]}
+def _init_batch_worker(tables):
+
+    """ :param tables:  build_batch_tables() or [build_batch_tables(), ]"""
+
+    _batch_tables.clear()
+    _batch_tables.update({'charts': tables} if isinstance(tables, list) else tables)
+
+
+# Stream result rows for every team; at most 'window' chunks are in flight, so memory stays flat
+def evaluate_teams(teams, tables, chunk_size=1000, processes=1, ordered=True):
+
+    """ :param      teams:  iterable of (team id, [['type1', 'type2' or None], ])
+        :param     tables:  build_batch_tables(), or a list of them (one row per chart; see evaluate_charts())
+        :param chunk_size:  teams per chunk
+        :param  processes:  worker processes (1 = evaluate in this process)
+        :param    ordered:  False yields chunks as soon as any worker finishes"""
+
+    evaluate = evaluate_charts if isinstance(tables, list) else evaluate_chunk
+    chunks = chunked(teams, chunk_size)
+    if processes == 1:
+        for chunk in chunks:
+            yield from evaluate(chunk, tables)
+        return
+
+    window = processes * 2
+    with Pool(processes, initializer=_init_batch_worker, initargs=(tables,)) as pool:
+
+        # ordered: wait on the oldest chunk
+        if ordered:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.apply_async(evaluate, (chunk,)))
+                if len(pending) >= window:
+                    yield from pending.popleft().get()
+            while pending:
+                yield from pending.popleft().get()
+            return
+
+        # unordered: workers hand finished chunks back through a queue
+        finished, in_flight = queue.Queue(), 0
+        for chunk in chunks:
+            pool.apply_async(evaluate, (chunk,), callback=finished.put, error_callback=finished.put)
+            in_flight += 1
+            while in_flight >= window:
+                yield from _finished_rows(finished.get())
+                in_flight -= 1
+        while in_flight:
+            yield from _finished_rows(finished.get())
+            in_flight -= 1
+
+
+# Unpack a finished chunk; re-raise a worker error in this process
+def _finished_rows(result):
+
+    """ :param result:  evaluate_chunk() rows, or the exception a worker raised"""
+
+    if isinstance(result, BaseException):
+        raise result
+    return result
+
+
+# Write result rows to a text stream in buffered batches of 'batch_size' rows
+def write_rows(rows, stream, fmt='jsonl', batch_size=1000, fields=CSV_FIELDS):
+
+    """ :param       rows:  iterable of evaluate_chunk() rows
+        :param     stream:  open text file (or sys.stdout)
+        :param        fmt:  'jsonl' or 'csv'
+        :param batch_size:  rows per write
+        :param     fields:  CSV columns
+
+        :return: int(rows written)"""
+
+    count = 0
+    writer = csv.DictWriter(stream, fields, extrasaction='ignore') if fmt == 'csv' else None
+    if writer:
+        writer.writeheader()
+
+    for batch in chunked(rows, batch_size):
+        if writer:
+            writer.writerows({**row, 'team': json.dumps(row['team']) if 'team' in row else '',
+                              'shared_weaknesses': ' '.join(row.get('shared_weaknesses', [])),
+                              'nonstab_types': ' '.join(row.get('nonstab_types', []))} for row in batch)
+        else:
+            stream.write(''.join(json.dumps(row) + '\n' for row in batch))
+        count += len(batch)
+
+    return count
+
+
+# Run a whole batch: input file ('-' = stdin) -> result rows -> output file ('-' = stdout); reports teams/second
+def run_batch(tables, input_path, output_path='-', in_fmt=None, out_fmt='jsonl', chunk_size=1000, processes=1,
+              ordered=True):
+
+    """ :param      tables:  build_batch_tables(), or a list of them (one row per team & chart)
+        :param  input_path:  'path_to_teams' ('.csv' = CSV, anything else = JSONL) or '-'
+        :param output_path:  'path_to_results' or '-'
+        :param      in_fmt:  'jsonl' or 'csv' (default: from the input file extension)
+        :param     out_fmt:  'jsonl' or 'csv'
+        :param  chunk_size:  teams per chunk
+        :param   processes:  worker processes (None = os.cpu_count())
+        :param     ordered:  keep the input order in the output"""
+
+    processes = processes or os.cpu_count() or 1
+    in_fmt = in_fmt or ('csv' if input_path.endswith('.csv') else 'jsonl')
+    source = sys.stdin if input_path == '-' else open(input_path, 'r', encoding='utf-8-sig', newline='')
+    target = sys.stdout if output_path == '-' else open(output_path, 'w', encoding='utf-8', newline='')
+
+    start = time.perf_counter()
+    try:
+        rows = evaluate_teams(read_teams(source, in_fmt), tables, chunk_size, processes, ordered)
+        fields = ['chart'] + CSV_FIELDS if isinstance(tables, list) else CSV_FIELDS
+        if (tables[0] if isinstance(tables, list) else tables).get('usage') is not None:
+            fields = fields + ['stab_usage']
+        if (tables[0] if isinstance(tables, list) else tables).get('defense'):
+            from poke_defense_v6 import DEFENSE_CSV_FIELDS
+            fields = fields + DEFENSE_CSV_FIELDS
+        count = write_rows(rows, target, out_fmt, chunk_size, fields)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+    elapsed = time.perf_counter() - start
+
+    teams = count // len(tables) if isinstance(tables, list) else count
+    print(f'** {teams} teams in {elapsed:.2f}s ({teams / elapsed if elapsed else 0:.0f} teams/s)', file=sys.stderr)
+
+    return count
@@ -0,0 +1,391 @@
+#!/usr/bin/env python
+
+__author__ = 'Shamar D. Brown'
+__version__ = '6.0'
+
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import itertools
+import statistics
+import tempfile
+from poke_chart_v6 import TypeChart
+from poke_index_v6 import build_combo_index
+from poke_functions_v6 import (Pkmn, generate_type_combos, generate_combo_dicts, type_counts, get_combo_difference,
+                               coverage_types, get_coverage)
+from poke_render_v6 import RENDER_BATCH, make_renderer, coverage_record, member_record, team_record
+from poke_session_v6 import TeamSession
+from poke_usage_v6 import build_usage_index
+from poke_types_v6 import all_types, all_swri, unused_combos
+
+'''
+DESCRIPTION:
+    - reproducible benchmarks for the "poke_coverage" hot paths
+    - chart benchmarks time each setup/scoring function on the real chart & on larger synthetic charts (seeded)
+    - team benchmarks time the per-member loop of poke_coverage_v6.py (records only, then rendered as text/jsonl/csv)
+      & the batch pipeline, team defense matrix & pool matchups at several team counts
+    - session benchmarks time one member swap in an interactive session (TeamSession), analysed or from the atlas
+    - results are written as JSON; '--check' compares a run against a saved baseline & exits 1 on a regression
+      or on a benchmark the baseline doesn't have
+
+    python poke_bench_v6.py [--charts 18,36,72] [--teams 1,1000,100000] [--save FILE | --check FILE]
+
+FUNCTIONS:
+from poke_bench_v6 import (synthetic_chart, random_teams, time_call, chart_benchmarks, team_loop, team_benchmarks,
+                           run_benchmarks, compare_results, print_results)
+'''
+
+
+########################################################################################################################
+#                                              C O N S T A N T S                                                       #
+########################################################################################################################
+
+# default baseline file
+BASELINE_PATH = 'benchmarks/baseline_v6.json'
+
+# the per-member loop is ~0.1 ms per member; larger team counts only run the batch pipeline
+LOOP_MAX_TEAMS = 1000
+
+# matchups grow with teams^2; larger pools are left out
+MATCHUP_MAX_TEAMS = 10000
+
+# every timed batch runs for at least this long (seconds)
+MIN_BATCH_TIME = 0.05
+
+# synthetic chart odds per (attacking type, defending type) pair: 2x, 0.5x, 0x
+SYNTHETIC_ODDS = (0.15, 0.2, 0.03)
+
+
+########################################################################################################################
+#                                                    FUNCTIONS                                                         #
+########################################################################################################################
+
+# Build a random chart with 'n_types' types; same layout as poke_types_v6 (all_types, all_swri)
+def synthetic_chart(n_types, seed=0):
+
+    """ :param n_types:  number of types
+        :param    seed:  random seed; the same seed always builds the same chart"""
+
+    rng = random.Random(seed)
+    types = [f'type{t:03d}' for t in range(n_types)]
+    strengths, weaknesses, resistances, immunities = {t: [] for t in types}, {t: [] for t in types}, {}, {}
+    super_effective, resisted, immune = SYNTHETIC_ODDS
+
+    for atk in types:
+        for dfn in types:
+            roll = rng.random()
+            if roll < super_effective:
+                strengths[atk].append(dfn)
+                weaknesses[dfn].append(atk)
+            elif roll < super_effective + resisted:
+                resistances.setdefault(dfn, []).append(atk)
+            elif roll < super_effective + resisted + immune:
+                immunities.setdefault(dfn, []).append(atk)
+
+    return types, [strengths, weaknesses, resistances, immunities]
+
+
+# Pick 'n_teams' random 6-member teams from 'type_combos'
+def random_teams(type_combos, n_teams, size=6, seed=0):
+
+    """ :param type_combos:  [[type combos], ['type_1','type_2' or None], ]
+        :param     n_teams:  number of teams
+        :param        size:  members per team
+        :param        seed:  random seed"""
+
+    rng = random.Random(seed)
+    return [[list(rng.choice(type_combos)) for _ in range(size)] for _ in range(n_teams)]
+
+
+# Time 'func()'; calls are batched so each timed batch lasts at least MIN_BATCH_TIME
+def time_call(func, repeat=5):
+
+    """ :param   func:  function without arguments
+        :param repeat:  timed batches
+
+        :return: {'min': seconds per call, 'median': seconds per call, 'number': calls per batch, 'repeat': batches}"""
+
+    # calibrate; the first call also warms any lazy caches
+    number, elapsed = 1, 0.0
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_BATCH_TIME:
+            break
+        number *= 2 if elapsed * 10 < MIN_BATCH_TIME else 1 + int(MIN_BATCH_TIME / elapsed)
+
+    samples = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number)
+
+    return {'min': min(samples), 'median': statistics.median(samples), 'number': number, 'repeat': repeat}
+
+
+# Time the setup & scoring functions for one chart; {'name@N types': time_call()}
+def chart_benchmarks(types, swri, unused=(), repeat=5):
+
+    """ :param  types:  ['all pkmn types', ]
+        :param   swri:  [all_strengths, all_weaknesses, all_resistances, all_immunities]
+        :param unused:  [(type combos not used by legitimate Pokémon), ]
+        :param repeat:  timed batches per benchmark"""
+
+    combos = generate_type_combos(types, list(unused))
+    combo_tuples = [tuple(combo) for combo in combos]
+    combo_swri = generate_combo_dicts(types, combos, swri)
+    counts = type_counts(types, combo_swri)
+    index = build_combo_index(types, combos, swri)
+    usage_index = build_usage_index(types, swri, combos, [1 / len(combos)] * len(combos))
+    member = combos[len(combos) // 2]
+    strength = Pkmn(types, member, swri).strength
+    nonstab = [t for t in types if t not in member]
+
+    # a fresh TypeChart every call; Pkmn() & compile_type_chart() would return cached objects
+    def chart_build():
+        chart = TypeChart(types, swri)
+        for combo in combos:
+            chart.combo_masks(combo)
+
+    suite = {'type_chart_build': chart_build,
+             'generate_type_combos': lambda: generate_type_combos(types, list(unused)),
+             'generate_combo_dicts': lambda: generate_combo_dicts(types, combos, swri),
+             'type_counts': lambda: type_counts(types, combo_swri),
+             'get_combo_difference': lambda: get_combo_difference(strength, combo_tuples, counts[0]),
+             'index_combo_difference': lambda: index.combo_difference(strength),
+             'index_type_counts': lambda: index.type_counts(types, index.combo_difference(strength)),
+             'usage_type_counts': lambda: usage_index.type_counts(types, usage_index.combo_difference(strength)),
+             'usage_movesets': lambda: usage_index.optimal_movesets(list(member)),
+             'get_coverage': lambda: get_coverage(list(member), counts)}
+    if nonstab:
+        suite['get_coverage_nonstab'] = lambda: get_coverage(list(nonstab), counts)
+
+    return {f'{name}@{len(types)}types': time_call(func, repeat) for name, func in suite.items()}
+
+
+# Analyse every member of every team; mirrors the default per-member loop in poke_coverage_v6.py
+def team_loop(teams, types, swri, counts, index, renderer=None):
+
+    """ :param    teams:  [[['type1', 'type2' or None], ], ]
+        :param    types:  ['all pkmn types', ]
+        :param     swri:  [all_strengths, all_weaknesses, all_resistances, all_immunities]
+        :param   counts:  type_counts()
+        :param    index:  ComboIndex
+        :param renderer:  Renderer (None = build the records only)"""
+
+    for team in teams:
+        team_nonstab_damage = list(types)
+        for count, pokemon in enumerate(team, 1):
+            this_pkmn = Pkmn(types, pokemon, swri)
+            last_bit_of_combos = index.combo_difference(this_pkmn.strength)
+            stab_coverage = coverage_types(list(pokemon), counts)
+            last_bit_of_counts = index.type_counts(types, last_bit_of_combos)
+            last_bit_of_coverage = coverage_types([t for t in types if t not in this_pkmn.types], last_bit_of_counts)
+            record = member_record(count, pokemon, this_pkmn, coverage_record(stab_coverage, counts),
+                                   coverage_record(last_bit_of_coverage, last_bit_of_counts))
+            if renderer is not None:
+                renderer.member(record)
+            team_nonstab_damage = [t for t in team_nonstab_damage if t not in this_pkmn.types]
+        if renderer is not None:
+            renderer.team(team_record(team, team_nonstab_damage))
+    if renderer is not None:
+        renderer.close()
+
+
+# Time end-to-end team analysis at each team count; {'name@N teams': time_call()}
+def team_benchmarks(team_scales, repeat=5, loop_max=LOOP_MAX_TEAMS):
+
+    """ :param team_scales:  [number of teams, ]
+        :param      repeat:  timed batches per benchmark
+        :param    loop_max:  largest team count the per-member loop runs at"""
+
+    from poke_batch_v6 import build_batch_tables, chunked, encode_teams, evaluate_teams
+    from poke_defense_v6 import build_defense_tables, defense_matrix
+    from poke_matchup_v6 import build_matchup_tables, encode_pool, matchup_matrix
+    from poke_atlas_v6 import build_atlas, load_atlas
+    from poke_movepool_v6 import joint_movesets
+
+    combos = generate_type_combos(all_types, unused_combos)
+    counts = type_counts(all_types, generate_combo_dicts(all_types, combos, all_swri))
+    index = build_combo_index(all_types, combos, all_swri)
+    batch_tables = build_batch_tables(all_types, all_swri, combos)
+    defense_tables = build_defense_tables(all_types, all_swri, combos)
+    matchup_tables = build_matchup_tables(all_types, all_swri)
+    null_stream = open(os.devnull, 'w', encoding='utf-8')
+
+    # one member swap in a live session; cold = the new member is analysed, cached = its record is reused
+    session = TeamSession(all_types, all_swri, counts, index)
+    session.set_team(random_teams(combos, 1)[0])
+    swaps = itertools.cycle(combos)
+
+    results = {'session_swap_cold': time_call(lambda: (session.memo.clear(), session.set_member(0, next(swaps))),
+                                              repeat),
+               'session_swap_cached': time_call(lambda: session.set_member(0, next(swaps)), repeat)}
+
+    # the same cold swap answered from the precomputed atlas (built once, in a scratch cache directory)
+    with tempfile.TemporaryDirectory() as atlas_dir:
+        build_atlas(all_types, all_swri, unused_combos, cache_dir=atlas_dir, processes=1)
+        session.atlas = load_atlas(all_types, all_swri, unused_combos, cache_dir=atlas_dir)
+        results['session_swap_atlas'] = time_call(lambda: (session.memo.clear(), session.set_member(0, next(swaps))),
+                                                  repeat)
+        session.atlas = None
+
+    # best joint move sets for one team; every type legal (the largest option lists) & 4-type pools
+    team = random_teams(combos, 1)[0]
+    hit_bitsets = [index.bitsets['weak'][t] for t in all_types]
+    pools = [random.Random(member).sample(all_types, 4) for member in range(len(team))]
+    results['movepool_joint_any'] = time_call(lambda: joint_movesets(hit_bitsets, all_types, team, [None] * len(team)),
+                                              repeat)
+    results['movepool_joint_pools'] = time_call(lambda: joint_movesets(hit_bitsets, all_types, team, pools), repeat)
+    for n_teams in team_scales:
+        teams = random_teams(combos, n_teams)
+        if n_teams <= loop_max:
+            results[f'team_loop@{n_teams}teams'] = time_call(
+                lambda: team_loop(teams, all_types, all_swri, counts, index), repeat)
+            for fmt in ('text', 'jsonl', 'csv'):
+                results[f'render_{fmt}@{n_teams}teams'] = time_call(
+                    lambda: team_loop(teams, all_types, all_swri, counts, index,
+                                      make_renderer(fmt, null_stream, RENDER_BATCH)), repeat)
+        results[f'batch@{n_teams}teams'] = time_call(
+            lambda: sum(1 for _ in evaluate_teams(enumerate(teams), batch_tables, processes=1)), repeat)
+        encoded = [encode_teams(defense_tables, chunk)[0] for chunk in chunked(teams, 1000)]
+        results[f'defense@{n_teams}teams'] = time_call(
+            lambda: [defense_matrix(defense_tables, chunk) for chunk in encoded], repeat)
+        if n_teams <= MATCHUP_MAX_TEAMS:
+            pool = encode_pool(matchup_tables, teams)[0]
+            results[f'matchups@{n_teams}teams'] = time_call(lambda: matchup_matrix(matchup_tables, pool), repeat)
+    null_stream.close()
+
+    return results
+
+
+# Run every benchmark; returns the JSON-ready report
+def run_benchmarks(chart_sizes, team_scales, repeat=5, loop_max=LOOP_MAX_TEAMS, only=None):
+
+    """ :param chart_sizes:  [number of types, ]; 18 = the real chart, anything else a synthetic one
+        :param team_scales:  [number of teams, ]
+        :param      repeat:  timed batches per benchmark
+        :param    loop_max:  largest team count the per-member loop runs at
+        :param        only:  'substring'; keep only matching benchmarks"""
+
+    results = {}
+    for n_types in chart_sizes:
+        if n_types == len(all_types):
+            results.update(chart_benchmarks(all_types, all_swri, unused_combos, repeat))
+        else:
+            results.update(chart_benchmarks(*synthetic_chart(n_types), repeat=repeat))
+    results.update(team_benchmarks(team_scales, repeat, loop_max))
+
+    if only:
+        results = {name: result for name, result in results.items() if only in name}
+
+    return {'meta': {'python': platform.python_version(), 'implementation': platform.python_implementation(),
+                     'machine': platform.machine(), 'system': platform.system(), 'version': __version__,
+                     'created': time.strftime('%Y-%m-%dT%H:%M:%S')},
+            'results': results}
+
+
+# Compare a run against a baseline; returns [(name, baseline min, current min, ratio, regressed)]
+# a benchmark the baseline doesn't have is unguarded; it is a failure (baseline min & ratio None) until re-saved
+def compare_results(baseline, current, tolerance=0.25):
+
+    """ :param  baseline:  run_benchmarks() report
+        :param   current:  run_benchmarks() report
+        :param tolerance:  allowed slowdown (0.25 = 25% slower than the baseline)"""
+
+    rows = []
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            rows.append((name, None, result['min'], None, True))
+            continue
+        ratio = result['min'] / base['min'] if base['min'] else 1.0
+        rows.append((name, base['min'], result['min'], ratio, ratio > 1 + tolerance))
+
+    return rows
+
+
+# Print a report (or a comparison) in tabular format
+def print_results(report, comparison=None):
+
+    """ :param     report:  run_benchmarks() report
+        :param comparison:  compare_results() (optional)"""
+
+    width = max(len(name) for name in report['results'])
+    if comparison is None:
+        print(f'{"benchmark":<{width}}  {"min":>12}  {"median":>12}  {"calls":>7}')
+        for name, result in report['results'].items():
+            print(f'{name:<{width}}  {result["min"] * 1e3:>10.4f}ms  {result["median"] * 1e3:>10.4f}ms  '
+                  f'{result["number"]:>7}')
+        return
+
+    print(f'{"benchmark":<{width}}  {"baseline":>12}  {"current":>12}  {"ratio":>6}')
+    for name, base, current, ratio, regressed in comparison:
+        if base is None:
+            print(f'{name:<{width}}  {"-":>12}  {current * 1e3:>10.4f}ms  {"-":>6}  ** NOT IN BASELINE')
+            continue
+        flag = '  ** REGRESSION' if regressed else ''
+        print(f'{name:<{width}}  {base * 1e3:>10.4f}ms  {current * 1e3:>10.4f}ms  {ratio:>6.2f}{flag}')
+
+
+# Parse '1,1000,100000' into [1, 1000, 100000]
+def _int_list(value):
+
+    """ :param value:  'comma separated integers'"""
+
+    return [int(item) for item in value.split(',') if item.strip()]
+
+
+########################################################################################################################
+#                                                     START WORK                                                       #
+########################################################################################################################
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark the poke_coverage hot paths')
+    parser.add_argument('--charts', type=_int_list, default=[18, 36, 72],
+                        help='chart sizes in types (18 = real chart, others synthetic; default 18,36,72)')
+    parser.add_argument('--teams', type=_int_list, default=[1, 1000, 100000],
+                        help='team counts for the end-to-end benchmarks (default 1,1000,100000)')
+    parser.add_argument('--loop-max', type=int, default=LOOP_MAX_TEAMS,
+                        help=f'largest team count the per-member loop runs at (default {LOOP_MAX_TEAMS})')
+    parser.add_argument('--repeat', type=int, default=5, help='timed batches per benchmark')
+    parser.add_argument('--only', metavar='TEXT', help='run only benchmarks whose name contains TEXT')
+    parser.add_argument('--output', metavar='FILE', help='write the JSON report to FILE')
+    parser.add_argument('--save', nargs='?', const=BASELINE_PATH, metavar='FILE',
+                        help=f'save the run as the baseline (default {BASELINE_PATH})')
+    parser.add_argument('--check', nargs='?', const=BASELINE_PATH, metavar='FILE',
+                        help=f'compare the run against a baseline; exit 1 on a regression (default {BASELINE_PATH})')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown for --check (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.charts, args.teams, args.repeat, args.loop_max, args.only)
+
+    for path in (args.output, args.save):
+        if path:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as report_file:
+                json.dump(report, report_file, indent=2)
+                report_file.write('\n')
+
+    if not args.check:
+        print_results(report)
+        sys.exit(0)
+
+    with open(args.check, 'r', encoding='utf-8') as baseline_file:
+        comparison = compare_results(json.load(baseline_file), report, args.tolerance)
+    print_results(report, comparison)
+    missing = [row[0] for row in comparison if row[1] is None]
+    regressions = [row[0] for row in comparison if row[4] and row[1] is not None]
+    if missing:
+        print(f'\n** {len(missing)} benchmark(s) not in the baseline (re-run with --save): {missing}', file=sys.stderr)
+    if regressions:
+        print(f'\n** {len(regressions)} regression(s) over {args.tolerance:.0%}: {regressions}', file=sys.stderr)
+    sys.exit(1 if regressions or missing else 0)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+__author__ = 'Shamar D. Brown'
+__version__ = '6.0'
+
+import os
+import sys
+import json
+import struct
+import marshal
+import hashlib
+from poke_functions_v6 import generate_type_combos, generate_combo_dicts, type_counts
+from poke_index_v6 import ComboIndex, build_combo_index
+from poke_profile_v6 import profiler
+
+'''
+DESCRIPTION:
+    - persistent cache of the "poke_coverage" setup tables
+    - tables are compiled once into a flat binary file, keyed by a hash of the type chart & unused combos
+    - later runs read the file back with one marshal.loads(); a changed chart hashes to a new key and is rebuilt
+      automatically
+    - only the tables a run uses are stored; the NumPy matrices are built by the modules that need them
+
+    FILE LAYOUT:
+        magic (8 bytes) | key (32 bytes) | header length (4 bytes) | header (marshal)
+        header = {'all_combos', 'all_combo_swri', 'all_type_counts', 'index'}
+
+FUNCTIONS:
+from poke_cache_v6 import chart_key, build_tables, save_tables, load_tables, cached_tables, cached_combo_index
+'''
+
+
+########################################################################################################################
+#                                              C O N S T A N T S                                                       #
+########################################################################################################################
+
+# file signature; bump the version when the layout or table contents change
+CACHE_MAGIC = b'PKMNTB04'
+
+# default cache directory; next to this file
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.poke_cache')
+
+
+########################################################################################################################
+#                                                    FUNCTIONS                                                         #
+########################################################################################################################
+
+# Hash the type chart & unused combos; marshal output is tied to the python version, so that is hashed too
+def chart_key(all_types, all_swri, unused_combos):
+
+    """ :param     all_types:  ['all pkmn types', ]
+        :param      all_swri:  [all_strengths, all_weaknesses, all_resistances, all_immunities]
+        :param unused_combos:  [(type combos not used by legitimate Pokémon), ]"""
+
+    content = json.dumps([CACHE_MAGIC.decode(), sys.version_info[:2], all_types, all_swri, unused_combos],
+                         sort_keys=True)
+    return hashlib.sha256(content.encode('utf-8')).digest()
+
+
+# Build the setup tables from scratch; same values poke_coverage_v6 used to build at import
+def build_tables(all_types, all_swri, unused_combos):
+
+    """ :param     all_types:  ['all pkmn types', ]
+        :param      all_swri:  [all_strengths, all_weaknesses, all_resistances, all_immunities]
+        :param unused_combos:  [(type combos not used by legitimate Pokémon), ]"""
+
+    with profiler.stage('generate_type_combos'):
+        all_combos = generate_type_combos(all_types, unused_combos)
+    with profiler.stage('generate_combo_dicts'):
+        all_combo_swri = generate_combo_dicts(all_types, all_combos, all_swri)
+    with profiler.stage('type_counts'):
+        all_type_counts = type_counts(all_types, all_combo_swri)
+    with profiler.stage('build_combo_index'):
+        index = build_combo_index(all_types, all_combos, all_swri)
+
+    return {'all_combos': all_combos, 'all_combo_swri': all_combo_swri, 'all_type_counts': all_type_counts,
+            'index': [[index.bitsets[kind][t] for t in all_types] for kind in ('weak', 'resist', 'immune')]}
+
+
+# Write the tables to 'path'; written to a temporary file first, so readers never see half a file
+def save_tables(path, tables, key):
+
+    """ :param   path:  'path_to_cache_file'
+        :param tables:  build_tables()
+        :param    key:  chart_key()"""
+
+    body = marshal.dumps({name: tables[name] for name in ('all_combos', 'all_combo_swri', 'all_type_counts', 'index')})
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as cache_file:
+        cache_file.write(CACHE_MAGIC + key + struct.pack('<I', len(body)) + body)
+    os.replace(temp_path, path)
+
+
+# Read a cache file; returns None if it is missing, damaged or was built for another chart
+def load_tables(path, key):
+
+    """ :param path:  'path_to_cache_file'
+        :param  key:  chart_key()"""
+
+    try:
+        with open(path, 'rb') as cache_file:
+            data = cache_file.read()
+    except OSError:
+        return None
+
+    prefix = len(CACHE_MAGIC) + len(key) + 4
+    if len(data) < prefix or data[:len(CACHE_MAGIC)] != CACHE_MAGIC or data[len(CACHE_MAGIC):prefix - 4] != key:
+        return None
+    try:
+        size = struct.unpack('<I', data[prefix - 4:prefix])[0]
+        return marshal.loads(data[prefix:prefix + size])
+    except (EOFError, ValueError, TypeError):
+        return None
+
+
+# Load the tables for this chart from 'cache_dir', building & saving them first when needed
+def cached_tables(all_types, all_swri, unused_combos, cache_dir=CACHE_DIR):
+
+    """ :param     all_types:  ['all pkmn types', ]
+        :param      all_swri:  [all_strengths, all_weaknesses, all_resistances, all_immunities]
+        :param unused_combos:  [(type combos not used by legitimate Pokémon), ]
+        :param     cache_dir:  'path_to_cache_directory' (None = build without caching)"""
+
+    key = chart_key(all_types, all_swri, unused_combos)
+    if cache_dir is None:
+        return build_tables(all_types, all_swri, unused_combos)
+
+    path = os.path.join(cache_dir, f'poke_tables_{key.hex()[:16]}.bin')
+    tables = load_tables(path, key)
+    profiler.hit('disk_tables', tables is not None)
+    if tables is None:
+        tables = build_tables(all_types, all_swri, unused_combos)
+        try:
+            save_tables(path, tables, key)
+        except OSError as os_error:
+            print(f'** cache not written: {os_error}', file=sys.stderr)
+
+    return tables
+
+
+# Rebuild the ComboIndex from the cached bitsets
+def cached_combo_index(tables, all_types):
+
+    """ :param    tables:  cached_tables()
+        :param all_types:  ['all pkmn types', ]"""
+
+    return ComboIndex(all_types, tables['all_combos'], *tables['index'])
+
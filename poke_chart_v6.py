@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+
+__author__ = 'Shamar D. Brown'
+__version__ = '6.0'
+
+from poke_profile_v6 import profiler
+
+'''
+DESCRIPTION:
+    - compiled, bitset-backed type chart for "poke_functions" & "poke_coverage"
+    - every type is a bit index (its position in 'all_types')
+    - every strength/weakness/resistance/immunity list is an 18-bit integer mask
+    - combo stats come from mask AND/OR/popcount; names are only rebuilt for printing
+
+FUNCTIONS:
+from poke_chart_v6 import (TypeChart, compile_type_chart, type_mask, mask_to_counted_types, combo_bitsets,
+                           bits_to_items)
+'''
+
+
+########################################################################################################################
+#                                                      CLASSES                                                         #
+########################################################################################################################
+
+
+# Create the compiled TypeChart object
+class TypeChart:
+
+    # initialize compiled chart attributes
+    def __init__(self, all_types, all_swri):
+
+        """ :param all_types:  ['all pkmn types', ]
+            :param  all_swri:  [all_strengths, all_weaknesses, all_resistances, all_immunities]"""
+
+        strengths, weaknesses, resistances, immunities = all_swri
+        profiler.count('objects.TypeChart')
+
+        # bit index for each type; {'type': bit}
+        self.types = tuple(all_types)
+        self.index = {t: bit for bit, t in enumerate(self.types)}
+        self.all_mask = (1 << len(self.types)) - 1
+
+        # one mask per type (None -> 0), for each static dictionary
+        self.strengths = self.compile_dict(strengths)
+        self.weaknesses = self.compile_dict(weaknesses)
+        self.resistances = self.compile_dict(resistances)
+        self.immunities = self.compile_dict(immunities)
+
+        # {normalized (type1, type2): masks / Pkmn}; filled lazily by combo_masks() & Pkmn()
+        self.combos = {}
+        self.pkmn = {}
+
+    # convert a static dictionary into {'type': mask}
+    def compile_dict(self, type_dict):
+
+        """ :param type_dict:  {'atk_type': ['defending types', ]}"""
+
+        masks = {t: type_mask(self.index, type_dict.get(t, [])) for t in self.types}
+        masks[None] = 0
+
+        return masks
+
+    # normalize a type combination: chart order, None last; ('grass', 'fire') -> ('fire', 'grass')
+    def normalize(self, pkmn_types):
+
+        """ :param pkmn_types:  ['pkmn type1', 'type2' or None]"""
+
+        t1, t2 = pkmn_types
+        if t2 is None or self.index.get(t1, len(self.types)) <= self.index.get(t2, len(self.types)):
+            return t1, t2
+        return t2, t1
+
+    # generate masks unique to the pokemon's type combination; mirrors generate_pkmn_stats()
+    def combo_masks(self, pkmn_types):
+
+        """ :param pkmn_types:  ['pkmn type1', 'type2' or None]
+
+            :return: (strength, weak, weak_x2, resisted, resisted_x2, immune, immune_x2)
+                     the '_x2' masks flag types listed by both halves of the combo (4x / 0.25x)"""
+
+        key = self.normalize(pkmn_types)
+        masks = self.combos.get(key)
+        if profiler.enabled:
+            profiler.hit('combo_masks', masks is not None)
+        if masks is not None:
+            return masks
+
+        t1, t2 = key
+        s1, s2 = self.strengths.get(t1, 0), self.strengths.get(t2, 0)
+        w1, w2 = self.weaknesses.get(t1, 0), self.weaknesses.get(t2, 0)
+        r1, r2 = self.resistances.get(t1, 0), self.resistances.get(t2, 0)
+        i1, i2 = self.immunities.get(t1, 0), self.immunities.get(t2, 0)
+
+        # a weakness cancelled by an immunity or a resistance (and vice versa) is dropped
+        weak_any, resist_any, immune = w1 | w2, r1 | r2, i1 | i2
+        weak = weak_any & ~immune & ~resist_any
+        resisted = resist_any & ~immune & ~weak_any
+
+        masks = (s1 | s2, weak, weak & w1 & w2, resisted, resisted & r1 & r2, immune, i1 & i2)
+        self.combos[key] = masks
+
+        return masks
+
+    # convert a type mask to ['types', ] in chart order
+    def names(self, mask):
+
+        """ :param mask:  int() type mask"""
+
+        return bits_to_items(self.types, mask)
+
+    # convert a (mask, doubled mask) pair to ['types', ]; doubled types are listed twice
+    def counted_names(self, mask, doubled):
+
+        """ :param    mask:  int() type mask
+            :param doubled:  int() mask of the types listed twice"""
+
+        return mask_to_counted_types(self.types, mask, doubled)
+
+
+########################################################################################################################
+#                                                    FUNCTIONS                                                         #
+########################################################################################################################
+
+# compiled charts; {(id(all_types), id(all_swri)): (all_types, all_swri, TypeChart)}
+_compiled_charts = {}
+
+
+# Compile the static dictionaries once; repeated calls with the same objects return the cached chart
+def compile_type_chart(all_types, all_swri):
+
+    """ :param all_types:  ['all pkmn types', ]
+        :param  all_swri:  [all_strengths, all_weaknesses, all_resistances, all_immunities]"""
+
+    # the source objects are kept alive in the cache, so their ids cannot be reused
+    key = (id(all_types), id(all_swri))
+    cached = _compiled_charts.get(key)
+    found = cached is not None and cached[0] is all_types and cached[1] is all_swri
+    if profiler.enabled:
+        profiler.hit('type_chart', found)
+    if found:
+        return cached[2]
+
+    chart = TypeChart(all_types, all_swri)
+    _compiled_charts[key] = (all_types, all_swri, chart)
+
+    return chart
+
+
+# Convert ['types', ] to an int() mask
+def type_mask(index, pkmn_types):
+
+    """ :param      index:  {'type': bit}
+        :param pkmn_types:  ['types', ]"""
+
+    mask = 0
+    for t in pkmn_types:
+        if t in index:
+            mask |= 1 << index[t]
+
+    return mask
+
+
+# Convert an int() mask to ['types', ] in bit order, listing the 'doubled' types twice
+def mask_to_counted_types(types, mask, doubled):
+
+    """ :param   types:  ('types in bit order', )
+        :param    mask:  int() type mask
+        :param doubled:  int() mask of the types listed twice"""
+
+    names = []
+    while mask:
+        low = mask & -mask
+        t = types[low.bit_length() - 1]
+        names.append(t)
+        if doubled & low:
+            names.append(t)
+        mask ^= low
+
+    return names
+
+
+# Generate {'type': int(combo bitset)}; bit i is set when the i-th combo lists 'type'
+def combo_bitsets(combo_dict):
+
+    """ :param combo_dict:  {(type_combo): ['types', ], }"""
+
+    bitsets = {}
+    for bit, type_list in enumerate(combo_dict.values()):
+        for t in type_list:
+            bitsets[t] = bitsets.get(t, 0) | (1 << bit)
+
+    return bitsets
+
+
+# Convert an int() bitset back to [items] using the position of each set bit
+def bits_to_items(items, bitset):
+
+    """ :param  items:  [items in bit order]
+        :param bitset:  int() bitset over 'items'"""
+
+    selected = []
+    while bitset:
+        low = bitset & -bitset
+        selected.append(items[low.bit_length() - 1])
+        bitset ^= low
+
+    return selected
@@ -4,8 +4,14 @@ __author__ = 'Shamar D. Brown'
 __version__ = '6.0'
 
 import sys
-from poke_functions_v6 import (Pkmn, import_poke_input_file, generate_type_combos, generate_combo_dicts, type_counts,
-                                 get_combo_difference, get_coverage, join_coverage, print_coverage)
+import atexit
+import argparse
+from poke_functions_v6 import Pkmn, import_poke_input_file
+from poke_cache_v6 import cached_tables, cached_combo_index
+from poke_profile_v6 import profiler
+from poke_render_v6 import make_renderer, comparison_record
+from poke_session_v6 import TeamSession, interactive, watch
+from poke_types_v6 import DEFAULT_CHART, load_chart
 
 '''
 DESCRIPTION:
@@ -29,59 +35,8 @@ DESCRIPTION:
 #                                              C O N S T A N T S                                                       #
 ########################################################################################################################
 
-# list of all types of pokemon
-all_types = ['normal', 'fire', 'water', 'electric', 'grass', 'ice', 'fighting', 'poison', 'ground', 'flying', 'psychic',
-             'bug', 'rock', 'ghost', 'dragon', 'dark', 'steel', 'fairy']
-
-# strengths = {pkmn_type: [types that pkmn_type does "super effective damage"(damage*2 or 4) to]}; offensive dictionary
-all_strengths = {'normal': [], 'fire': ['grass', 'ice', 'bug', 'steel'], 'water': ['fire', 'ground', 'rock'],
-                 'electric': ['water', 'flying'], 'grass': ['water', 'ground', 'rock'],
-                 'ice': ['grass', 'ground', 'flying', 'dragon'], 'fighting': ['normal', 'ice', 'rock', 'dark', 'steel'],
-                 'poison': ['grass', 'fairy'], 'ground': ['fire', 'electric', 'poison', 'rock', 'steel'],
-                 'flying': ['grass', 'fighting', 'bug'], 'psychic': ['fighting', 'poison'],
-                 'bug': ['grass', 'psychic', 'dark'], 'rock': ['fire', 'ice', 'flying', 'bug'],
-                 'ghost': ['psychic', 'ghost'], 'dragon': ['dragon'], 'dark': ['psychic', 'ghost'],
-                 'steel': ['ice', 'rock', 'fairy'], 'fairy': ['fighting', 'dragon', 'dark']}
-
-# weaknesses = {pkmn_type: [types that do "super effective damage"(damage*2 or 4) to pkmn_type]}; defensive dictionary
-all_weaknesses = {'normal': ['fighting'], 'fire': ['water', 'rock', 'ground'], 'water': ['electric', 'grass'],
-                  'electric': ['ground'], 'grass': ['fire', 'ice', 'poison', 'flying', 'bug'],
-                  'ice': ['fire', 'fighting', 'rock', 'steel'], 'fighting': ['flying', 'psychic', 'fairy'],
-                  'poison': ['ground', 'psychic'], 'ground': ['water', 'ice', 'grass'],
-                  'flying': ['electric', 'ice', 'rock'], 'psychic': ['bug', 'ghost', 'dark'],
-                  'bug': ['fire', 'flying', 'rock'], 'rock': ['water', 'grass', 'fighting', 'ground', 'steel'],
-                  'ghost': ['ghost', 'dark'], 'dragon': ['ice', 'dragon', 'fairy'],
-                  'dark': ['fighting', 'bug', 'fairy'],
-                  'steel': ['fire', 'fighting', 'ground'], 'fairy': ['poison', 'steel']}
-
-# resistances = {pkmn_type: [types that do "resisted damage"(damage*0.5 or 0.25) to pkmn_type]}; defensive dictionary
-all_resistances = {'normal': [], 'fire': ['fire', 'grass', 'ice', 'bug', 'steel', 'fairy'],
-                   'water': ['fire', 'water', 'ice', 'steel'], 'electric': ['electric', 'flying', 'steel'],
-                   'grass': ['water', 'electric', 'grass', 'ground'], 'ice': ['ice'],
-                   'fighting': ['bug', 'rock', 'dark'],
-                   'poison': ['fighting', 'poison', 'bug', 'fairy'], 'ground': ['poison', 'rock'],
-                   'flying': ['fighting', 'bug', 'grass'], 'psychic': ['fighting', 'psychic'],
-                   'bug': ['fighting', 'ground', 'grass'], 'rock': ['normal', 'fire', 'poison', 'flying'],
-                   'ghost': ['poison', 'bug'], 'dragon': ['fire', 'water', 'electric', 'grass'],
-                   'dark': ['ghost', 'dark'],
-                   'steel': ['normal', 'grass', 'ice', 'psychic', 'flying', 'bug', 'rock', 'dragon', 'steel', 'fairy'],
-                   'fairy': ['fighting', 'bug', 'dark']}
-
-# immunities = {pkmn_type: types with an "immunity"(damage*0) to pkmn_type}; defensive dictionary
-all_immunities = {'normal': ['ghost'], 'ground': ['electric'], 'flying': ['ground'], 'ghost': ['normal', 'fighting'],
-                  'dark': ['psychic'], 'steel': ['poison'], 'fairy': ['dragon']}
-
-# list of static dictionaries
-all_swri = [all_strengths, all_weaknesses, all_resistances, all_immunities]
-
-# Unused type combinations (for canon Pokémon)
-unused_combos = [['normal', 'ice'], ['normal', 'bug'], ['normal', 'rock'], ['normal', 'steel'], ['fire', 'fairy'],
-                 ['ice', 'poison'], ['ground', 'fairy'], ['bug', 'dragon'], ['rock', 'ghost'], ['ice', 'normal'],
-                 ['bug', 'normal'], ['rock', 'normal'], ['steel', 'normal'], ['fairy', 'fire'], ['poison', 'ice'],
-                 ['fairy', 'ground'], ['dragon', 'bug'], ['ghost', 'rock']]
-
-# initialize count
-all_count = 1
+# the default input file (--input); --watch re-reads it on save
+input_file = r'poke_input.txt'
 
 
 ########################################################################################################################
@@ -89,24 +44,131 @@ all_count = 1
 ########################################################################################################################
 
 
-# INTRO
-print('\n** Starting Program!\n** Ensure input file is current.\n\n')
+# command line options
+parser = argparse.ArgumentParser(description='Suggest coverage move types for the team in poke_input.txt')
+parser.add_argument('--input', metavar='FILE', default=input_file, help=f'team input file (default {input_file})')
+parser.add_argument('--chart', action='append', metavar='NAME|FILE',
+                    help=f'type chart: gen1, gen2-5, gen6, inverse or a chart file (default {DEFAULT_CHART}); '
+                         'repeat to compare the team (or --batch teams) across charts')
+parser.add_argument('--optimal', action='store_true', help='exact best move sets instead of the top-4 type ranking')
+parser.add_argument('--top', type=int, default=3, help='number of move sets listed by --optimal')
+parser.add_argument('--teams', type=int, default=0, metavar='K', help='search for the K best 6-member teams instead')
+parser.add_argument('--lock', action='append', default=[], type=lambda value: (value.split() + [None])[:2],
+                    metavar="'TYPE1 [TYPE2]'", help='member every --teams result must include (repeatable)')
+parser.add_argument('--processes', type=int, default=None,
+                    help='worker processes for --teams/--batch/--matchups (default: all cores)')
+parser.add_argument('--batch', metavar='FILE', help="analyse every team in a JSONL/CSV file ('-' = stdin)")
+parser.add_argument('--output', metavar='FILE', default='-', help="results file (default '-' = stdout)")
+parser.add_argument('--format', choices=['text', 'jsonl', 'csv'], default=None,
+                    help='results format (default: text; --batch: jsonl)')
+parser.add_argument('--chunk-size', type=int, default=1000, help='teams per --batch chunk')
+parser.add_argument('--unordered', action='store_true', help='write --batch results as soon as any chunk finishes')
+parser.add_argument('--matchups', metavar='FILE',
+                    help="rank a pool of teams (JSONL/CSV, '-' = stdin) by their matchups against each other")
+parser.add_argument('--matrix', metavar='FILE.npy', help='--matchups: write the N x N matchup matrix (memory-mapped)')
+parser.add_argument('--matrix-kind', choices=['net', 'hits'], default='net',
+                    help="--matrix cells: 'net' = A's hits on B - B's hits on A; 'hits' = A's hits on B")
+parser.add_argument('--moves', choices=['stab', 'coverage'], default='stab',
+                    help="--matchups: members attack with their STAB types or their best 4-type move set")
+parser.add_argument('--defense', action='store_true',
+                    help='add the team defense report (per attacking type & dual STAB combo); --batch: defense columns')
+parser.add_argument('--usage', metavar='FILE',
+                    help='weight every combo by its usage (CSV: combo or species,weight; JSONL: {"types", "weight"})')
+parser.add_argument('--species', metavar='FILE', help='species -> types file for --usage (CSV or JSON)')
+parser.add_argument('--interactive', action='store_true',
+                    help="after the report, edit the team from stdin ('3 fire ghost'); only changed members rerun")
+parser.add_argument('--watch', action='store_true',
+                    help='after the report, re-analyse the --input file on every save; only changed members rerun')
+parser.add_argument('--build-atlas', action='store_true',
+                    help='precompute every combo\'s coverage (.poke_cache) & exit; later runs look members up')
+parser.add_argument('--no-atlas', action='store_true', help='analyse every member even if an atlas is built')
+parser.add_argument('--profile', nargs='?', const='-', metavar='FILE',
+                    help="write stage timings, counters & cache hit rates at exit ('-' or no FILE = stderr)")
+parser.add_argument('--profile-format', choices=['json', 'folded'], default='json',
+                    help='--profile report format (folded = flamegraph.pl/speedscope stacks)')
+args = parser.parse_args()
+if (args.batch or args.matchups) and args.format == 'text':
+    parser.error('--batch & --matchups write jsonl or csv')
+
+# type charts (charts/*.json); the first drives every mode, any others are compared side by side
+try:
+    all_charts = [load_chart(chart) for chart in args.chart or [DEFAULT_CHART]]
+except (ValueError, KeyError, OSError) as chart_error:
+    parser.error(f'--chart: {chart_error}')
+if len(all_charts) > 1 and (args.teams or args.optimal or args.matchups):
+    parser.error('--teams, --optimal & --matchups use a single --chart')
+if args.defense and len(all_charts) > 1 and not args.batch:
+    parser.error('--defense compares charts only with --batch')
+if args.usage and len(all_charts) > 1 and not args.batch:
+    parser.error('--usage compares charts only with --batch')
+if args.usage and args.teams:
+    parser.error('--teams ranks teams by combo counts; --usage is not supported')
+if (args.interactive or args.watch) and (args.batch or args.teams or len(all_charts) > 1):
+    parser.error('--interactive & --watch edit the input team on a single --chart')
+
+# list of all types of pokemon
+all_types = all_charts[0]['all_types']
+
+# list of static dictionaries [all_strengths, all_weaknesses, all_resistances, all_immunities]
+all_swri = all_charts[0]['all_swri']
+all_strengths, all_weaknesses, all_resistances, all_immunities = all_swri
+
+# Unused type combinations (for canon Pokémon)
+unused_combos = all_charts[0]['unused_combos']
+
+# instrumentation; off unless --profile (batch/team worker processes are not profiled)
+if args.profile:
+    profiler.enable()
+    atexit.register(profiler.write, args.profile, args.profile_format)
+
+# INTRO; jsonl/csv & batch mode keep stdout for result rows; --teams doesn't read the input file
+pkmn_team, pkmn_pools = [], []
+if not (args.batch or args.matchups or args.build_atlas or args.teams):
+    if args.format in (None, 'text'):
+        print('\n** Starting Program!\n** Ensure input file is current.\n\n')
+
+    # import the input file
+    with profiler.stage('input'):
+        pkmn_team, pkmn_pools = import_poke_input_file(args.input, move_pools=True)
+    if args.format in (None, 'text'):
+        print(f'\nT E A M : {pkmn_team}\n')
+
+    # results are built as records & written in buffered batches
+    renderer = make_renderer(args.format or 'text', sys.stdout if args.output == '-' else
+                             open(args.output, 'w', encoding='utf-8', newline=''), comparison=len(all_charts) > 1)
 
-# import the input file
-pkmn_team = import_poke_input_file(r'poke_input.txt')
-print(f'\nT E A M : {pkmn_team}\n')
+# load the setup tables; compiled once per type chart & cached on disk (.poke_cache)
+with profiler.stage('setup'):
+    all_tables = cached_tables(all_types, all_swri, unused_combos)
 
 # Generate a list of all usable type combos
-all_combos = generate_type_combos(all_types, unused_combos)
+all_combos = all_tables['all_combos']
 
 # Generate Dictionaries using Static Dictionaries {type combo: [static dictionary calc]}
-all_combo_swri = generate_combo_dicts(all_types, all_combos, all_swri)
+all_combo_swri = all_tables['all_combo_swri']
 
 # generate type counts; {'atk_type': {'combo count': int(count),
 #                                     ('type_combo',): [(type_combos,) that 'atk_type' does damage to]}}
-all_type_counts = type_counts(all_types, all_combo_swri)
+all_type_counts = all_tables['all_type_counts']
 all_weak_counts, all_resist_counts, all_immune_counts = all_type_counts
 
+# inverted index; {'weak' | 'resist' | 'immune': {'atk_type': int(bitset of combos)}}
+with profiler.stage('setup'):
+    all_index = cached_combo_index(all_tables, all_types)
+
+# usage-weighted index (--usage); counts become % of usage, each one dot product against the combo table
+all_usage = None
+if args.usage:
+    from poke_usage_v6 import read_usage_file, build_usage_index
+    with profiler.stage('usage'):
+        try:
+            all_usage = read_usage_file(args.usage, all_combos, args.species)
+        except (ValueError, OSError) as usage_error:
+            parser.error(f'--usage: {usage_error}')
+        all_usage_index = build_usage_index(all_types, all_swri, all_combos, all_usage['weights'])
+    if args.format in (None, 'text') and not (args.batch or args.matchups):
+        print(f"** usage: {all_usage['rows']} rows ({all_usage['skipped']} skipped; no matching combo)\n")
+
 # used for tracking combos not covered by your team's stab types
 team_nonstab_damage = all_types.copy()
 
@@ -117,40 +179,167 @@ team_nonstab_damage = all_types.copy()
 
 if __name__ == '__main__':
 
-    for pokemon in pkmn_team:
-
-        # create pkmn; print 'this_pkmn' stats
-        this_pkmn = Pkmn(all_types, pokemon, all_swri)
-        all_count = this_pkmn.print_pkmn(all_count)
-
-
-        # [these_combos] = change from list of lists to tuples. to compare to dictionary keys
-        these_combos = [tuple(combo) for combo in all_combos]
-
-        # [last_bit_of_combos] = [these_combos] - [(type combos that 'this_pkmn' does not (2*damage) to), ]
-        last_bit_of_combos = get_combo_difference(this_pkmn.strength, these_combos, all_weak_counts)
-
-        # generate stab coverage data for this_pkmn; [[stab types_header], [stab effectiveness lists]]
-        stab_coverage = get_coverage(this_pkmn.types, all_type_counts)
-
-
-        # generate options for this_pkmn coverage recommendation
-        last_bit_of_combo_swri = generate_combo_dicts(all_types, last_bit_of_combos, all_swri)
-        last_bit_of_counts = type_counts(all_types, last_bit_of_combo_swri)
-        last_bit_of_coverage = get_coverage([t for t in all_types if t not in this_pkmn.types], last_bit_of_counts)
-
-
-        # concatenate stab coverage data & coverage recommendations
-        new_coverage = join_coverage(stab_coverage, last_bit_of_coverage)
-
-        # print 'this_pkmn' coverage table
-        print_coverage(new_coverage)
-
-        # track the types that your pokemon team should cover;
-        team_nonstab_damage = [t for t in team_nonstab_damage if t not in this_pkmn.types]
-
-# print uncoverable combos as a dictionary
-print(f"\n\n\t** {len(team_nonstab_damage)} types don't do stab damage: {team_nonstab_damage} **\n")
+    # precompute the coverage atlas for each chart; shards of combos are analysed over a process pool
+    if args.build_atlas:
+        from poke_atlas_v6 import ATLAS_TOP, build_atlas
+        with profiler.stage('atlas'):
+            for chart in all_charts:
+                build_atlas(chart['all_types'], chart['all_swri'], chart['unused_combos'], max(args.top, ATLAS_TOP),
+                            processes=args.processes)
+        sys.exit(0)
+
+    # rank a pool of teams against each other; blocks of the N x N matrix are scored over a process pool
+    if args.matchups:
+        from poke_matchup_v6 import build_matchup_tables, run_matchups
+        with profiler.stage('matchups'):
+            all_matchup_tables = build_matchup_tables(all_types, all_swri, args.moves,
+                                                      [all_index.bitsets['weak'][t] for t in all_types])
+            run_matchups(all_matchup_tables, args.matchups, args.output, args.matrix, out_fmt=args.format or 'jsonl',
+                         kind=args.matrix_kind, processes=args.processes)
+        sys.exit(0)
+
+    # batch tables per chart; each chart's combos come from its own cached setup tables
+    if args.batch or len(all_charts) > 1:
+        from poke_batch_v6 import build_batch_tables, evaluate_charts, run_batch
+        with profiler.stage('setup'):
+            all_batch_tables = [build_batch_tables(chart['all_types'], chart['all_swri'], cached_tables(
+                chart['all_types'], chart['all_swri'], chart['unused_combos'])['all_combos'], chart['chart'])
+                for chart in all_charts]
+
+        # usage weights per chart; the combo lists differ between charts
+        if args.usage:
+            for chart, batch_tables in zip(all_charts, all_batch_tables):
+                chart_combos = cached_tables(chart['all_types'], chart['all_swri'],
+                                             chart['unused_combos'])['all_combos']
+                batch_tables['usage'] = read_usage_file(args.usage, chart_combos, args.species)['weights']
+
+        # team defense columns; scored from the same encoded chunk
+        if args.defense:
+            from poke_defense_v6 import build_defense_tables
+            for chart, batch_tables in zip(all_charts, all_batch_tables):
+                batch_tables['defense'] = build_defense_tables(chart['all_types'], chart['all_swri'], cached_tables(
+                    chart['all_types'], chart['all_swri'], chart['unused_combos'])['all_combos'])
+
+    # stream a file of teams through the batch pipeline; several charts = one row per team & chart
+    if args.batch:
+        with profiler.stage('batch'):
+            run_batch(all_batch_tables if len(all_charts) > 1 else all_batch_tables[0], args.batch, args.output,
+                      out_fmt=args.format or 'jsonl', chunk_size=args.chunk_size, processes=args.processes,
+                      ordered=not args.unordered)
+        sys.exit(0)
+
+    # compare the team across charts; the team & each member are scored against every chart in one batched pass
+    if len(all_charts) > 1:
+        with profiler.stage('charts'):
+            chart_rows = evaluate_charts([(0, pkmn_team)] + list(enumerate(([pokemon] for pokemon in pkmn_team), 1)),
+                                         all_batch_tables)
+        for member, pokemon in enumerate([pkmn_team] + pkmn_team):
+            entries = []
+            for chart, row in zip(all_charts, chart_rows[member * len(all_charts):(member + 1) * len(all_charts)]):
+                entry = {'chart': chart['chart'], 'stab_hit': row.get('stab_hit'),
+                         'n_combos': row.get('stab_hit', 0) + row.get('stab_missed', 0)}
+                if row.get('error'):
+                    entry = {'chart': chart['chart'], 'error': row['error']}
+                elif member:
+                    chart_pkmn = Pkmn(chart['all_types'], pokemon, chart['all_swri'])
+                    entry.update(weaknesses=len(chart_pkmn.weakness), resistances=len(chart_pkmn.resisted),
+                                 immunities=len(chart_pkmn.immune))
+                else:
+                    entry.update(stacked_weaknesses=row['stacked_weaknesses'],
+                                 shared_weaknesses=row['shared_weaknesses'], nonstab_types=row['nonstab_types'])
+                entries.append(entry)
+            renderer.comparison(comparison_record(member, pokemon, entries))
+        renderer.close()
+        sys.exit(0)
+
+    # generate teams instead of analysing the input team
+    if args.teams:
+        from poke_search_v6 import build_team_tables, optimal_teams, print_teams
+
+        # locked members must be distinct type combos the chart uses, & fit on one team
+        locked = [[t.lower() if t else None for t in combo] for combo in args.lock]
+        locked = [[t1, t2 if t2 != t1 else None] for t1, t2 in locked]
+        usable = {frozenset(combo) for combo in all_combos}
+        for combo in locked:
+            unknown_types = [t for t in combo if t and t not in all_types]
+            if unknown_types:
+                parser.error(f"--lock: {all_charts[0]['chart']} has no {', '.join(unknown_types)} type")
+            if frozenset(combo) not in usable:
+                parser.error(f"--lock: '{' '.join(t for t in combo if t)}' is not a type combo used by any Pokémon")
+        if len({frozenset(combo) for combo in locked}) < len(locked):
+            parser.error('--lock: each locked member must be a different type combo')
+        if len(locked) > 6:
+            parser.error(f'--lock: a team has 6 members; {len(locked)} were locked')
+        with profiler.stage('teams'):
+            all_team_tables = build_team_tables(all_types, all_combos, all_swri,
+                                                [all_index.bitsets['weak'][t] for t in all_types])
+            best_teams = optimal_teams(all_team_tables, locked, k=args.teams, processes=args.processes)
+        print_teams(best_teams, len(all_combos))
+        sys.exit(0)
+
+    # the input team must only use types the chart knows
+    unknown_types = sorted({t for pokemon in pkmn_team + [pool for pool in pkmn_pools if pool]
+                            for t in pokemon if t and t not in all_types})
+    if unknown_types:
+        sys.exit(f"\n** {all_charts[0]['chart']} has no {', '.join(unknown_types)} type. Update the input file. **\n")
+
+    # bitsets of the combos each attacking type does (2*damage) to; used by the exact search
+    all_hit_bitsets = [all_index.bitsets['weak'][t] for t in all_types] if args.optimal else None
+
+    # per-member records are cached by the session; an edit recomputes only the member that changed
+    if all_usage:
+        session = TeamSession(all_types, all_swri, all_usage_index.type_counts(all_types), all_usage_index,
+                              all_hit_bitsets, args.top)
+    else:
+        # members are looked up in the precomputed atlas when one has been built (--build-atlas)
+        all_atlas = None
+        if not args.no_atlas:
+            from poke_atlas_v6 import ATLAS_TOP, load_atlas
+            with profiler.stage('setup'):
+                all_atlas = load_atlas(all_types, all_swri, unused_combos, max(args.top, ATLAS_TOP))
+        session = TeamSession(all_types, all_swri, all_type_counts, all_index, all_hit_bitsets, args.top, all_atlas)
+
+    # stages: 'team' > 'pkmn' (create), 'coverage' (analysis) & 'render' (output), summed over every member
+    with profiler.stage('team'):
+        for slot, pokemon in enumerate(pkmn_team):
+
+            # create pkmn & analyse its coverage
+            try:
+                session.set_member(slot, pokemon, pkmn_pools[slot])
+            except ValueError as member_error:
+                sys.exit(f'\n** {member_error}. Update the input file. **\n')
+
+            # render 'this_pkmn' stats, stab coverage & coverage recommendations
+            with profiler.stage('render'):
+                renderer.member(session.member(slot))
+
+    # track the types that your pokemon team should cover
+    team_nonstab_damage = session.nonstab_types
+
+    # render uncoverable combos
+    renderer.team(session.team())
+
+    # render how the whole team takes hits from each attacking type & dual STAB combo
+    if args.defense:
+        from poke_defense_v6 import build_defense_tables, defense_report
+        with profiler.stage('defense'):
+            all_defense_tables = build_defense_tables(all_types, all_swri, all_combos)
+            renderer.defense(defense_report(all_defense_tables, pkmn_team))
+
+    # render each member's best legal move sets & the team's best joint assignment ('type1 type2 : move pool')
+    if any(pool is not None for pool in pkmn_pools):
+        from poke_movepool_v6 import movepool_report
+        renderer.movepool(movepool_report([all_index.bitsets['weak'][t] for t in all_types], all_types, pkmn_team,
+                                          pkmn_pools, len(all_combos), args.top))
+
+    # write anything still buffered
+    renderer.close()
+
+    # keep the tables in memory & re-render members as they change
+    if args.interactive:
+        interactive(session, renderer, args.input, text=args.format in (None, 'text'))
+    elif args.watch:
+        watch(session, renderer, args.input, text=args.format in (None, 'text'))
 
 ########################################################################################################################
 #                                                       END WORK                                                       #
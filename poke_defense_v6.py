@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+
+__author__ = 'Shamar D. Brown'
+__version__ = '6.0'
+
+import numpy as np
+from poke_matrix_v6 import SUPER_EFFECTIVE, NEUTRAL, build_type_matrix, build_combo_matrix
+from poke_batch_v6 import encode_teams
+
+'''
+DESCRIPTION:
+    - team defensive synergy for "poke_coverage": how the whole team takes hits, not only each member
+    - attackers: the 18 attacking types, then every type combo attacking with its (dual) STAB pair
+      (a combo's multiplier against a member is the better of its two STAB types)
+    - every (type1, type2 or None) member has one precomputed defense vector: its multiplier from each attacker
+    - a chunk of teams is one gather of those vectors ([team, member, attacker]) & a few reductions over 'member':
+      members weak, members resisting, members immune & the worst multiplier per attacker
+    - shared weaknesses: attackers 2+ members are weak to; stacked weaknesses: the sum of (members weak - 1)
+
+FUNCTIONS:
+from poke_defense_v6 import (build_defense_tables, defense_matrix, defense_report, defense_summary, evaluate_defense,
+                             format_defense)
+'''
+
+
+########################################################################################################################
+#                                              C O N S T A N T S                                                       #
+########################################################################################################################
+
+# multiplier of an empty team slot; below every real multiplier, so it never counts as weak, resist or immune
+EMPTY_SLOT = -1.0
+
+# dual-STAB combos listed by the text report
+DEFENSE_TOP_COMBOS = 5
+
+# batch columns added by --defense
+DEFENSE_CSV_FIELDS = ['defense_stacked', 'defense_unresisted', 'defense_worst', 'combo_shared', 'combo_unresisted']
+
+
+########################################################################################################################
+#                                                    FUNCTIONS                                                         #
+########################################################################################################################
+
+# Build the per-member defense vectors; [member pair, attacker] multipliers, pair = type1 * (n + 1) + type2 (n = None)
+def build_defense_tables(all_types, all_swri, type_combos):
+
+    """ :param   all_types:  ['all pkmn types', ]
+        :param    all_swri:  [all_strengths, all_weaknesses, all_resistances, all_immunities]
+        :param type_combos:  [[type combos], ['type_1','type_2' or None], ] that attack with their STAB pair"""
+
+    type_matrix = build_type_matrix(all_types, all_swri)
+    n = len(all_types)
+    index = {t: i for i, t in enumerate(all_types)}
+
+    # [attacking type, member pair]; a doubled type ('fire fire') defends as the single type
+    pairs = [[t1, t2 if t2 != t1 else None] for t1 in all_types for t2 in all_types + [None]]
+    pair_matrix = build_combo_matrix(type_matrix, all_types, pairs)
+
+    # dual STAB attackers: the better of the combo's two attacking rows
+    first = [index[combo[0]] for combo in type_combos]
+    second = [index[combo[1]] if combo[1] else index[combo[0]] for combo in type_combos]
+    stab_matrix = np.maximum(pair_matrix[first], pair_matrix[second])
+
+    # last row = empty slot
+    defense_rows = np.vstack([np.hstack([pair_matrix.T, stab_matrix.T]),
+                              np.full((1, n + len(type_combos)), EMPTY_SLOT, dtype=pair_matrix.dtype)])
+
+    return {'types': list(all_types), 'index': index, 'combos': [list(combo) for combo in type_combos],
+            'defense_rows': defense_rows}
+
+
+# Score a [team, member, type] index array; {'weak'|'resist'|'immune': [team, attacker] counts, 'worst': multipliers}
+def defense_matrix(tables, encoded):
+
+    """ :param  tables:  build_defense_tables()
+        :param encoded:  encode_teams() index array"""
+
+    n = len(tables['types'])
+    pair = np.where(encoded[:, :, 0] == n, n * (n + 1), encoded[:, :, 0] * (n + 1) + encoded[:, :, 1])
+    vectors = tables['defense_rows'][pair]
+
+    return {'weak': np.count_nonzero(vectors >= SUPER_EFFECTIVE, axis=1),
+            'resist': np.count_nonzero((vectors > 0) & (vectors < NEUTRAL), axis=1),
+            'immune': np.count_nonzero(vectors == 0, axis=1),
+            'worst': vectors.max(axis=1)}
+
+
+# Summarise defense_matrix() per team; the columns batch scoring adds (DEFENSE_CSV_FIELDS)
+def defense_summary(tables, matrix):
+
+    """ :param tables:  build_defense_tables()
+        :param matrix:  defense_matrix()
+
+        :return: {'field': [value per team]}"""
+
+    n = len(tables['types'])
+    weak, guarded = matrix['weak'], (matrix['resist'] + matrix['immune']) > 0
+
+    return {'defense_stacked': np.clip(weak[:, :n] - 1, 0, None).sum(axis=1),
+            'defense_unresisted': np.count_nonzero(~guarded[:, :n], axis=1),
+            'defense_worst': matrix['worst'][:, :n].max(axis=1),
+            'combo_shared': np.count_nonzero(weak[:, n:] >= 2, axis=1),
+            'combo_unresisted': np.count_nonzero(~guarded[:, n:], axis=1)}
+
+
+# Build the defense record for one team
+def defense_report(tables, pkmn_team):
+
+    """ :param    tables:  build_defense_tables()
+        :param pkmn_team:  [['type1', 'type2' or None], ]"""
+
+    encoded, errors = encode_teams(tables, [pkmn_team])
+    if errors[0]:
+        return {'record': 'defense', 'team': [[t for t in pokemon if t] for pokemon in pkmn_team], 'error': errors[0]}
+
+    matrix = defense_matrix(tables, encoded)
+    types, combos, n = tables['types'], tables['combos'], len(tables['types'])
+    weak, resist, immune, worst = (matrix[key][0] for key in ('weak', 'resist', 'immune', 'worst'))
+    guarded = (resist + immune) > 0
+
+    # dual STAB combos, most members hit (then worst multiplier) first; 'fire poison' & 'poison fire' listed once
+    ranked, listed = [], set()
+    for c in sorted(range(len(combos)), key=lambda c: (-weak[n + c], -worst[n + c])):
+        if frozenset(combos[c]) not in listed:
+            listed.add(frozenset(combos[c]))
+            ranked.append(c)
+
+    return {'record': 'defense', 'team': [[t for t in pokemon if t] for pokemon in pkmn_team],
+            'types': [{'type': t, 'weak': int(weak[i]), 'resist': int(resist[i]), 'immune': int(immune[i]),
+                       'worst': float(worst[i])} for i, t in enumerate(types)],
+            'shared_weaknesses': [t for i, t in enumerate(types) if weak[i] >= 2],
+            'stacked_weaknesses': int(np.clip(weak[:n] - 1, 0, None).sum()),
+            'unresisted_types': [t for i, t in enumerate(types) if not guarded[i]],
+            'n_combos': len(combos),
+            'combo_shared': int(np.count_nonzero(weak[n:] >= 2)),
+            'combo_unresisted': int(np.count_nonzero(~guarded[n:])),
+            'top_combos': [{'types': [t for t in combos[c] if t], 'weak': int(weak[n + c]),
+                            'worst': float(worst[n + c])} for c in ranked[:DEFENSE_TOP_COMBOS]]}
+
+
+# Add the defense summary columns to one chunk's batch rows; rows & encoded teams are in the same order
+def evaluate_defense(tables, encoded, rows):
+
+    """ :param  tables:  build_defense_tables()
+        :param encoded:  encode_teams() index array for the chunk
+        :param    rows:  evaluate_chunk() rows for the chunk"""
+
+    summary = defense_summary(tables, defense_matrix(tables, encoded))
+    for row, result in enumerate(rows):
+        if not result.get('error'):
+            result.update({field: values[row].item() for field, values in summary.items()})
+
+    return rows
+
+
+# Format the defense record as a text table; the TextRenderer layout
+def format_defense(record):
+
+    """ :param record:  defense_report()"""
+
+    if record.get('error'):
+        return f"\n\t** D E F E N S E :  {record['error']} **\n\n"
+
+    lines = ['\n\tD E F E N S E :\t\t|  weak  |resist |immune |worst\n',
+             '\t\t\t\t|  -----------------------------\n']
+    for row in record['types']:
+        flag = '  ** shared' if row['weak'] >= 2 else ''
+        lines.append(f"\t\t{row['type']:<10}\t|  {row['weak']:<6}|{row['resist']:<7}|{row['immune']:<7}|"
+                     f"{row['worst']:g}x{flag}\n")
+    lines.append(f"\n\tshared weaknesses:\t{record['stacked_weaknesses']} stacked\t| {record['shared_weaknesses']}\n")
+    lines.append(f"\tunresisted types:\t{len(record['unresisted_types'])}\t\t\t| {record['unresisted_types']}\n")
+    lines.append(f"\tdual STAB attackers:\t{record['combo_shared']}/{record['n_combos']} hit 2+ members\t"
+                 f"| {record['combo_unresisted']}/{record['n_combos']} resisted by no member\n")
+    for combo in record['top_combos']:
+        lines.append(f"\t\t{' '.join(combo['types']):<18}\t\t| {combo['weak']} weak\t| worst {combo['worst']:g}x\n")
+
+    return ''.join(lines) + '\n'
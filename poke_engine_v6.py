@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+
+__author__ = 'Shamar D. Brown'
+__version__ = '6.0'
+
+from collections import OrderedDict
+from poke_cache_v6 import CACHE_DIR, cached_tables, cached_combo_index
+from poke_profile_v6 import profiler
+from poke_batch_v6 import TEAM_SIZE, parse_member, build_batch_tables, evaluate_chunk
+from poke_session_v6 import TeamSession
+from poke_types_v6 import DEFAULT_CHART, load_chart
+
+'''
+DESCRIPTION:
+    - importable coverage engine; what poke_coverage_v6.py sets up at import, held by one object
+    - the setup tables are loaded once (cached_tables()); no input file is read & nothing is printed
+    - score(): batch rows for any number of teams in one vectorized pass (evaluate_chunk())
+    - analyse(): the per-member records poke_coverage renders, plus the team record & the team's batch row
+    - results are kept in an LRU cache keyed by the normalized team; member order & type order don't change a
+      team's score, so score() rows for ['fire', 'water grass'] & ['grass water', 'fire'] share one entry
+    - analyse() entries are keyed by member order: its member records are numbered by position on the team
+
+    engine = CoverageEngine('gen6', optimal=True)
+    engine.score([['fighting steel', 'dragon'], ['fire', 'water']])   # -> [batch row, ]
+    engine.analyse(['fighting steel', 'dragon'])                         # -> {'members', 'team', 'score'}
+
+FUNCTIONS:
+from poke_engine_v6 import CoverageEngine, LRUCache, normalize_team, team_key
+'''
+
+
+########################################################################################################################
+#                                              C O N S T A N T S                                                       #
+########################################################################################################################
+
+# results kept by the engine's LRU cache
+ENGINE_CACHE_SIZE = 4096
+
+
+########################################################################################################################
+#                                                      CLASSES                                                         #
+########################################################################################################################
+
+
+# Create the LRUCache object; least recently used entries are dropped past 'size'
+class LRUCache:
+
+    # initialize cache attributes
+    def __init__(self, size=ENGINE_CACHE_SIZE, name='engine'):
+
+        """ :param size:  entries kept
+            :param name:  profiler cache name (hit rates under --profile)"""
+
+        self.size = size
+        self.name = name
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # Get the entry for 'key' (None if missing); a hit becomes the most recently used entry
+    def get(self, key):
+
+        """ :param key:  hashable key"""
+
+        value = self.entries.get(key)
+        profiler.hit(self.name, value is not None)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+
+        return value
+
+    # Store 'value' under 'key'; drops the least recently used entry when full
+    def put(self, key, value):
+
+        """ :param   key:  hashable key
+            :param value:  any value except None"""
+
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    # Cache statistics; {'size', 'entries', 'hits', 'misses', 'hit_rate'}
+    def stats(self):
+
+        lookups = self.hits + self.misses
+        return {'size': self.size, 'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None}
+
+
+# Create the CoverageEngine object; one chart's setup tables & every query against them
+class CoverageEngine:
+
+    # initialize engine attributes
+    def __init__(self, chart=DEFAULT_CHART, optimal=False, top=3, usage=None, species=None, defense=False,
+                 atlas=True, cache_size=ENGINE_CACHE_SIZE, cache_dir=CACHE_DIR):
+
+        """ :param      chart:  'chart name' or 'path_to_chart.json'
+            :param    optimal:  True = members get the exact best move sets (--optimal)
+            :param        top:  number of move sets kept by 'optimal'
+            :param      usage:  'path_to_usage_file' (counts in % of usage; --usage)
+            :param    species:  'path_to_species_file' for 'usage'
+            :param    defense:  True = scores & analyses include the team defense columns/record
+            :param      atlas:  True = members are looked up in the coverage atlas when one is built
+            :param cache_size:  results kept by the LRU cache
+            :param  cache_dir:  'path_to_cache_directory'"""
+
+        chart = load_chart(chart)
+        self.chart = chart['chart']
+        self.all_types, self.all_swri = chart['all_types'], chart['all_swri']
+        all_types, all_swri, unused_combos = self.all_types, self.all_swri, chart['unused_combos']
+
+        with profiler.stage('setup'):
+            self.tables = cached_tables(all_types, all_swri, unused_combos, cache_dir)
+            self.all_combos = self.tables['all_combos']
+            self.all_index = cached_combo_index(self.tables, all_types)
+            self.batch_tables = build_batch_tables(all_types, all_swri, self.all_combos)
+
+        # optional tables; the same ones poke_coverage builds for its flags
+        self.defense_tables = None
+        if defense:
+            from poke_defense_v6 import build_defense_tables
+            self.defense_tables = self.batch_tables['defense'] = build_defense_tables(all_types, all_swri,
+                                                                                      self.all_combos)
+        hit_bitsets = [self.all_index.bitsets['weak'][t] for t in all_types] if optimal else None
+        if usage:
+            from poke_usage_v6 import read_usage_file, build_usage_index
+            weights = read_usage_file(usage, self.all_combos, species)['weights']
+            self.batch_tables['usage'] = weights
+            usage_index = build_usage_index(all_types, all_swri, self.all_combos, weights)
+            self.session = TeamSession(all_types, all_swri, usage_index.type_counts(all_types), usage_index,
+                                       hit_bitsets, top)
+        else:
+            all_atlas = None
+            if atlas:
+                from poke_atlas_v6 import ATLAS_TOP, load_atlas
+                all_atlas = load_atlas(all_types, all_swri, unused_combos, max(top, ATLAS_TOP), cache_dir)
+            self.session = TeamSession(all_types, all_swri, self.tables['all_type_counts'], self.all_index,
+                                       hit_bitsets, top, all_atlas)
+
+        self.cache = LRUCache(cache_size)
+
+    # Score teams in one vectorized pass; one batch row per team (cached rows are reused)
+    def score(self, teams):
+
+        """ :param teams:  [['type1 type2' or ['type1', 'type2' or None], ], ]
+
+            :return: [batch row, ] in 'teams' order; rows with an 'error' did not score"""
+
+        teams = [normalize_team(team) for team in teams]
+        rows, missing = [None] * len(teams), {}
+        for position, team in enumerate(teams):
+            key = ('score', team_key(team))
+            cached = self.cache.get(key)
+            if cached is not None:
+                rows[position] = cached
+            else:
+                missing.setdefault(key, []).append(position)
+
+        # each distinct new team is scored once
+        if missing:
+            chunk = [(key, teams[positions[0]]) for key, positions in missing.items()]
+            with profiler.stage('score'):
+                scored = evaluate_chunk(chunk, self.batch_tables)
+            for row in scored:
+                key = row.pop('id')
+                self.cache.put(key, row)
+                for position in missing[key]:
+                    rows[position] = row
+
+        return [dict(row, team=[[t for t in member if t] for member in team]) for row, team in zip(rows, teams)]
+
+    # Analyse one team; {'members': [member_record()], 'team': team_record(), 'score': batch row,
+    # 'defense': defense_report() (defense only); cached per member order, since members are numbered in that order
+    def analyse(self, team, row=None):
+
+        """ :param team:  ['type1 type2' or ['type1', 'type2' or None], ]
+            :param  row:  score() row for the team (None = scored here)
+
+            raises ValueError for a type the chart doesn't know or more than TEAM_SIZE members"""
+
+        team = normalize_team(team)
+        key = ('analyse', team)
+        result = self.cache.get(key)
+        if result is not None:
+            return result
+
+        if len(team) > TEAM_SIZE:
+            raise ValueError(f'more than {TEAM_SIZE} members')
+        with profiler.stage('analyse'):
+            self.session.set_team([list(member) for member in team])
+            result = {'record': 'analysis', 'chart': self.chart,
+                      'members': [self.session.member(slot) for slot in range(len(team))],
+                      'team': self.session.team(), 'score': row or self.score([team])[0]}
+            if self.defense_tables is not None:
+                from poke_defense_v6 import defense_report
+                result['defense'] = defense_report(self.defense_tables, [list(member) for member in team])
+        self.cache.put(key, result)
+
+        return result
+
+    # Engine statistics; {'chart', 'combos', 'atlas', 'cache'}
+    def stats(self):
+
+        return {'chart': self.chart, 'combos': len(self.all_combos), 'atlas': self.session.atlas is not None,
+                'cache': self.cache.stats()}
+
+
+########################################################################################################################
+#                                                    FUNCTIONS                                                         #
+########################################################################################################################
+
+# Normalize a team to ((type1, type2 or None), ): lower case, 'fire/grass' & ['fire', 'grass'] alike, empties dropped
+def normalize_team(team):
+
+    """ :param team:  ['type1 type2' or ['type1', 'type2' or None], ]
+
+        raises ValueError for anything else (a query body is untrusted)"""
+
+    if isinstance(team, str):
+        team = team.split(',')
+    if not isinstance(team, (list, tuple)):
+        raise ValueError(f'a team is a list of members, not {type(team).__name__}')
+
+    # parse_member() rejects bad members
+    members = (parse_member(member) for member in team if member)
+
+    return tuple(tuple(member) for member in members if member[0])
+
+
+# Cache key of a normalized team; the same for any member order & any type order within a member
+def team_key(team):
+
+    """ :param team:  normalize_team()"""
+
+    return tuple(sorted(tuple(sorted(t for t in member if t)) for member in team))
@@ -4,55 +4,79 @@ __author__ = 'Shamar D. Brown'
 __version__ = '6.0'
 
 import sys
+from poke_chart_v6 import compile_type_chart, combo_bitsets, bits_to_items
+from poke_profile_v6 import profiler
 
 '''
 DESCRIPTION:
     - functions for "poke_coverage" script
 
 FUNCTIONS:
-from poke_functions_v6 import (Pkmn, import_poke_input_file, generate_type_combos, generate_pkmn_stats,
-                                 generate_combo_dicts, combo_print, type_counts, coverage_calcs, get_combo_difference,
-                                 get_coverage, join_coverage, print_coverage)
+from poke_functions_v6 import (TEAM_SIZE, Pkmn, import_poke_input_file, parse_pkmn_line, parse_move_pool,
+                                 generate_type_combos, generate_pkmn_stats, masks_to_stats, generate_combo_dicts,
+                                 combo_print, type_counts, combo_counts, coverage_calcs, get_combo_difference,
+                                 coverage_types, get_coverage, join_coverage, format_pkmn, format_coverage,
+                                 print_coverage)
 '''
 
 
+########################################################################################################################
+#                                              C O N S T A N T S                                                       #
+########################################################################################################################
+
+# members per team
+TEAM_SIZE = 6
+
+
 ########################################################################################################################
 #                                                      CLASSES                                                         #
 ########################################################################################################################
 
 
-# Create the Pkmn object
+# Create the Pkmn object; one shared, read-only instance per type combination (('fire', 'grass') == ('grass', 'fire'))
 class Pkmn:
 
-    # initialize pkmn attributes
-    def __init__(self, all_types, pkmn_types, all_swri):
+    __slots__ = ('types', 'masks', 'strength', 'weakness', 'resisted', 'immune', 'uncovered')
+
+    # return the cached 'pkmn' for this combo; a new one is only built the first time a combo is seen
+    def __new__(cls, all_types, pkmn_types, all_swri):
 
         """ :param  all_types:  ['all pkmn types', ]
             :param pkmn_types:  ['self.pkmn's types', ]
             :param   all_swri:  [all_strengths, all_weaknesses, all_resistances, all_immunities]"""
 
-        self.types = pkmn_types
-        self.strength, self.weakness, self.resisted, self.immune = (
-            generate_pkmn_stats(all_types, self.types, all_swri))
-        self.uncovered = sorted([t for t in all_types if t not in self.strength], key=lambda t: all_types.index(t))
+        chart = compile_type_chart(all_types, all_swri)
+        key = chart.normalize(pkmn_types)
+        this_pkmn = chart.pkmn.get(key)
+        if profiler.enabled:
+            profiler.hit('pkmn', this_pkmn is not None)
+        if this_pkmn is not None:
+            return this_pkmn
+
+        # attributes are set once, here; __setattr__ blocks later changes to the shared instance
+        this_pkmn = object.__new__(cls)
+        masks = chart.combo_masks(key)
+        stats = (key, masks, *(tuple(stat) for stat in masks_to_stats(chart, masks)),
+                 tuple(chart.names(chart.all_mask & ~masks[0])))
+        for name, value in zip(cls.__slots__, stats):
+            object.__setattr__(this_pkmn, name, value)
+        chart.pkmn[key] = this_pkmn
+        profiler.count('objects.Pkmn')
+
+        return this_pkmn
+
+    # shared instances are read-only
+    def __setattr__(self, name, value):
+        raise AttributeError(f"'Pkmn' attributes are read-only ({name})")
 
     # print 'pkmn' attributes
-    def print_pkmn(self, count):
+    def print_pkmn(self, count, pkmn_types=None):
 
-        """ :param count:  used label team members"""
+        """ :param      count:  used label team members
+            :param pkmn_types:  ['types', ] in the order to label them (default: self.types)"""
 
-        # setup name
-        name = f'{self.types[0]} {self.types[1]}' if self.types[1] else f'{self.types[0]}'
-        name = f' P K M N {count} :  {name} '
-        dash = '-' * len(name)
-
-        # Print pkmn data
-        print(f'\n{dash}\n{name}\t\n{dash}')
-        print(f'\tstrengths:\t\t\t{len(self.strength)}\t| {self.strength}')
-        print(f'\tuncovered:\t\t\t{len(self.uncovered)}\t| {self.uncovered}')
-        print(f'\tweaknesses:\t\t\t{len(self.weakness)}\t| {self.weakness}')
-        print(f'\tresistances:\t\t{len(self.resisted)}\t| {self.resisted}')
-        print(f'\timmunities:\t\t\t{len(self.immune)}\t| {self.immune}\n')
+        print(format_pkmn(count, pkmn_types or self.types, self.strength, self.uncovered, self.weakness, self.resisted,
+                          self.immune), end='')
 
         return count + 1
 
@@ -61,12 +85,14 @@ class Pkmn:
 #                                                    FUNCTIONS                                                         #
 ########################################################################################################################
 
-# read lines from txt file into a [list]
-def import_poke_input_file(filename):
+# read lines from txt file into a [list]; blank lines are skipped
+def import_poke_input_file(filename, move_pools=False):
 
-    """ :param filename:  'path_to_input_file' """
+    """ :param   filename:  'path_to_input_file'
+        :param move_pools:  True = also return each member's move pool; ([[type1, type2]], [pool or None])"""
 
     txt_file_data = []
+    txt_file_pools = []
     try:
         txt_file = open(filename, 'r', encoding='utf-8-sig')
     except FileNotFoundError as fnf_error:
@@ -76,13 +102,36 @@ def import_poke_input_file(filename):
         for line in txt_file:
             if line.startswith('-'):
                 break
+            elif not line.split(':')[0].strip():
+                continue
             else:
-                data = line.rstrip('\n')
-                data = data.split() if len(data) > 8 else [data.strip(), None]
-                txt_file_data.append(data)
+                txt_file_data.append(parse_pkmn_line(line))
+                txt_file_pools.append(parse_move_pool(line))
         txt_file.close()
 
-    return txt_file_data
+    return (txt_file_data, txt_file_pools) if move_pools else txt_file_data
+
+
+# read one input line ('type1 type2' or 'type1', optionally ': move pool') into ['type1', 'type2' or None]
+def parse_pkmn_line(line):
+
+    """ :param line:  'type1 type2' or 'type1' (anything after ':' is the move pool; parse_move_pool())"""
+
+    line = line.split(':')[0]
+    data = line.split()
+
+    return data[:2] if len(data) > 1 else [line.strip(), None]
+
+
+# read the move pool of one input line ('fire grass : water ground rock') into ['legal move types', ] or None
+def parse_move_pool(line):
+
+    """ :param line:  'type1 type2 : move type, move type ...' (no ':' = any type is legal)"""
+
+    if ':' not in line:
+        return None
+
+    return list(dict.fromkeys(line.split(':', 1)[1].replace(',', ' ').lower().split()))
 
 
 # Generate a list of all usable type combos
@@ -123,30 +172,23 @@ def generate_pkmn_stats(all_types, pkmn_types, all_swri):
         :param   all_swri:  [{(combo, ): ['strengths', ]}, {(combo, ): ['weakness', ]},
                              {(combo, ): ['resisted', ]}, {(combo, ): ['immune', ]}]"""
 
-    # extract 'swri' dictionaries
-    strengths, weaknesses, resistances, immunities = all_swri
+    # compiled (cached) bitset chart; weaknesses/resistances cancelled by immunities or each other are masked out
+    chart = compile_type_chart(all_types, all_swri)
+
+    return masks_to_stats(chart, chart.combo_masks(pkmn_types))
 
-    # generate type-interaction lists
-    weak = generate_type_list(pkmn_types, weaknesses)
-    resist = generate_type_list(pkmn_types, resistances)
-    strength = generate_type_list(pkmn_types, strengths)
-    immune = generate_type_list(pkmn_types, immunities)
 
-    # sort lists
-    strength = sorted(set(strength), key=lambda t: all_types.index(t))
-    immune = sorted(immune, key=lambda t: all_types.index(t))
+# Convert TypeChart.combo_masks() back to the [strength, weakness, resisted, immune] lists used for printing
+def masks_to_stats(chart, masks):
 
-    # filter lists
-    weaknessss = [pkmn_type for pkmn_type in weak if pkmn_type not in immune]       # Remove immunities
-    weaknesss = [pkmn_type for pkmn_type in weaknessss if pkmn_type not in resist]  # filter resistances
-    resisteddd = [pkmn_type for pkmn_type in resist if pkmn_type not in immune]     # Remove immunities
-    resistedd = [pkmn_type for pkmn_type in resisteddd if pkmn_type not in weak]    # filter weaknesses
+    """ :param chart:  compiled TypeChart
+        :param masks:  (strength, weak, weak_x2, resisted, resisted_x2, immune, immune_x2)"""
 
-    # sort lists
-    weakness = sorted(weaknesss, key=lambda t: all_types.index(t))
-    resisted = sorted(resistedd, key=lambda t: all_types.index(t))
+    strength, weak, weak_x2, resisted, resisted_x2, immune, immune_x2 = masks
 
-    return [strength, weakness, resisted, immune]
+    # types hit by both halves of the combo (4x / 0.25x) are listed twice, as in the original type lists
+    return [chart.names(strength), chart.counted_names(weak, weak_x2), chart.counted_names(resisted, resisted_x2),
+            chart.counted_names(immune, immune_x2)]
 
 
 # Generate Dictionaries using Static Dictionaries; {type combo: [static dictionary calc]}
@@ -189,19 +231,10 @@ def type_counts(pkmn_types, combo_swri):
     # Extract the dictionaries from [combo_swri]
     combo_strengths, combo_weakness, combo_resisted, combo_immune = combo_swri
 
-    # generate the occurrences in weak_counts
-    weak_counts = {t: {'count': len([combo for combo, weak in combo_weakness.items() if t in weak]),
-                       'combos': [combo for combo, weak in combo_weakness.items() if t in weak]} for t in pkmn_types}
-
-    # generate the occurrences in resist_counts
-    resist_counts = {t: {'count': len([combo for combo, resist in combo_resisted.items() if t in resist]),
-                         'combos': [combo for combo, resist in combo_resisted.items() if t in resist]}
-                     for t in pkmn_types}
-
-    # generate the occurrences in immune_counts
-    immune_counts = {t: {'count': len([combo for combo, immune in combo_immune.items() if t in immune]),
-                         'combos': [combo for combo, immune in combo_immune.items() if t in immune]}
-                     for t in pkmn_types}
+    # generate the occurrences in weak/resist/immune counts; one bitset over the combos per type
+    weak_counts = combo_counts(pkmn_types, combo_weakness)
+    resist_counts = combo_counts(pkmn_types, combo_resisted)
+    immune_counts = combo_counts(pkmn_types, combo_immune)
 
     # Sort the occurrences dictionary by count in descending order
     sorted_weak_counts = dict(sorted(weak_counts.items(), key=lambda item: item[1]['count'], reverse=True))
@@ -211,6 +244,20 @@ def type_counts(pkmn_types, combo_swri):
     return [sorted_weak_counts, sorted_resist_counts, sorted_immune_counts]
 
 
+# Generate dictionary: counts = {type: {'count': int(), 'combos': [combos]}} for one 'combo_swri' dictionary
+def combo_counts(pkmn_types, combo_dict):
+
+    """ :param pkmn_types:  ['attacking pkmn type1', 'type2' or None]
+        :param combo_dict:  {(type_combo): [types effected by type_combo], }"""
+
+    # bit i of bitsets['type'] is set when the i-th combo lists 'type'
+    combos = list(combo_dict)
+    bitsets = combo_bitsets(combo_dict)
+
+    return {t: {'count': bitsets.get(t, 0).bit_count(), 'combos': bits_to_items(combos, bitsets.get(t, 0))}
+            for t in pkmn_types}
+
+
 # Get list of [(type_combos,) that 'pkmn' does not (2 * damage) to]
 def get_combo_difference(atk_types, type_combos, weak_counts):
 
@@ -243,6 +290,23 @@ def get_combo_difference(atk_types, type_combos, weak_counts):
     return set(type_combos) - set(remove_these_combos)
 
 
+# Rank 'pkmn_types' by weaknesses (then resistances, then immunities, if tie); returns the top 4 (None dropped)
+def coverage_types(pkmn_types, type_counts):
+
+    """ :param  pkmn_types:  ['attacking pkmn's types', ]; sorted in place
+        :param type_counts:  {'pkmn_type': {'count': int(), 'combos': [[type combos], ]}"""
+
+    # extract type counts dictionaries [{weak_counts}, {resist_counts}, {immune_counts}]
+    weak_counts, resist_counts, immune_counts = type_counts
+
+    # Sorting the types based on the amount of weaknesses (then resistances, then immunities, if tie)
+    pkmn_types.sort(key=lambda count: immune_counts[count].get("count") if count in immune_counts else 0, reverse=True)
+    pkmn_types.sort(key=lambda count: resist_counts[count].get("count") if count in resist_counts else 0, reverse=True)
+    pkmn_types.sort(key=lambda count: weak_counts[count].get("count") if count in weak_counts else 0, reverse=True)
+
+    return [t for t in pkmn_types[:4] if t is not None]
+
+
 # generate data for coverage chart
 def get_coverage(pkmn_types, type_counts):
 
@@ -255,28 +319,19 @@ def get_coverage(pkmn_types, type_counts):
     # empty lists needed for print_coverage()
     types_header, effectiveness_lst = [], []
 
-    # Sorting the types based on the amount of weaknesses (then resistances, then immunities, if tie)
-    pkmn_types.sort(key=lambda count: immune_counts[count].get("count") if count in immune_counts else 0, reverse=True)
-    pkmn_types.sort(key=lambda count: resist_counts[count].get("count") if count in resist_counts else 0, reverse=True)
-    pkmn_types.sort(key=lambda count: weak_counts[count].get("count") if count in weak_counts else 0, reverse=True)
-
     # get the top 4 coverage options
-    for t in pkmn_types[:4]:
+    for t in coverage_types(pkmn_types, type_counts):
 
         # 'this_pkmn.type = str(t)' for coverage table header
-        if t is not None:
-            types_header.append(str(t))
-
-            # get data for type effectiveness
-            weak = f'{(weak_counts[t].get("count") if t in weak_counts else None)} weak to'
-            resist = f'{(resist_counts[t].get("count") if t in resist_counts else None)} resists'
-            immune = f'{(immune_counts[t].get("count") if t in immune_counts else None)} immune'
+        types_header.append(str(t))
 
-            # append type effectiveness data to [a_lst]
-            a_lst = [weak, resist, immune]
+        # get data for type effectiveness
+        weak = f'{(weak_counts[t].get("count") if t in weak_counts else None)} weak to'
+        resist = f'{(resist_counts[t].get("count") if t in resist_counts else None)} resists'
+        immune = f'{(immune_counts[t].get("count") if t in immune_counts else None)} immune'
 
-            # append type effectiveness data = [effectiveness_lst] for use in print_coverage()
-            effectiveness_lst.append(a_lst)
+        # append type effectiveness data = [effectiveness_lst] for use in print_coverage()
+        effectiveness_lst.append([weak, resist, immune])
 
     # return lists [[coverage table header], [" " data]]
     return [types_header, effectiveness_lst]
@@ -300,30 +355,57 @@ def join_coverage(stab_coverage, coverage_options):
     return [new_header, new_effectiveness]
 
 
-# print coverage options in tabular format
-def print_coverage(coverage):
+# Format 'pkmn' attributes as a text block; the print_pkmn() layout
+def format_pkmn(count, pkmn_types, strength, uncovered, weakness, resisted, immune):
+
+    """ :param      count:  used label team members
+        :param pkmn_types:  ['type1', 'type2' or None]
+        :param   strength:  ['types', ] ... one list per attribute"""
+
+    # setup name
+    name = f'{pkmn_types[0]} {pkmn_types[1]}' if pkmn_types[1:] and pkmn_types[1] else f'{pkmn_types[0]}'
+    name = f' P K M N {count} :  {name} '
+    dash = '-' * len(name)
+
+    # pkmn data
+    return (f'\n{dash}\n{name}\t\n{dash}\n'
+            f'\tstrengths:\t\t\t{len(strength)}\t| {list(strength)}\n'
+            f'\tuncovered:\t\t\t{len(uncovered)}\t| {list(uncovered)}\n'
+            f'\tweaknesses:\t\t\t{len(weakness)}\t| {list(weakness)}\n'
+            f'\tresistances:\t\t{len(resisted)}\t| {list(resisted)}\n'
+            f'\timmunities:\t\t\t{len(immune)}\t| {list(immune)}\n\n')
+
+
+# Format coverage options as a text table; the print_coverage() layout
+def format_coverage(coverage):
 
     """ :param coverage:  [[coverage table header], [[effectiveness data], ]]"""
 
     # extract lists from coverage
     types_header, effectiveness_lst = coverage
 
-    # print the table header
+    # the table header
     titles = ['STAB Damage ', 'Coverage Options ']
     title_row = ' |'.join(f'{column:<30}' if len(types_header) > 5 else f'{column:<15}' for column in titles)
     header_row = '|'.join(f'{column:<15}' for column in types_header)
-    print(f'\tC O V E R A G E :\t\t|  {title_row}')
-    print(f'\t\t\t\t\t\t\t|  {header_row}')
-    print('\t\t\t\t\t\t\t| ', '-' * len(header_row))
+    lines = [f'\tC O V E R A G E :\t\t|  {title_row}\n', f'\t\t\t\t\t\t\t|  {header_row}\n',
+             f'\t\t\t\t\t\t\t|  {"-" * len(header_row)}\n']
 
-    # transpose the effectiveness_lst
-    transposed_effectiveness_lst = zip(*effectiveness_lst)
-
-    # Print the table data
-    for row in transposed_effectiveness_lst:
+    # the table data; one row per effectiveness (transposed effectiveness_lst)
+    for row in zip(*effectiveness_lst):
         row_str = '|'.join(f'{str(cell):<15}' for cell in row)
-        print('\t\t\t\t\t\t\t| ', row_str)
-    print('\t\t\t\t\t\t\t| ', '-' * len(header_row), '\n\n')
+        lines.append(f'\t\t\t\t\t\t\t|  {row_str}\n')
+    lines.append(f'\t\t\t\t\t\t\t|  {"-" * len(header_row)} \n\n\n')
+
+    return ''.join(lines)
+
+
+# print coverage options in tabular format
+def print_coverage(coverage):
+
+    """ :param coverage:  [[coverage table header], [[effectiveness data], ]]"""
+
+    print(format_coverage(coverage), end='')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+__author__ = 'Shamar D. Brown'
+__version__ = '6.0'
+
+from poke_chart_v6 import compile_type_chart, bits_to_items
+
+'''
+DESCRIPTION:
+    - inverted index for "poke_coverage": attacking type -> bitset of the combos it is super-effective against,
+      resisted by, or has no effect on
+    - bit i of every bitset is type_combos[i]; any subset of combos is one int()
+    - counts restricted to a subset are (bitset & subset).bit_count(); nothing is rebuilt per team member
+
+FUNCTIONS:
+from poke_index_v6 import ComboIndex, build_combo_index
+'''
+
+
+########################################################################################################################
+#                                                      CLASSES                                                         #
+########################################################################################################################
+
+
+# Create the ComboIndex object
+class ComboIndex:
+
+    # initialize index attributes
+    def __init__(self, all_types, type_combos, weak, resisted, immune):
+
+        """ :param   all_types:  ['all pkmn types', ]
+            :param type_combos:  [[type combos], ['type_1','type_2' or None], ]
+            :param        weak:  [int(bitset of combos weak to the type) per type in all_types]
+            :param    resisted:  [int(bitset of combos that resist the type) per type in all_types]
+            :param      immune:  [int(bitset of combos immune to the type) per type in all_types]"""
+
+        self.types = list(all_types)
+        self.combos = [tuple(combo) for combo in type_combos]
+        self.position = {combo: bit for bit, combo in enumerate(self.combos)}
+        self.all = (1 << len(self.combos)) - 1
+
+        # {'weak' | 'resist' | 'immune': {'atk_type': int(bitset)}}
+        self.bitsets = {'weak': dict(zip(self.types, weak)), 'resist': dict(zip(self.types, resisted)),
+                        'immune': dict(zip(self.types, immune))}
+
+    # convert [combos] to an int() bitset
+    def subset(self, combos):
+
+        """ :param combos:  [(type combos), ]"""
+
+        bitset = 0
+        for combo in combos:
+            bitset |= 1 << self.position[tuple(combo)]
+
+        return bitset
+
+    # convert an int() bitset to [(type combos), ] in index order
+    def combos_of(self, bitset):
+
+        """ :param bitset:  int() bitset over self.combos"""
+
+        return bits_to_items(self.combos, bitset)
+
+    # count the combos in 'subset' that 'kind' applies to for 'atk_type'
+    def count(self, atk_type, kind='weak', subset=None):
+
+        """ :param atk_type:  'attacking type'
+            :param     kind:  'weak', 'resist' or 'immune'
+            :param   subset:  int() bitset (None = every combo)"""
+
+        bitset = self.bitsets[kind].get(atk_type, 0)
+        return (bitset if subset is None else bitset & subset).bit_count()
+
+    # Get the bitset of combos in 'subset' that none of 'atk_types' does (2*damage) to; mirrors get_combo_difference()
+    def combo_difference(self, atk_types, subset=None):
+
+        """ :param atk_types:  ['attacking types', ]
+            :param    subset:  int() bitset (None = every combo)"""
+
+        remaining = self.all if subset is None else subset
+        for t in atk_types:
+            remaining &= ~self.bitsets['weak'].get(t, 0)
+
+        return remaining
+
+    # Generate [{weak_counts}, {resist_counts}, {immune_counts}] restricted to 'subset'; same layout as type_counts()
+    def type_counts(self, pkmn_types, subset=None):
+
+        """ :param pkmn_types:  ['attacking pkmn types', ]
+            :param     subset:  int() bitset (None = every combo)
+
+            'combos' lists are in index order"""
+
+        subset = self.all if subset is None else subset
+        all_counts = []
+        for kind in ('weak', 'resist', 'immune'):
+            counts = {}
+            for t in pkmn_types:
+                bitset = self.bitsets[kind].get(t, 0) & subset
+                counts[t] = {'count': bitset.bit_count(), 'combos': self.combos_of(bitset)}
+            all_counts.append(dict(sorted(counts.items(), key=lambda item: item[1]['count'], reverse=True)))
+
+        return all_counts
+
+
+########################################################################################################################
+#                                                    FUNCTIONS                                                         #
+########################################################################################################################
+
+# Build the index from the static dictionaries
+def build_combo_index(all_types, type_combos, all_swri):
+
+    """ :param   all_types:  ['all pkmn types', ]
+        :param type_combos:  [[type combos], ['type_1','type_2' or None], ]
+        :param    all_swri:  [all_strengths, all_weaknesses, all_resistances, all_immunities]"""
+
+    chart = compile_type_chart(all_types, all_swri)
+    weak, resisted, immune = [0] * len(all_types), [0] * len(all_types), [0] * len(all_types)
+
+    # scatter each combo's weak/resisted/immune type masks into the per-type bitsets
+    for bit, combo in enumerate(type_combos):
+        masks = chart.combo_masks(combo)
+        for bitsets, mask in ((weak, masks[1]), (resisted, masks[3]), (immune, masks[5])):
+            while mask:
+                low = mask & -mask
+                bitsets[low.bit_length() - 1] |= 1 << bit
+                mask ^= low
+
+    return ComboIndex(all_types, type_combos, weak, resisted, immune)
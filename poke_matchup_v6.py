@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+
+__author__ = 'Shamar D. Brown'
+__version__ = '6.0'
+
+import os
+import sys
+import time
+from multiprocessing import Pool
+import numpy as np
+from poke_functions_v6 import Pkmn
+from poke_batch_v6 import read_teams, encode_teams, write_rows
+
+'''
+DESCRIPTION:
+    - team-vs-team matchups for "poke_coverage": every team in a pool against every other team
+    - a member's moves are its STAB types ('stab'), or its best 4-type move set ('coverage', optimal_movesets())
+    - hits[A, B] = (member of A, member of B) pairs where A's member hits B's member super-effectively (0-36)
+    - net[A, B]  = hits[A, B] - hits[B, A]; > 0 = A has the better matchup
+    - every possible member is one of (n + 1) * n + 1 "pairs"; per pair, Pkmn() gives its weaknesses & the move
+      table says what it hits, so pair-vs-pair is one matrix P; teams are [team, 6] pair indexes
+    - a block of the N x N result is one product: counts[A block] @ P @ counts[B block].T (counts = members per pair)
+    - blocks of rows are shared over a process pool; each writes straight into a memory-mapped .npy file,
+      so memory stays at a few blocks however large N is
+
+FUNCTIONS:
+from poke_matchup_v6 import (build_matchup_tables, encode_pool, pair_counts, matchup_block, matchup_matrix,
+                             rank_pool, run_matchups)
+'''
+
+
+########################################################################################################################
+#                                              C O N S T A N T S                                                       #
+########################################################################################################################
+
+# teams per block side; one block of counts is block x pairs float32
+MATCHUP_BLOCK = 1024
+
+# ranking columns
+MATCHUP_FIELDS = ['rank', 'id', 'team', 'wins', 'losses', 'margin', 'error']
+
+# per-process matchup state; set by _init_matchup_worker()
+_matchup_state = {}
+
+
+########################################################################################################################
+#                                                    FUNCTIONS                                                         #
+########################################################################################################################
+
+# Build the pair tables; {'types', 'index', 'hits': P, 'net': P - P.T}, pair = type1 * (n + 1) + type2 (n = None)
+def build_matchup_tables(all_types, all_swri, moves='stab', hit_bitsets=None):
+
+    """ :param   all_types:  ['all pkmn types', ]
+        :param    all_swri:  [all_strengths, all_weaknesses, all_resistances, all_immunities]
+        :param       moves:  'stab' or 'coverage' (best 4-type move set per member)
+        :param hit_bitsets:  build_hit_bitsets() ('coverage' only)"""
+
+    n = len(all_types)
+    index = {t: i for i, t in enumerate(all_types)}
+    n_pairs = n * (n + 1) + 1
+
+    # [pair, type] flags: the types each member attacks with & the types it is weak to; the last pair is empty
+    attacks = np.zeros((n_pairs, n), dtype=np.float32)
+    weak = np.zeros((n_pairs, n), dtype=np.float32)
+    moveset_of = {}
+    for t1 in all_types:
+        for t2 in all_types + [None]:
+            pair = index[t1] * (n + 1) + (index[t2] if t2 else n)
+            member = [t1, t2 if t2 != t1 else None]
+            this_pkmn = Pkmn(all_types, member, all_swri)
+            weak[pair, [index[t] for t in set(this_pkmn.weakness)]] = 1
+            if moves == 'coverage':
+                key = frozenset(t for t in member if t)
+                if key not in moveset_of:
+                    from poke_search_v6 import optimal_movesets
+                    moveset_of[key] = optimal_movesets(hit_bitsets, all_types, member)[0][1]
+                attacks[pair, [index[t] for t in moveset_of[key]]] = 1
+            else:
+                attacks[pair, [index[t] for t in this_pkmn.types if t]] = 1
+
+    # P[i, j] = 1 when member i hits member j super-effectively with one of its moves
+    hits = (attacks @ weak.T > 0).astype(np.float32)
+
+    return {'types': list(all_types), 'index': index, 'moves': moves, 'n_pairs': n_pairs, 'hits': hits,
+            'net': hits - hits.T}
+
+
+# Encode a pool of teams as [team, member] pair indexes (empty slots & bad teams use the empty pair)
+def encode_pool(tables, teams):
+
+    """ :param tables:  build_matchup_tables()
+        :param  teams:  [[['type1', 'type2' or None], ], ]
+
+        :return: (int16 [team, 6] pair indexes, [error message or None per team])"""
+
+    n = len(tables['types'])
+    encoded, errors = encode_teams(tables, teams)
+    pairs = np.where(encoded[:, :, 0] == n, n * (n + 1), encoded[:, :, 0] * (n + 1) + encoded[:, :, 1])
+
+    return pairs.astype(np.int16), errors
+
+
+# Count each team's members per pair; [team, pair] float32 (rows of a block only)
+def pair_counts(pairs, n_pairs):
+
+    """ :param   pairs:  encode_pool() pair indexes (any rows)
+        :param n_pairs:  build_matchup_tables()['n_pairs']"""
+
+    flat = (np.arange(len(pairs))[:, None] * n_pairs + pairs).ravel()
+
+    return np.bincount(flat, minlength=len(pairs) * n_pairs).reshape(len(pairs), n_pairs).astype(np.float32)
+
+
+# Score rows[a:b] against cols[c:d] of the pool; one block of the N x N matrix
+def matchup_block(tables, row_pairs, col_pairs, kind='net'):
+
+    """ :param     tables:  build_matchup_tables()
+        :param  row_pairs:  encode_pool() pair indexes of the block's rows
+        :param  col_pairs:  encode_pool() pair indexes of the block's columns
+        :param       kind:  'net' (hits[A, B] - hits[B, A]) or 'hits'"""
+
+    n_pairs = tables['n_pairs']
+    block = pair_counts(row_pairs, n_pairs) @ tables[kind] @ pair_counts(col_pairs, n_pairs).T
+
+    return np.rint(block).astype(np.int8 if kind == 'net' else np.uint8)
+
+
+# Fill the N x N matchup matrix block by block; returns (wins, losses, margin) per team
+def matchup_matrix(tables, pairs, out=None, kind='net', block=MATCHUP_BLOCK, processes=1):
+
+    """ :param    tables:  build_matchup_tables()
+        :param     pairs:  encode_pool() pair indexes of the whole pool
+        :param       out:  N x N array, or 'path_to_matrix.npy' (written as a memory-mapped .npy file), or None
+        :param      kind:  'net' or 'hits'
+        :param     block:  teams per block side
+        :param processes:  worker processes (1 = this process)
+
+        wins/losses/margin always come from the net matchups"""
+
+    n_teams = len(pairs)
+    dtype = np.int8 if kind == 'net' else np.uint8
+    path = out if isinstance(out, str) else None
+    if path:
+        np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(n_teams, n_teams)).flush()
+
+    state = {'tables': tables, 'pairs': pairs, 'kind': kind, 'block': block, 'path': path,
+             'keep': out is not None and path is None}
+    starts = range(0, n_teams, block)
+    wins, losses, margin = (np.zeros(n_teams, dtype=np.int64) for _ in range(3))
+
+    if processes == 1:
+        _init_matchup_worker(state)
+        results = map(_matchup_rows, starts)
+        pool = None
+    else:
+        pool = Pool(processes, initializer=_init_matchup_worker, initargs=(state,))
+        results = pool.imap_unordered(_matchup_rows, starts)
+    try:
+        for start, rows, row_stats in results:
+            stop = start + len(row_stats[0])
+            wins[start:stop], losses[start:stop], margin[start:stop] = row_stats
+            if rows is not None:
+                out[start:stop] = rows
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return wins, losses, margin
+
+
+# Rank the pool; most wins first, then the largest margin; [(team position, rank), ] in rank order
+def rank_pool(wins, losses, margin):
+
+    """ :param   wins:  matchup_matrix()[0]
+        :param losses:  matchup_matrix()[1]
+        :param margin:  matchup_matrix()[2]"""
+
+    order = np.lexsort((losses, -margin, -wins))
+
+    return [(int(team), rank) for rank, team in enumerate(order, 1)]
+
+
+# Run a pool: input file ('-' = stdin) -> matchup matrix (optional .npy) -> ranking rows; reports teams/second
+def run_matchups(tables, input_path, output_path='-', matrix_path=None, in_fmt=None, out_fmt='jsonl', kind='net',
+                 block=MATCHUP_BLOCK, processes=1):
+
+    """ :param      tables:  build_matchup_tables()
+        :param  input_path:  'path_to_teams' ('.csv' = CSV, anything else = JSONL) or '-'
+        :param output_path:  'path_to_ranking' or '-'
+        :param matrix_path:  'path_to_matrix.npy' (None = rank only)
+        :param      in_fmt:  'jsonl' or 'csv' (default: from the input file extension)
+        :param     out_fmt:  'jsonl' or 'csv'
+        :param        kind:  'net' or 'hits' (the matrix written to 'matrix_path')
+        :param       block:  teams per block side
+        :param   processes:  worker processes (None = os.cpu_count())"""
+
+    processes = processes or os.cpu_count() or 1
+    in_fmt = in_fmt or ('csv' if input_path.endswith('.csv') else 'jsonl')
+    source = sys.stdin if input_path == '-' else open(input_path, 'r', encoding='utf-8-sig', newline='')
+    try:
+        pool = list(read_teams(source, in_fmt))
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+    start = time.perf_counter()
+    pairs, errors = encode_pool(tables, [team for _, team in pool])
+    wins, losses, margin = matchup_matrix(tables, pairs, matrix_path, kind, block, processes)
+    elapsed = time.perf_counter() - start
+
+    # ranked teams first; teams that could not be encoded (scored as empty teams) are listed last, unranked
+    ranked = [team for team, _ in rank_pool(wins, losses, margin) if not errors[team]]
+    rows = [{'rank': rank, 'id': pool[team][0], 'team': pool[team][1], 'wins': int(wins[team]),
+             'losses': int(losses[team]), 'margin': int(margin[team])} for rank, team in enumerate(ranked, 1)]
+    rows += [{'id': team_id, 'error': error} if isinstance(team, str) else {'id': team_id, 'team': team, 'error': error}
+             for (team_id, team), error in zip(pool, errors) if error]
+    target = sys.stdout if output_path == '-' else open(output_path, 'w', encoding='utf-8', newline='')
+    try:
+        write_rows(rows, target, out_fmt, fields=MATCHUP_FIELDS)
+    finally:
+        if target is not sys.stdout:
+            target.close()
+
+    print(f'** {len(pool)} teams, {len(pool) ** 2} matchups in {elapsed:.2f}s '
+          f'({len(pool) ** 2 / elapsed if elapsed else 0:.0f} matchups/s)', file=sys.stderr)
+
+    return len(pool)
+
+
+# Set the per-process matchup state; a memory-mapped output is opened once per process
+def _init_matchup_worker(state):
+
+    """ :param state:  {'tables', 'pairs', 'kind', 'block', 'path', 'keep'}"""
+
+    _matchup_state.clear()
+    _matchup_state.update(state)
+    if state['path']:
+        _matchup_state['out'] = np.load(state['path'], mmap_mode='r+')
+
+
+# Score the block of rows starting at 'start' against every column block; (start, rows or None, row stats)
+def _matchup_rows(start):
+
+    """ :param start:  first row of the block"""
+
+    tables, pairs, kind, block = (_matchup_state[key] for key in ('tables', 'pairs', 'kind', 'block'))
+    dtype = np.int8 if kind == 'net' else np.uint8
+    row_pairs = pairs[start:start + block]
+    out = _matchup_state.get('out')
+    rows = None
+    if _matchup_state['keep']:
+        rows = np.empty((len(row_pairs), len(pairs)), dtype=dtype)
+    wins, losses, margin = (np.zeros(len(row_pairs), dtype=np.int64) for _ in range(3))
+
+    # counts[A block] @ P once per row block; each column block is then one product with its counts
+    row_counts = pair_counts(row_pairs, tables['n_pairs'])
+    left = {k: row_counts @ tables[k] for k in dict.fromkeys(('net', kind))}
+    for col in range(0, len(pairs), block):
+        col_counts = pair_counts(pairs[col:col + block], tables['n_pairs']).T
+        net = np.rint(left['net'] @ col_counts).astype(np.int8)
+        wins += np.count_nonzero(net > 0, axis=1)
+        losses += np.count_nonzero(net < 0, axis=1)
+        margin += net.sum(axis=1, dtype=np.int64)
+        cells = net if kind == 'net' else np.rint(left[kind] @ col_counts).astype(dtype)
+        if out is not None:
+            out[start:start + len(row_pairs), col:col + len(col_counts[0])] = cells
+        elif rows is not None:
+            rows[:, col:col + len(col_counts[0])] = cells
+    if out is not None:
+        out.flush()
+
+    return start, rows, (wins, losses, margin)
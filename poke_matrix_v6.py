@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+__author__ = 'Shamar D. Brown'
+__version__ = '6.0'
+
+import numpy as np
+
+'''
+DESCRIPTION:
+    - NumPy effectiveness matrices for "poke_coverage"
+    - type matrix:  18 x 18 attack-vs-defense damage multipliers (0, 0.5, 1, 2)
+    - combo matrix: 18 x N attack-vs-combo multipliers (0, 0.25, 0.5, 1, 2, 4); one broadcasted product
+    - the batch, defense, usage & cache modules threshold these matrices (SUPER_EFFECTIVE, NEUTRAL)
+
+FUNCTIONS:
+from poke_matrix_v6 import build_type_matrix, build_combo_matrix
+'''
+
+
+########################################################################################################################
+#                                              C O N S T A N T S                                                       #
+########################################################################################################################
+
+# damage thresholds; below NEUTRAL (& above 0) is resisted
+SUPER_EFFECTIVE = 2.0
+NEUTRAL = 1.0
+
+# set bits per byte; used to popcount packed hit rows
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+########################################################################################################################
+#                                                    FUNCTIONS                                                         #
+########################################################################################################################
+
+# Build the [attacking type, defending type] multiplier matrix from the static dictionaries
+def build_type_matrix(all_types, all_swri):
+
+    """ :param all_types:  ['all pkmn types', ]
+        :param  all_swri:  [all_strengths, all_weaknesses, all_resistances, all_immunities]"""
+
+    strengths, weaknesses, resistances, immunities = all_swri
+    index = {t: i for i, t in enumerate(all_types)}
+    type_matrix = np.ones((len(all_types), len(all_types)), dtype=np.float32)
+
+    # offensive dictionary: {atk_type: [defending types]}
+    for atk_type, def_types in strengths.items():
+        for def_type in def_types:
+            type_matrix[index[atk_type], index[def_type]] = 2.0
+
+    # defensive dictionaries: {def_type: [attacking types]}; immunities are applied last
+    for type_dict, multiplier in ((weaknesses, 2.0), (resistances, 0.5), (immunities, 0.0)):
+        for def_type, atk_types in type_dict.items():
+            for atk_type in atk_types:
+                type_matrix[index[atk_type], index[def_type]] = multiplier
+
+    return type_matrix
+
+
+# Build the [attacking type, type combo] multiplier matrix; one broadcasted product over both halves of every combo
+def build_combo_matrix(type_matrix, all_types, type_combos):
+
+    """ :param   type_matrix:  build_type_matrix()
+        :param     all_types:  ['all pkmn types', ]
+        :param   type_combos:  [[type combos], ['type_1','type_2' or None], ]"""
+
+    # a trailing column of 1.0 stands in for a missing second type (None)
+    index = {t: i for i, t in enumerate(all_types)}
+    index[None] = len(all_types)
+    padded = np.hstack([type_matrix, np.ones((len(all_types), 1), dtype=type_matrix.dtype)])
+
+    first = np.fromiter((index[combo[0]] for combo in type_combos), dtype=np.intp, count=len(type_combos))
+    second = np.fromiter((index[combo[1]] for combo in type_combos), dtype=np.intp, count=len(type_combos))
+
+    return padded[:, first] * padded[:, second]
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+
+__author__ = 'Shamar D. Brown'
+__version__ = '6.0'
+
+from itertools import combinations
+from poke_profile_v6 import profiler
+from poke_search_v6 import optimal_movesets
+
+'''
+DESCRIPTION:
+    - move-pool-constrained coverage for "poke_coverage": each member may only use the move types it can learn
+    - input lines take an optional pool after ':'  (fire grass : water ground rock electric); no ':' = any type
+    - STAB types are always legal & always fill their own slots; the pool limits the coverage slots
+    - per member: the k best legal move sets (optimal_movesets() with a pool; bitset branch & bound)
+    - per team: one legal move set per member so the whole team hits the most combos super-effectively
+        - a member's move sets are bitsets over the combos; a set whose bitset is inside another's is dominated
+          (it can never add more to the team) & is dropped before the search
+        - members are searched fewest options first; best(member, covered) is memoized on the covered bits that
+          the remaining members can still add, so equal subproblems are solved once
+        - an option is skipped when its gain + everything the later members could add can't beat the best so far,
+          & a member stops once it reaches everything still coverable
+
+FUNCTIONS:
+from poke_movepool_v6 import legal_movesets, joint_movesets, movepool_report, format_movepool
+'''
+
+
+########################################################################################################################
+#                                                    FUNCTIONS                                                         #
+########################################################################################################################
+
+# Generate a member's legal move sets without dominated ones; [(int(bitset), ['stab types' + 'coverage types']), ]
+# largest bitset first
+def legal_movesets(hit_bitsets, all_types, stab_types, pool=None, moves=4):
+
+    """ :param hit_bitsets:  build_hit_bitsets()
+        :param   all_types:  ['all pkmn types', ]
+        :param  stab_types:  ['attacking pkmn's types', ]
+        :param        pool:  ['legal coverage types', ] (None = any type)
+        :param       moves:  moves per set"""
+
+    stab = [t for t in dict.fromkeys(stab_types) if t is not None]
+    base = 0
+    for t in stab:
+        base |= hit_bitsets[all_types.index(t)]
+    free = [i for i, t in enumerate(all_types) if t not in stab and (pool is None or t in pool)]
+    slots = min(max(moves - len(stab), 0), len(free))
+
+    # one bitset per move set; sets with the same bitset keep the first one
+    by_bitset = {}
+    for picks in combinations(free, slots):
+        bitset = base
+        for i in picks:
+            bitset |= hit_bitsets[i]
+        by_bitset.setdefault(bitset, picks)
+
+    # a bitset inside a kept (larger or equal) bitset is dominated
+    kept = []
+    for bitset in sorted(by_bitset, key=int.bit_count, reverse=True):
+        if not any(bitset & ~other == 0 for other, _ in kept):
+            kept.append((bitset, by_bitset[bitset]))
+    profiler.count('movepool_dominated', len(by_bitset) - len(kept))
+
+    return [(bitset, stab + [all_types[i] for i in picks]) for bitset, picks in kept]
+
+
+# Find one legal move set per member so the team hits the most combos; {'hit', 'movesets', 'options', 'states'}
+def joint_movesets(hit_bitsets, all_types, pkmn_team, pools, moves=4):
+
+    """ :param hit_bitsets:  build_hit_bitsets()
+        :param   all_types:  ['all pkmn types', ]
+        :param   pkmn_team:  [['type1', 'type2' or None], ]
+        :param       pools:  [['legal coverage types', ] or None per member]
+        :param       moves:  moves per set
+
+        'movesets' are [(int(combos hit by the member), ['types'])] in team order"""
+
+    options = [legal_movesets(hit_bitsets, all_types, pokemon, pool, moves) for pokemon, pool in zip(pkmn_team, pools)]
+    order = sorted(range(len(options)), key=lambda m: len(options[m]))
+
+    # reach[i] = combos members order[i:] could still hit with any of their move sets
+    reach = [0] * (len(order) + 1)
+    for i in range(len(order) - 1, -1, -1):
+        reach[i] = reach[i + 1]
+        for bitset, _ in options[order[i]]:
+            reach[i] |= bitset
+
+    memo = {}
+
+    # best (new combos hit, (option per member from i on)) given the combos already 'covered'
+    def best(i, covered):
+
+        if i == len(order):
+            return 0, ()
+        free = reach[i] & ~covered
+        key = (i, free)
+        if key in memo:
+            profiler.hit('movepool_memo', True)
+            return memo[key]
+        profiler.hit('movepool_memo', False)
+
+        limit, later = free.bit_count(), reach[i + 1] & free
+        best_gain, best_choice = -1, ()
+        for option, (bitset, _) in enumerate(options[order[i]]):
+            gain = (bitset & free).bit_count()
+            if gain + (later & ~bitset).bit_count() <= best_gain:
+                continue
+            rest, choice = best(i + 1, covered | bitset)
+            if gain + rest > best_gain:
+                best_gain, best_choice = gain + rest, (option,) + choice
+                if best_gain == limit:
+                    break
+        memo[key] = best_gain, best_choice
+
+        return memo[key]
+
+    hit, choice = best(0, 0)
+    picked = {member: options[member][option] for member, option in zip(order, choice)}
+
+    return {'hit': hit, 'movesets': [(picked[m][0].bit_count(), picked[m][1]) for m in range(len(options))],
+            'options': [len(member_options) for member_options in options], 'states': len(memo)}
+
+
+# Build the move pool record; each member's best legal move sets & the team's best joint assignment
+def movepool_report(hit_bitsets, all_types, pkmn_team, pools, n_combos, top=3, moves=4):
+
+    """ :param hit_bitsets:  build_hit_bitsets()
+        :param   all_types:  ['all pkmn types', ]
+        :param   pkmn_team:  [['type1', 'type2' or None], ]
+        :param       pools:  [['legal coverage types', ] or None per member]
+        :param    n_combos:  len(type_combos)
+        :param         top:  best legal move sets listed per member
+        :param       moves:  moves per set"""
+
+    with profiler.stage('movepool'):
+        members = []
+        for count, (pokemon, pool) in enumerate(zip(pkmn_team, pools), 1):
+            best_movesets = optimal_movesets(hit_bitsets, all_types, list(pokemon), moves, top, pool)
+            members.append({'member': count, 'types': [t for t in pokemon if t], 'pool': pool,
+                            'movesets': [{'hit': score, 'types': moveset} for score, moveset in best_movesets]})
+        joint = joint_movesets(hit_bitsets, all_types, pkmn_team, pools, moves)
+
+    return {'record': 'movepool', 'n_combos': n_combos, 'members': members,
+            'joint': {'hit': joint['hit'], 'states': joint['states'],
+                      'movesets': [{'member': count, 'hit': score, 'types': moveset, 'options': n_options}
+                                   for count, ((score, moveset), n_options)
+                                   in enumerate(zip(joint['movesets'], joint['options']), 1)]}}
+
+
+# Format the move pool record as a text report; the TextRenderer layout
+def format_movepool(record):
+
+    """ :param record:  movepool_report()"""
+
+    n_combos = record['n_combos']
+    lines = ['\n\tM O V E   P O O L S :\n']
+    for member in record['members']:
+        pool = 'any type' if member['pool'] is None else ' '.join(member['pool']) or 'STAB only'
+        lines.append(f"\n\t\tP K M N {member['member']} :  {' '.join(member['types'])}\t| legal: {pool}\n")
+        for rank, moveset in enumerate(member['movesets'], 1):
+            lines.append(f"\t\t\t{rank:>2}. {moveset['hit']:>3}/{n_combos} weak to\t| {moveset['types']}\n")
+
+    joint = record['joint']
+    lines.append(f"\n\tT E A M   M O V E S E T S :\t{joint['hit']}/{n_combos} weak to the team\n")
+    for moveset in joint['movesets']:
+        lines.append(f"\t\t{moveset['member']}. {moveset['hit']:>3}/{n_combos} weak to\t| {moveset['types']}\n")
+
+    return ''.join(lines) + '\n'
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+__author__ = 'Shamar D. Brown'
+__version__ = '6.0'
+
+import sys
+import json
+import time
+
+'''
+DESCRIPTION:
+    - lightweight instrumentation for "poke_coverage": stage timers, counters, object counts & cache hit/miss rates
+    - off by default; a disabled profiler returns a shared no-op stage & ignores counts, so hooks cost ~nothing
+    - stages nest; the report is JSON, or "folded stacks" (stage;sub-stage microseconds) for flamegraph.pl/speedscope
+
+    from poke_profile_v6 import profiler
+    with profiler.stage('setup'):
+        ...
+    profiler.count('objects.Pkmn')
+    profiler.hit('pkmn', found)
+
+FUNCTIONS:
+from poke_profile_v6 import Profiler, profiler
+'''
+
+
+########################################################################################################################
+#                                                      CLASSES                                                         #
+########################################################################################################################
+
+
+# A stage that does nothing; returned while the profiler is disabled
+class _NullStage:
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+# A running stage; adds its elapsed time to the profiler on exit
+class _Stage:
+
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+
+        """ :param profiler:  Profiler
+            :param     name:  'stage name'"""
+
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.profiler.stack.append(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        stack = self.profiler.stack
+        timing = self.profiler.stages.setdefault(tuple(stack), [0, 0.0])
+        timing[0] += 1
+        timing[1] += elapsed
+        stack.pop()
+        return False
+
+
+# Create the Profiler object
+class Profiler:
+
+    # initialize profiler attributes
+    def __init__(self):
+
+        self.enabled = False
+        self.stages = {}
+        self.counters = {}
+        self.stack = []
+        self.start = time.perf_counter()
+
+    # start recording; earlier records are dropped
+    def enable(self):
+
+        self.__init__()
+        self.enabled = True
+
+    # time a 'with' block; stages opened inside it are recorded as its children
+    def stage(self, name):
+
+        """ :param name:  'stage name'"""
+
+        return _Stage(self, name) if self.enabled else _NULL_STAGE
+
+    # add 'n' to a counter
+    def count(self, name, n=1):
+
+        """ :param name:  'counter name'
+            :param    n:  int()"""
+
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    # record a cache lookup
+    def hit(self, cache, found):
+
+        """ :param cache:  'cache name'
+            :param found:  True = hit, False = miss"""
+
+        if self.enabled:
+            name = f'cache.{cache}.{"hits" if found else "misses"}'
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    # Generate the report; {'wall_s', 'stages': {'a;b': {...}}, 'counters': {...}, 'caches': {...}}
+    def report(self):
+
+        stages = {}
+        for path, (calls, seconds) in sorted(self.stages.items()):
+            children = sum(child[1] for key, child in self.stages.items()
+                           if len(key) == len(path) + 1 and key[:len(path)] == path)
+            stages[';'.join(path)] = {'calls': calls, 'total_s': seconds, 'self_s': max(seconds - children, 0.0),
+                                      'mean_s': seconds / calls}
+
+        caches = {}
+        for name, value in self.counters.items():
+            if name.startswith('cache.'):
+                cache, kind = name[len('cache.'):].rsplit('.', 1)
+                caches.setdefault(cache, {'hits': 0, 'misses': 0})[kind] = value
+        for stats in caches.values():
+            lookups = stats['hits'] + stats['misses']
+            stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+
+        return {'wall_s': time.perf_counter() - self.start, 'stages': stages,
+                'counters': {name: value for name, value in sorted(self.counters.items())
+                             if not name.startswith('cache.')},
+                'caches': caches}
+
+    # Generate "folded stacks": one 'stage;sub-stage <self time in microseconds>' line per stage
+    def folded(self):
+
+        return ''.join(f'{path} {round(stats["self_s"] * 1e6)}\n' for path, stats in self.report()['stages'].items())
+
+    # Write the report to 'path' ('-' = stderr) as 'json' or 'folded'
+    def write(self, path='-', fmt='json'):
+
+        """ :param path:  'path_to_report' or '-'
+            :param  fmt:  'json' or 'folded'"""
+
+        text = self.folded() if fmt == 'folded' else json.dumps(self.report(), indent=2) + '\n'
+        if path == '-':
+            sys.stderr.write(text)
+            return
+        with open(path, 'w', encoding='utf-8') as report_file:
+            report_file.write(text)
+
+
+########################################################################################################################
+#                                              C O N S T A N T S                                                       #
+########################################################################################################################
+
+# shared no-op stage
+_NULL_STAGE = _NullStage()
+
+# the process-wide profiler; enabled by 'poke_coverage_v6.py --profile'
+profiler = Profiler()
@@ -0,0 +1,407 @@
+#!/usr/bin/env python
+
+__author__ = 'Shamar D. Brown'
+__version__ = '6.0'
+
+import io
+import csv
+import json
+from poke_functions_v6 import join_coverage, format_pkmn, format_coverage
+
+'''
+DESCRIPTION:
+    - output layer for "poke_coverage": results are built as records, then serialized in bulk by a renderer
+    - member record: one team member's stats, STAB coverage, coverage options & (--optimal) best move sets
+    - team record: the team & the types that don't do stab damage
+    - defense record (--defense): the team's weaknesses & resistances per attacking type & dual STAB combo
+    - movepool record (move pools in the input): each member's best legal move sets & the team's joint assignment
+    - comparison records (several --chart): per member & for the team, one entry per chart side by side
+    - renderers: 'text' (the classic terminal layout), 'jsonl' (one JSON object per record) & 'csv' (one row per member;
+      the team, defense & move pool records are left out)
+    - records are buffered & written with one write() per batch; only 'text' pays for the table formatting
+
+FUNCTIONS:
+from poke_render_v6 import (Renderer, TextRenderer, JsonlRenderer, CsvRenderer, coverage_record, member_record,
+                            team_record, comparison_record, make_renderer)
+'''
+
+
+########################################################################################################################
+#                                              C O N S T A N T S                                                       #
+########################################################################################################################
+
+# records per write()
+RENDER_BATCH = 1000
+
+# CSV columns; list columns are space separated, nested columns are JSON
+RENDER_CSV_FIELDS = ['member', 'types', 'strengths', 'uncovered', 'weaknesses', 'resistances', 'immunities', 'stab',
+                     'options', 'movesets']
+
+# CSV columns for chart comparisons; one row per (member or team, chart)
+COMPARISON_CSV_FIELDS = ['member', 'types', 'chart', 'stab_hit', 'n_combos', 'weaknesses', 'resistances', 'immunities',
+                         'stacked_weaknesses', 'shared_weaknesses', 'nonstab_types', 'error']
+
+
+########################################################################################################################
+#                                                      CLASSES                                                         #
+########################################################################################################################
+
+
+# Create the Renderer object; buffers formatted records & writes them in batches
+class Renderer:
+
+    # initialize renderer attributes
+    def __init__(self, stream, batch_size=RENDER_BATCH):
+
+        """ :param     stream:  open text file (or sys.stdout)
+            :param batch_size:  records per write()"""
+
+        self.stream = stream
+        self.batch_size = batch_size
+        self.buffer = []
+
+    # format one member record; overridden by each renderer
+    def format_member(self, record):
+
+        """ :param record:  member_record()"""
+
+        raise NotImplementedError
+
+    # format the team record; renderers without a team layout write nothing
+    def format_team(self, record):
+
+        """ :param record:  team_record()"""
+
+        return ''
+
+    # format the team defense record; renderers without a defense layout write nothing
+    def format_defense(self, record):
+
+        """ :param record:  defense_report()"""
+
+        return ''
+
+    # format the move pool record; renderers without a move pool layout write nothing
+    def format_movepool(self, record):
+
+        """ :param record:  movepool_report()"""
+
+        return ''
+
+    # format one chart comparison (member or team); overridden by each renderer
+    def format_comparison(self, record):
+
+        """ :param record:  comparison_record()"""
+
+        raise NotImplementedError
+
+    # add a member record
+    def member(self, record):
+
+        """ :param record:  member_record()"""
+
+        self.add(self.format_member(record))
+
+    # add the team record
+    def team(self, record):
+
+        """ :param record:  team_record()"""
+
+        self.add(self.format_team(record))
+
+    # add the team defense record
+    def defense(self, record):
+
+        """ :param record:  defense_report()"""
+
+        self.add(self.format_defense(record))
+
+    # add the move pool record
+    def movepool(self, record):
+
+        """ :param record:  movepool_report()"""
+
+        self.add(self.format_movepool(record))
+
+    # add a chart comparison record
+    def comparison(self, record):
+
+        """ :param record:  comparison_record()"""
+
+        self.add(self.format_comparison(record))
+
+    # buffer formatted text; written once 'batch_size' records are waiting
+    def add(self, text):
+
+        """ :param text:  'formatted record'"""
+
+        self.buffer.append(text)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    # write the buffered records with one write()
+    def flush(self):
+
+        if self.buffer:
+            self.stream.write(''.join(self.buffer))
+            self.buffer.clear()
+
+    # write anything left & flush the stream
+    def close(self):
+
+        self.flush()
+        self.stream.flush()
+
+
+# Create the TextRenderer object; the classic print_pkmn() / print_coverage() layout
+class TextRenderer(Renderer):
+
+    # format one member; stats block, coverage table & (--optimal) best move sets
+    def format_member(self, record):
+
+        """ :param record:  member_record()"""
+
+        text = format_pkmn(record['member'], record['types'], record['strengths'], record['uncovered'],
+                           record['weaknesses'], record['resistances'], record['immunities'])
+        text += format_coverage(join_coverage(_coverage_columns(record['stab']), _coverage_columns(record['options'])))
+        if record.get('movesets') is not None:
+            from poke_search_v6 import format_optimal
+            text += format_optimal([(moveset['hit'], moveset['types']) for moveset in record['movesets']],
+                                   record['n_combos'])
+
+        return text
+
+    # format the types that don't do stab damage
+    def format_team(self, record):
+
+        """ :param record:  team_record()"""
+
+        nonstab = record['nonstab_types']
+        return f"\n\n\t** {len(nonstab)} types don't do stab damage: {nonstab} **\n\n"
+
+    # format the team defense table
+    def format_defense(self, record):
+
+        """ :param record:  defense_report()"""
+
+        from poke_defense_v6 import format_defense
+        return format_defense(record)
+
+    # format the move pool report
+    def format_movepool(self, record):
+
+        """ :param record:  movepool_report()"""
+
+        from poke_movepool_v6 import format_movepool
+        return format_movepool(record)
+
+    # format a chart comparison; one line per chart
+    def format_comparison(self, record):
+
+        """ :param record:  comparison_record()"""
+
+        if record['member']:
+            lines = [f'\n\tP K M N {record["member"]} :  {" ".join(record["types"])}\n']
+        else:
+            lines = [f'\n\tT E A M :  {", ".join(" ".join(types) for types in record["types"])}\n']
+
+        width = max(len(entry['chart']) for entry in record['charts'])
+        for entry in record['charts']:
+            if entry.get('error'):
+                lines.append(f'\t\t{entry["chart"]:<{width}}  | {entry["error"]}\n')
+            elif record['member']:
+                lines.append(f'\t\t{entry["chart"]:<{width}}  | {entry["stab_hit"]:>3}/{entry["n_combos"]} weak to\t'
+                             f'| {entry["weaknesses"]} weaknesses\t| {entry["resistances"]} resistances\t'
+                             f'| {entry["immunities"]} immunities\n')
+            else:
+                lines.append(f'\t\t{entry["chart"]:<{width}}  | {entry["stab_hit"]:>3}/{entry["n_combos"]} weak to\t'
+                             f'| {entry["stacked_weaknesses"]} stacked weaknesses\t'
+                             f'| {len(entry["nonstab_types"])} types without stab\n')
+
+        return ''.join(lines)
+
+
+# Create the JsonlRenderer object; one JSON object per record
+class JsonlRenderer(Renderer):
+
+    # format one member
+    def format_member(self, record):
+
+        """ :param record:  member_record()"""
+
+        return json.dumps(record) + '\n'
+
+    # format the team
+    def format_team(self, record):
+
+        """ :param record:  team_record()"""
+
+        return json.dumps(record) + '\n'
+
+    # format the team defense
+    def format_defense(self, record):
+
+        """ :param record:  defense_report()"""
+
+        return json.dumps(record) + '\n'
+
+    # format the move pool report
+    def format_movepool(self, record):
+
+        """ :param record:  movepool_report()"""
+
+        return json.dumps(record) + '\n'
+
+    # format a chart comparison
+    def format_comparison(self, record):
+
+        """ :param record:  comparison_record()"""
+
+        return json.dumps(record) + '\n'
+
+
+# Create the CsvRenderer object; one row per member or per (member, chart)
+# the team, defense & move pool records don't fit the member columns & are left out; use jsonl for them
+class CsvRenderer(Renderer):
+
+    # initialize csv attributes; the header is the first buffered line
+    def __init__(self, stream, batch_size=RENDER_BATCH, fields=RENDER_CSV_FIELDS):
+
+        """ :param     stream:  open text file (or sys.stdout)
+            :param batch_size:  records per write()
+            :param     fields:  RENDER_CSV_FIELDS or COMPARISON_CSV_FIELDS"""
+
+        super().__init__(stream, batch_size)
+        self.line = io.StringIO()
+        self.writer = csv.DictWriter(self.line, fields, extrasaction='ignore')
+        self.writer.writeheader()
+        self.buffer.append(self._take_line())
+
+    # format one member
+    def format_member(self, record):
+
+        """ :param record:  member_record()"""
+
+        row = dict(record)
+        for field in ('types', 'strengths', 'uncovered', 'weaknesses', 'resistances', 'immunities'):
+            row[field] = ' '.join(record[field])
+        for field in ('stab', 'options', 'movesets'):
+            row[field] = json.dumps(record[field]) if record.get(field) is not None else ''
+        self.writer.writerow(row)
+
+        return self._take_line()
+
+    # format a chart comparison; one row per chart
+    def format_comparison(self, record):
+
+        """ :param record:  comparison_record()"""
+
+        types = ' '.join(record['types']) if record['member'] else json.dumps(record['types'])
+        for entry in record['charts']:
+            row = {**entry, 'member': record['member'] or 'team', 'types': types}
+            for field in ('shared_weaknesses', 'nonstab_types'):
+                if field in row:
+                    row[field] = ' '.join(row[field])
+            self.writer.writerow(row)
+
+        return self._take_line()
+
+    # return & clear the csv writer's line buffer
+    def _take_line(self):
+
+        text = self.line.getvalue()
+        self.line.seek(0)
+        self.line.truncate()
+
+        return text
+
+
+########################################################################################################################
+#                                                    FUNCTIONS                                                         #
+########################################################################################################################
+
+# Convert a coverage header into [{'type', 'weak', 'resist', 'immune'}, ]; counts are None for untracked types
+def coverage_record(types_header, type_counts):
+
+    """ :param types_header:  get_coverage()[0]
+        :param  type_counts:  [{weak_counts}, {resist_counts}, {immune_counts}] the header was counted against"""
+
+    weak_counts, resist_counts, immune_counts = type_counts
+    return [{'type': t, 'weak': weak_counts[t]['count'] if t in weak_counts else None,
+             'resist': resist_counts[t]['count'] if t in resist_counts else None,
+             'immune': immune_counts[t]['count'] if t in immune_counts else None} for t in types_header]
+
+
+# Build one member record
+def member_record(count, pkmn_types, this_pkmn, stab, options, best_movesets=None, n_combos=None):
+
+    """ :param         count:  team member number
+        :param    pkmn_types:  ['type1', 'type2' or None] as entered
+        :param     this_pkmn:  Pkmn
+        :param          stab:  coverage_record() for the STAB types
+        :param       options:  coverage_record() for the coverage options
+        :param best_movesets:  optimal_movesets() (--optimal only)
+        :param      n_combos:  len(type_combos) (--optimal only)"""
+
+    record = {'record': 'member', 'member': count, 'types': [t for t in pkmn_types if t],
+              'strengths': list(this_pkmn.strength), 'uncovered': list(this_pkmn.uncovered),
+              'weaknesses': list(this_pkmn.weakness), 'resistances': list(this_pkmn.resisted),
+              'immunities': list(this_pkmn.immune), 'stab': stab, 'options': options, 'movesets': None}
+    if best_movesets is not None:
+        record['movesets'] = [{'hit': score, 'types': list(moveset)} for score, moveset in best_movesets]
+        record['n_combos'] = n_combos
+
+    return record
+
+
+# Build the team record
+def team_record(pkmn_team, nonstab_types):
+
+    """ :param     pkmn_team:  [['type1', 'type2' or None], ]
+        :param nonstab_types:  ['types that don't do stab damage', ]"""
+
+    return {'record': 'team', 'team': [[t for t in pokemon if t] for pokemon in pkmn_team],
+            'nonstab_types': list(nonstab_types)}
+
+
+# Build a chart comparison record for one member (member = its number) or the team (member = 0)
+def comparison_record(member, pkmn_types, entries):
+
+    """ :param     member:  team member number (0 = the whole team)
+        :param pkmn_types:  ['type1', 'type2' or None] (member) or [['type1', 'type2' or None], ] (team)
+        :param    entries:  [{'chart', 'stab_hit', 'n_combos', ...} or {'chart', 'error'}, ] in chart order"""
+
+    types = [t for t in pkmn_types if t] if member else [[t for t in pokemon if t] for pokemon in pkmn_types]
+    return {'record': 'comparison', 'member': member, 'types': types, 'charts': entries}
+
+
+# Create the renderer for 'fmt'
+def make_renderer(fmt, stream, batch_size=RENDER_BATCH, comparison=False):
+
+    """ :param        fmt:  'text', 'jsonl' or 'csv'
+        :param     stream:  open text file (or sys.stdout)
+        :param batch_size:  records per write()
+        :param comparison:  True = chart comparison records (changes the CSV columns)"""
+
+    if fmt == 'csv':
+        return CsvRenderer(stream, batch_size, COMPARISON_CSV_FIELDS if comparison else RENDER_CSV_FIELDS)
+    renderers = {'text': TextRenderer, 'jsonl': JsonlRenderer}
+    return renderers[fmt](stream, batch_size)
+
+
+# Convert coverage records back to the get_coverage() layout: [[types], [['n weak to', 'n resists', 'n immune'], ]]
+def _coverage_columns(coverage):
+
+    """ :param coverage:  coverage_record()"""
+
+    return [[column['type'] for column in coverage],
+            [[f'{_count_text(column["weak"])} weak to', f'{_count_text(column["resist"])} resists',
+              f'{_count_text(column["immune"])} immune'] for column in coverage]]
+
+
+# Format a count; usage-weighted counts (float) are shown as '% of usage'
+def _count_text(count):
+
+    """ :param count:  int(combos), float(% of usage) or None"""
+
+    return f'{count:.1f}%' if isinstance(count, float) else f'{count}'
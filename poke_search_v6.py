@@ -0,0 +1,404 @@
+#!/usr/bin/env python
+
+__author__ = 'Shamar D. Brown'
+__version__ = '6.0'
+
+import os
+import heapq
+from multiprocessing import Pool
+from poke_chart_v6 import compile_type_chart
+from poke_index_v6 import build_combo_index
+
+'''
+DESCRIPTION:
+    - exact coverage search for "poke_coverage"
+    - each attacking type is a bitset over the type combos it hits super-effectively
+    - a move set's score is the popcount of the union of its bitsets (STAB included)
+    - branch & bound over the candidate types with a top-k heap; returns the k best move sets
+    - team search: branch & bound over the unique type combos, seeded by a beam search & sharded over a process pool
+      teams rank by offensive STAB coverage, then by the fewest stacked weaknesses
+
+FUNCTIONS:
+from poke_search_v6 import (build_hit_bitsets, optimal_movesets, print_optimal, format_optimal, build_team_tables,
+                            score_team, beam_teams, polish_team, optimal_teams, print_teams)
+'''
+
+
+########################################################################################################################
+#                                              C O N S T A N T S                                                       #
+########################################################################################################################
+
+# per-process team search state; set by _init_team_worker()
+_team_state = {}
+
+
+########################################################################################################################
+#                                                    FUNCTIONS                                                         #
+########################################################################################################################
+
+# Generate [int(bitset) per attacking type]; bit i is set when the type does (2*damage) to type_combos[i]
+def build_hit_bitsets(all_types, type_combos, all_swri):
+
+    """ :param   all_types:  ['all pkmn types', ]
+        :param type_combos:  [[type combos], ['type_1','type_2' or None], ]
+        :param    all_swri:  [all_strengths, all_weaknesses, all_resistances, all_immunities]"""
+
+    weak = build_combo_index(all_types, type_combos, all_swri).bitsets['weak']
+    return [weak[t] for t in all_types]
+
+
+# Find the k move sets that hit the most type combos super-effectively; STAB types always fill their own slots
+def optimal_movesets(hit_bitsets, all_types, stab_types, moves=4, k=1, pool=None):
+
+    """ :param hit_bitsets:  build_hit_bitsets()
+        :param   all_types:  ['all pkmn types', ]
+        :param  stab_types:  ['attacking pkmn's types', ] ([] to search all 'moves' slots freely)
+        :param       moves:  moves per set
+        :param           k:  number of move sets to return
+        :param        pool:  ['legal coverage types', ] (None = any type; STAB types are always legal)
+
+        :return: [(int(combos hit), ['stab types' + 'coverage types']), ] best first"""
+
+    stab = [t for t in dict.fromkeys(stab_types) if t is not None]
+    base = 0
+    for t in stab:
+        base |= hit_bitsets[all_types.index(t)]
+
+    # candidates sorted by what they add on top of STAB; larger gains first tighten the bound sooner
+    candidates = sorted(((hit_bitsets[i] & ~base).bit_count(), i) for i, t in enumerate(all_types)
+                        if t not in stab and (pool is None or t in pool))
+    candidates.reverse()
+    slots = min(max(moves - len(stab), 0), len(candidates))
+    gains = [gain for gain, i in candidates]
+    bitsets = [hit_bitsets[i] for gain, i in candidates]
+
+    # top-k heap of (score, -order, [type indexes]); smallest kept score is heap[0]
+    heap, order = [], 0
+
+    # depth-first branch & bound; 'chosen' are positions in 'candidates'
+    def search(start, covered, chosen):
+
+        nonlocal order
+        remaining = slots - len(chosen)
+        if not remaining:
+            score = covered.bit_count()
+            entry = (score, -order, [candidates[c][1] for c in chosen])
+            order += 1
+            if len(heap) < k:
+                heapq.heappush(heap, entry)
+            elif score > heap[0][0]:
+                heapq.heapreplace(heap, entry)
+            return
+
+        # upper bound: what is covered so far + the largest remaining individual gains (gains are sorted)
+        count = covered.bit_count()
+        for c in range(start, len(candidates) - remaining + 1):
+            bound = count + sum(gains[c:c + remaining])
+            if len(heap) == k and bound <= heap[0][0]:
+                break
+            chosen.append(c)
+            search(c + 1, covered | bitsets[c], chosen)
+            chosen.pop()
+
+    search(0, base, [])
+
+    # best first; ties keep the order they were found in
+    return [(score, stab + sorted((all_types[i] for i in picks), key=all_types.index))
+            for score, _, picks in sorted(heap, reverse=True)]
+
+
+# print the k best move sets
+def print_optimal(best_movesets, n_combos):
+
+    """ :param best_movesets:  optimal_movesets()
+        :param      n_combos:  len(type_combos)"""
+
+    print(format_optimal(best_movesets, n_combos), end='')
+
+
+# Format the best move sets as a ranked text list; the print_optimal() layout
+def format_optimal(best_movesets, n_combos):
+
+    """ :param best_movesets:  optimal_movesets() (or [(score, [types]), ]; float scores are % of usage)
+        :param      n_combos:  len(type_combos)"""
+
+    lines = ['\tO P T I M A L :\n']
+    for rank, (score, moveset) in enumerate(best_movesets, 1):
+        hit = f'{score:>5.1f}% of usage' if isinstance(score, float) else f'{score:>3}/{n_combos}'
+        lines.append(f'\t\t{rank:>2}. {hit} weak to\t| {list(moveset)}\n')
+
+    return ''.join(lines) + '\n'
+
+
+# Generate the team search tables: one entry per unique combo (('fire', 'grass') == ('grass', 'fire'))
+def build_team_tables(all_types, type_combos, all_swri, hit_bitsets):
+
+    """ :param   all_types:  ['all pkmn types', ]
+        :param type_combos:  [[type combos], ['type_1','type_2' or None], ]
+        :param    all_swri:  [all_strengths, all_weaknesses, all_resistances, all_immunities]
+        :param hit_bitsets:  build_hit_bitsets(all_types, type_combos, all_swri)
+
+        :return: {'combos': [[combo], ], 'offense': [int(stab hit bitset), ], 'weak': [int(weakness mask), ],
+                  'total': len(type_combos)}"""
+
+    chart = compile_type_chart(all_types, all_swri)
+    unique = {}
+    for combo in type_combos:
+        unique.setdefault(frozenset(combo), list(combo))
+    combos = list(unique.values())
+
+    # offense = every combo either stab type does (2*damage) to; weak = types that do (2*damage) to the combo
+    offense = [hit_bitsets[all_types.index(t1)] | (hit_bitsets[all_types.index(t2)] if t2 else 0) for t1, t2 in combos]
+    weak = [chart.combo_masks(combo)[1] for combo in combos]
+
+    return {'combos': combos, 'offense': offense, 'weak': weak, 'total': len(type_combos)}
+
+
+# Score a team: (int(combos hit by stab), int(stacked weaknesses)); a type 2 members are weak to stacks once, etc.
+def score_team(tables, members):
+
+    """ :param  tables:  build_team_tables()
+        :param members:  [index into tables['combos'], ]"""
+
+    covered, seen, overlap = 0, 0, 0
+    for m in members:
+        covered |= tables['offense'][m]
+        overlap += (seen & tables['weak'][m]).bit_count()
+        seen |= tables['weak'][m]
+
+    return covered.bit_count(), overlap
+
+
+# Find the locked members' indexes in tables['combos']
+def locked_members(tables, locked):
+
+    """ :param tables:  build_team_tables()
+        :param locked:  [['type_1', 'type_2' or None], ]"""
+
+    index = {frozenset(combo): i for i, combo in enumerate(tables['combos'])}
+    return [index[frozenset(combo)] for combo in locked]
+
+
+# Approximate top-k teams: keep the 'width' best partial teams at every level
+def beam_teams(tables, locked=(), size=6, k=5, width=64, penalty=10):
+
+    """ :param  tables:  build_team_tables()
+        :param  locked:  [['type_1', 'type_2' or None], ] members every team must include
+        :param    size:  members per team
+        :param       k:  number of teams to return
+        :param   width:  partial teams kept per level
+        :param penalty:  combos hit that one stacked weakness is worth while partial teams are ranked
+
+        :return: [(int(combos hit), int(stacked weaknesses), [[combo], ]), ] best first"""
+
+    fixed = locked_members(tables, locked)
+    free = [i for i in range(len(tables['combos'])) if i not in fixed]
+    beam = [[]]
+
+    # a stacked weakness never goes away, so partial teams trade it against coverage still to come
+    def partial_key(team):
+        hit, overlap = score_team(tables, fixed + [free[c] for c in team])
+        return hit - penalty * overlap
+
+    # partial teams only grow by later candidates, so each team is built once
+    for _ in range(min(size - len(fixed), len(free))):
+        grown = [team + [c] for team in beam for c in range(team[-1] + 1 if team else 0, len(free))]
+        grown.sort(key=partial_key, reverse=True)
+        beam = grown[:width]
+
+    teams = [fixed + [free[c] for c in team] for team in beam]
+    return _team_results(tables, teams, k)
+
+
+# Improve a team by swapping one free member at a time until no swap helps
+def polish_team(tables, team, n_fixed=0):
+
+    """ :param  tables:  build_team_tables()
+        :param    team:  [index into tables['combos'], ]
+        :param n_fixed:  leading members of 'team' that must stay"""
+
+    best, improved = _team_key(tables, team), True
+    while improved:
+        improved = False
+        for pos in range(n_fixed, len(team)):
+            for c in range(len(tables['combos'])):
+                if c in team:
+                    continue
+                swapped = team[:pos] + [c] + team[pos + 1:]
+                key = _team_key(tables, swapped)
+                if key > best:
+                    best, team, improved = key, swapped, True
+
+    return team
+
+
+# Exact top-k teams: branch & bound seeded by beam_teams(); root branches are sharded over a process pool
+def optimal_teams(tables, locked=(), size=6, k=5, processes=None, width=64):
+
+    """ :param    tables:  build_team_tables()
+        :param    locked:  [['type_1', 'type_2' or None], ] members every team must include
+        :param      size:  members per team
+        :param         k:  number of teams to return
+        :param processes:  worker processes (None = os.cpu_count(), 1 = no pool)
+        :param     width:  beam width used to seed the bound (seeds are polished by polish_team())
+
+        :return: [(int(combos hit), int(stacked weaknesses), [[combo], ]), ] best first"""
+
+    fixed = locked_members(tables, locked)
+    seeds = [polish_team(tables, locked_members(tables, members), len(fixed))
+             for _, _, members in beam_teams(tables, locked, size, k, width)]
+    seeds = _team_results(tables, {tuple(sorted(team)): team for team in seeds}.values(), k)
+    floor = (seeds[-1][0], -seeds[-1][1]) if len(seeds) == k else None
+
+    # candidates with the most offense & fewest weaknesses first; good teams are found early
+    free = [i for i in range(len(tables['combos'])) if i not in fixed]
+    free.sort(key=lambda i: (-tables['offense'][i].bit_count(), tables['weak'][i].bit_count()))
+    slots = min(size - len(fixed), len(free))
+    state = {'tables': tables, 'fixed': fixed, 'free': free, 'slots': slots, 'k': k, 'floor': floor}
+
+    # one task per first free member; small tasks keep the pool balanced
+    roots = list(range(len(free) - slots + 1)) if slots else [None]
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(roots) == 1:
+        _init_team_worker(state)
+        shards = [_team_branch(root) for root in roots]
+    else:
+        with Pool(processes, initializer=_init_team_worker, initargs=(state,)) as pool:
+            shards = list(pool.imap_unordered(_team_branch, roots))
+
+    # merge the shards with the seeds; a pruned team never beats the k-th seed
+    teams = [team for shard in shards for team in shard] + [locked_members(tables, seed[2]) for seed in seeds]
+    teams = {tuple(sorted(team)): team for team in teams}
+    return _team_results(tables, teams.values(), k)
+
+
+# Set the per-process team search state
+def _init_team_worker(state):
+
+    """ :param state:  {'tables', 'fixed', 'free', 'slots', 'k', 'floor'}"""
+
+    # 'heap' is shared by every branch this process searches, so later branches prune against earlier finds
+    _team_state.clear()
+    _team_state.update(state, heap=[])
+
+
+# Branch & bound over the teams whose first free member is free[root]; returns this process's top-k teams so far
+def _team_branch(root):
+
+    """ :param root:  position in _team_state['free'] (None when no slot is free)"""
+
+    tables, fixed, free = _team_state['tables'], _team_state['fixed'], _team_state['free']
+    slots, k, floor = _team_state['slots'], _team_state['k'], _team_state['floor']
+    offense = [tables['offense'][i] for i in free]
+    weak = [tables['weak'][i] for i in free]
+    total = tables['total']
+
+    # reach[c] = every combo free[c:] can still hit; caps the bound on charts where some combos can't be hit at all
+    reach = [0] * (len(free) + 1)
+    for c in range(len(free) - 1, -1, -1):
+        reach[c] = reach[c + 1] | offense[c]
+
+    covered, seen, overlap = 0, 0, 0
+    for m in fixed:
+        covered |= tables['offense'][m]
+        overlap += (seen & tables['weak'][m]).bit_count()
+        seen |= tables['weak'][m]
+
+    # this process's top-k heap of ((combos hit, -stacked weaknesses), [positions in 'free'])
+    heap = _team_state['heap']
+
+    def worst():
+        if len(heap) == k:
+            return max(heap[0][0], floor) if floor else heap[0][0]
+        return floor
+
+    def search(start, covered, seen, overlap, chosen):
+
+        remaining = slots - len(chosen)
+        if not remaining:
+            key = (covered.bit_count(), -overlap)
+            if len(heap) < k:
+                heapq.heappush(heap, (key, list(chosen)))
+            elif key > heap[0][0]:
+                heapq.heapreplace(heap, (key, list(chosen)))
+            return
+
+        # gains[j] = combos free[start + j] adds; stacks[j] = weaknesses it stacks on the members chosen so far
+        count = covered.bit_count()
+        gains = [(covered | offense[c]).bit_count() - count for c in range(start, len(free))]
+        stacks = [(seen & weak[c]).bit_count() for c in range(start, len(free))]
+
+        # the other (remaining - 1) members add at most the largest gains after j, and at least the smallest stacks
+        most_gained = _suffix_sums(gains, remaining - 1)
+        least_stacked = [-total for total in _suffix_sums([-stack for stack in stacks], remaining - 1)]
+
+        for c in range(start, len(free) - remaining + 1):
+
+            # upper bound on combos hit & lower bound on stacked weaknesses; neither can beat the k-th best -> prune
+            j = c - start
+            bound = (min(count + gains[j] + most_gained[j], (covered | reach[c]).bit_count()),
+                     -(overlap + stacks[j] + least_stacked[j]))
+            kth = worst()
+            if kth is not None and bound <= kth:
+                continue
+            chosen.append(c)
+            search(c + 1, covered | offense[c], seen | weak[c], overlap + stacks[j], chosen)
+            chosen.pop()
+
+    if root is None:
+        search(0, covered, seen, overlap, [])
+    else:
+        search(root + 1, covered | offense[root], seen | weak[root], overlap + (seen & weak[root]).bit_count(), [root])
+
+    return [fixed + [free[c] for c in chosen] for key, chosen in heap]
+
+
+# Generate [sum of the n largest values after position j, ]
+def _suffix_sums(values, n):
+
+    """ :param values:  [int(), ]
+        :param      n:  how many of the following values to add up"""
+
+    sums, top = [0] * len(values), []
+    for j in range(len(values) - 1, -1, -1):
+        sums[j] = sum(top)
+        if len(top) < n:
+            heapq.heappush(top, values[j])
+        elif top and values[j] > top[0]:
+            heapq.heapreplace(top, values[j])
+
+    return sums
+
+
+# Sort key for a team; more combos hit first, then fewer stacked weaknesses
+def _team_key(tables, members):
+
+    """ :param  tables:  build_team_tables()
+        :param members:  [index into tables['combos'], ]"""
+
+    hit, overlap = score_team(tables, members)
+    return hit, -overlap
+
+
+# Convert member indexes to the k best [(int(combos hit), int(stacked weaknesses), [[combo], ]), ]
+def _team_results(tables, teams, k):
+
+    """ :param tables:  build_team_tables()
+        :param  teams:  [[index into tables['combos'], ], ]
+        :param      k:  number of teams to return"""
+
+    ranked = sorted(teams, key=lambda team: _team_key(tables, team), reverse=True)[:k]
+    return [(*score_team(tables, team), [tables['combos'][m] for m in team]) for team in ranked]
+
+
+# print the k best teams
+def print_teams(teams, n_combos):
+
+    """ :param    teams:  optimal_teams() or beam_teams()
+        :param n_combos:  len(type_combos)"""
+
+    print(f'\tT E A M S :')
+    for rank, (hit, overlap, members) in enumerate(teams, 1):
+        names = ', '.join(f'{t1} {t2}' if t2 else f'{t1}' for t1, t2 in members)
+        print(f'\t\t{rank:>2}. {hit:>3}/{n_combos} weak to\t| {overlap} stacked weaknesses\t| {names}')
+    print()
@@ -0,0 +1,447 @@
+#!/usr/bin/env python
+
+__author__ = 'Shamar D. Brown'
+__version__ = '6.0'
+
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from poke_engine_v6 import ENGINE_CACHE_SIZE, CoverageEngine, normalize_team
+from poke_types_v6 import DEFAULT_CHART
+
+'''
+DESCRIPTION:
+    - local HTTP/JSON query service for "poke_coverage" on top of CoverageEngine (asyncio, standard library only)
+    - concurrent queries are micro-batched: teams arriving within BATCH_WAIT of each other (up to BATCH_MAX) are
+      scored in one vectorized engine.score() call
+    - every engine call runs on one worker thread, so the event loop keeps accepting requests & the engine (and its
+      LRU cache) is never used by two threads at once
+    - per-route latency percentiles (p50/p90/p99 over the last LATENCY_WINDOW requests) are served by GET /stats
+
+    GET  /health                                   -> {"status": "ok", "chart"}
+    GET  /stats                                    -> {"engine", "batching", "latency"}
+    POST /score    {"team": ["fire", "water grass"]}  or  {"teams": [[...], ]}   -> batch row  or  {"rows": [...]}
+    POST /analyse  {"team": ["fire", "water grass"]}                           -> {"members", "team", "score"}
+
+    python poke_service_v6.py [--host 127.0.0.1] [--port 8765] [--chart gen6] [--optimal] [--load N]
+
+FUNCTIONS:
+from poke_service_v6 import LatencyStats, MicroBatcher, CoverageService, serve, query, load_test
+'''
+
+
+########################################################################################################################
+#                                              C O N S T A N T S                                                       #
+########################################################################################################################
+
+# default address; the service only listens locally unless told otherwise
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = 8765
+
+# teams per micro-batch & seconds the first team of a batch waits for others
+BATCH_MAX = 256
+BATCH_WAIT = 0.002
+
+# requests per route kept for the latency percentiles
+LATENCY_WINDOW = 10000
+
+# largest request body accepted (bytes)
+MAX_BODY = 1 << 20
+
+# HTTP status lines
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+########################################################################################################################
+#                                                      CLASSES                                                         #
+########################################################################################################################
+
+
+# Create the LatencyStats object; recent request times per route
+class LatencyStats:
+
+    # initialize latency attributes
+    def __init__(self, window=LATENCY_WINDOW):
+
+        """ :param window:  requests per route kept for the percentiles"""
+
+        self.window = window
+        self.samples = {}
+        self.counts = {}
+
+    # Record one request
+    def add(self, route, seconds):
+
+        """ :param   route:  'METHOD /path'
+            :param seconds:  request time"""
+
+        self.samples.setdefault(route, deque(maxlen=self.window)).append(seconds)
+        self.counts[route] = self.counts.get(route, 0) + 1
+
+    # Percentiles per route in ms; {'route': {'count', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms'}}
+    def report(self):
+
+        report = {}
+        for route, samples in sorted(self.samples.items()):
+            p50, p90, p99 = np.percentile(np.fromiter(samples, dtype=np.float64), [50, 90, 99]) * 1e3
+            report[route] = {'count': self.counts[route], 'p50_ms': round(p50, 3), 'p90_ms': round(p90, 3),
+                             'p99_ms': round(p99, 3), 'max_ms': round(max(samples) * 1e3, 3)}
+
+        return report
+
+
+# Create the MicroBatcher object; collects concurrent teams & scores them in one engine.score() call
+class MicroBatcher:
+
+    # initialize batcher attributes
+    def __init__(self, engine, executor, max_batch=BATCH_MAX, max_wait=BATCH_WAIT):
+
+        """ :param    engine:  CoverageEngine
+            :param  executor:  single-thread executor every engine call runs on
+            :param max_batch:  teams per batch
+            :param  max_wait:  seconds the first team of a batch waits for others"""
+
+        self.engine = engine
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = None
+        self.task = None
+        self.batches = 0
+        self.teams = 0
+        self.largest = 0
+
+    # Start the batching task on the running loop
+    def start(self):
+
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._run())
+
+    # Stop the batching task
+    async def stop(self):
+
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+
+    # Score one team; waits for the batch it joins
+    async def submit(self, team):
+
+        """ :param team:  ['type1 type2' or ['type1', 'type2' or None], ]"""
+
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((team, future))
+
+        return await future
+
+    # Batching statistics; {'batches', 'teams', 'mean_batch', 'largest_batch', 'max_batch', 'max_wait_ms'}
+    def stats(self):
+
+        return {'batches': self.batches, 'teams': self.teams,
+                'mean_batch': round(self.teams / self.batches, 2) if self.batches else None,
+                'largest_batch': self.largest, 'max_batch': self.max_batch, 'max_wait_ms': self.max_wait * 1e3}
+
+    # Take a batch off the queue (the first team, then whatever arrives within max_wait) & score it
+    async def _run(self):
+
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            self.batches += 1
+            self.teams += len(batch)
+            self.largest = max(self.largest, len(batch))
+            try:
+                rows = await loop.run_in_executor(self.executor, self.engine.score, [team for team, _ in batch])
+            except Exception:
+                # score the batch team by team, so only the team that fails gets the error
+                rows = None
+            for position, (team, future) in enumerate(batch):
+                try:
+                    row = rows[position] if rows else (await loop.run_in_executor(self.executor, self.engine.score,
+                                                                                    [team]))[0]
+                except Exception as team_error:
+                    if not future.done():
+                        future.set_exception(team_error)
+                    continue
+                if not future.done():
+                    future.set_result(row)
+
+
+# Create the CoverageService object; routes HTTP requests to the engine & the batcher
+class CoverageService:
+
+    # initialize service attributes
+    def __init__(self, engine, max_batch=BATCH_MAX, max_wait=BATCH_WAIT):
+
+        """ :param    engine:  CoverageEngine
+            :param max_batch:  teams per micro-batch
+            :param  max_wait:  seconds the first team of a batch waits for others"""
+
+        self.engine = engine
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='poke-engine')
+        self.batcher = MicroBatcher(engine, self.executor, max_batch, max_wait)
+        self.latency = LatencyStats()
+
+    # Serve one connection; HTTP/1.1 requests with keep-alive until the client closes
+    async def handle(self, reader, writer):
+
+        """ :param reader:  asyncio.StreamReader
+            :param writer:  asyncio.StreamWriter"""
+
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                start = time.perf_counter()
+                parts = request_line.decode('latin-1').split()
+                length = int(headers.get('content-length') or 0)
+
+                # latency is kept per real route; a request line that can't be parsed has none
+                route = f'{parts[0]} {parts[1].split("?")[0]}' if len(parts) == 3 else None
+                if route is None:
+                    status, payload = 400, {'error': 'bad request line'}
+                elif length > MAX_BODY:
+                    status, payload = 413, {'error': f'body over {MAX_BODY} bytes'}
+                else:
+                    body = await reader.readexactly(length) if length else b''
+                    status, payload = await self.dispatch(parts[0], parts[1].split('?')[0], body)
+
+                keep_alive = len(parts) == 3 and parts[2] == 'HTTP/1.1' and status != 413 \
+                    and headers.get('connection', '').lower() != 'close'
+                data = json.dumps(payload).encode('utf-8')
+                writer.write(f'HTTP/1.1 {status} {HTTP_REASONS[status]}\r\nContent-Type: application/json\r\n'
+                             f'Content-Length: {len(data)}\r\nConnection: {"keep-alive" if keep_alive else "close"}'
+                             f'\r\n\r\n'.encode('latin-1') + data)
+                await writer.drain()
+                if route is not None and status != 404:
+                    self.latency.add(route, time.perf_counter() - start)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    # Answer one request; (status, JSON payload)
+    async def dispatch(self, method, path, body):
+
+        """ :param method:  'GET' or 'POST'
+            :param   path:  '/route'
+            :param   body:  request body (bytes)"""
+
+        routes = {'/health': 'GET', '/stats': 'GET', '/score': 'POST', '/analyse': 'POST'}
+        if path not in routes:
+            return 404, {'error': f'no route {path}', 'routes': sorted(routes)}
+        if method != routes[path]:
+            return 405, {'error': f'{path} takes {routes[path]}'}
+
+        if path == '/health':
+            return 200, {'status': 'ok', 'chart': self.engine.chart}
+        if path == '/stats':
+            engine_stats = await asyncio.get_running_loop().run_in_executor(self.executor, self.engine.stats)
+            return 200, {'engine': engine_stats, 'batching': self.batcher.stats(), 'latency': self.latency.report()}
+
+        try:
+            request = json.loads(body or b'{}')
+        except ValueError as json_error:
+            return 400, {'error': f'invalid JSON: {json_error}'}
+        many = path == '/score' and isinstance(request, dict) and 'teams' in request
+        if not isinstance(request, dict) or not isinstance(request.get('teams' if many else 'team'), list):
+            return 400, {'error': "expected {\"team\": [...]}" + (" or {\"teams\": [[...], ]}" if path == '/score'
+                                                                 else '')}
+
+        # malformed teams are rejected here, so they never reach (and fail) a batch shared with other requests
+        try:
+            teams = [normalize_team(team) for team in (request['teams'] if many else [request['team']])]
+        except ValueError as team_error:
+            return 400, {'error': str(team_error)}
+
+        try:
+            if many:
+                return 200, {'rows': list(await asyncio.gather(*map(self.batcher.submit, teams)))}
+            row = await self.batcher.submit(teams[0])
+            if path == '/score' or row.get('error'):
+                return (400 if row.get('error') else 200), row
+            loop = asyncio.get_running_loop()
+            return 200, await loop.run_in_executor(self.executor, self.engine.analyse, teams[0], row)
+        except ValueError as query_error:
+            return 400, {'error': str(query_error)}
+        except Exception as service_error:
+            return 500, {'error': f'{type(service_error).__name__}: {service_error}'}
+
+
+########################################################################################################################
+#                                                    FUNCTIONS                                                         #
+########################################################################################################################
+
+# Start the service on the running loop; returns (asyncio server, CoverageService); port 0 picks a free port
+async def serve(engine, host=SERVICE_HOST, port=SERVICE_PORT, max_batch=BATCH_MAX, max_wait=BATCH_WAIT):
+
+    """ :param    engine:  CoverageEngine
+        :param      host:  address to listen on
+        :param      port:  port to listen on (0 = any free port; server.sockets[0].getsockname()[1])
+        :param max_batch:  teams per micro-batch
+        :param  max_wait:  seconds the first team of a batch waits for others"""
+
+    service = CoverageService(engine, max_batch, max_wait)
+    service.batcher.start()
+    server = await asyncio.start_server(service.handle, host, port)
+
+    return server, service
+
+
+# Send one request to a running service; (status, JSON payload)
+async def query(path, payload=None, host=SERVICE_HOST, port=SERVICE_PORT):
+
+    """ :param    path:  '/route'
+        :param payload:  JSON body (None = GET)
+        :param    host:  service address
+        :param    port:  service port"""
+
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        body = b'' if payload is None else json.dumps(payload).encode('utf-8')
+        writer.write(f'{"GET" if payload is None else "POST"} {path} HTTP/1.1\r\nHost: {host}\r\n'
+                     f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n'
+                     .encode('latin-1') + body)
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if not line.strip():
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        return status, json.loads(await reader.readexactly(int(headers['content-length'])))
+    finally:
+        writer.close()
+
+
+# Fire 'n_requests' random team queries at a service, 'concurrency' at a time; (requests/second, /stats payload)
+async def load_test(n_requests, concurrency=64, path='/score', host=SERVICE_HOST, port=SERVICE_PORT, seed=0):
+
+    """ :param  n_requests:  queries sent
+        :param concurrency:  queries in flight at once
+        :param        path:  '/score' or '/analyse'
+        :param        host:  service address
+        :param        port:  service port
+        :param        seed:  random seed for the teams"""
+
+    _, health = await query('/health', host=host, port=port)
+    _, stats = await query('/stats', host=host, port=port)
+    n_combos = stats['engine']['combos']
+    from poke_types_v6 import load_chart
+    from poke_cache_v6 import cached_tables
+    chart = load_chart(health['chart'])
+    combos = cached_tables(chart['all_types'], chart['all_swri'], chart['unused_combos'])['all_combos']
+    rng = random.Random(seed)
+    teams = [[' '.join(t for t in combos[rng.randrange(n_combos)] if t) for _ in range(6)]
+             for _ in range(n_requests)]
+
+    in_flight = asyncio.Semaphore(concurrency)
+
+    async def one(team):
+        async with in_flight:
+            return await query(path, {'team': team}, host, port)
+
+    start = time.perf_counter()
+    statuses = [status for status, _ in await asyncio.gather(*map(one, teams))]
+    elapsed = time.perf_counter() - start
+    if any(status != 200 for status in statuses):
+        raise RuntimeError(f'{sum(status != 200 for status in statuses)} of {n_requests} queries failed')
+
+    return n_requests / elapsed, (await query('/stats', host=host, port=port))[1]
+
+
+# Run the service until interrupted; with 'load' it answers a local load test instead & prints the stats
+async def _main(args):
+
+    """ :param args:  parsed command line"""
+
+    engine = CoverageEngine(args.chart, optimal=args.optimal, top=args.top, usage=args.usage, species=args.species,
+                            defense=args.defense, atlas=not args.no_atlas, cache_size=args.cache_size)
+    server, service = await serve(engine, args.host, 0 if args.load else args.port, args.batch_max,
+                                  args.batch_wait / 1e3)
+    host, port = server.sockets[0].getsockname()[:2]
+    try:
+        if args.load:
+            for path in ('/score', '/analyse'):
+                rate, stats = await load_test(args.load, args.concurrency, path, host, port)
+                print(f'** {path}: {args.load} queries, {args.concurrency} in flight: {rate:.0f} queries/s')
+            print(json.dumps(stats, indent=2))
+            return
+        print(f'** serving {engine.chart} on http://{host}:{port} (Ctrl-C to stop)', file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+    finally:
+        server.close()
+        await service.batcher.stop()
+        service.executor.shutdown()
+
+
+########################################################################################################################
+#                                                     START WORK                                                       #
+########################################################################################################################
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='local HTTP/JSON coverage query service')
+    parser.add_argument('--host', default=SERVICE_HOST, help='address to listen on (default: local only)')
+    parser.add_argument('--port', type=int, default=SERVICE_PORT, help='port to listen on')
+    parser.add_argument('--chart', default=DEFAULT_CHART, metavar='NAME|FILE', help='type chart')
+    parser.add_argument('--optimal', action='store_true', help='/analyse lists the exact best move sets')
+    parser.add_argument('--top', type=int, default=3, help='number of move sets listed by --optimal')
+    parser.add_argument('--usage', metavar='FILE', help='weight every combo by a usage file')
+    parser.add_argument('--species', metavar='FILE', help='species -> types file for --usage')
+    parser.add_argument('--defense', action='store_true', help='add the team defense columns & report')
+    parser.add_argument('--no-atlas', action='store_true', help='analyse every member even if an atlas is built')
+    parser.add_argument('--cache-size', type=int, default=ENGINE_CACHE_SIZE, help='results kept by the LRU cache')
+    parser.add_argument('--batch-max', type=int, default=BATCH_MAX, help='teams per micro-batch')
+    parser.add_argument('--batch-wait', type=float, default=BATCH_WAIT * 1e3, metavar='MS',
+                        help='ms the first team of a batch waits for others')
+    parser.add_argument('--load', type=int, default=0, metavar='N',
+                        help='start on a free port, answer N random queries from a local client, print the stats')
+    parser.add_argument('--concurrency', type=int, default=64, help='--load queries in flight at once')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(_main(args))
+    except KeyboardInterrupt:
+        pass
+
+########################################################################################################################
+#                                                       END WORK                                                       #
+########################################################################################################################
@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+
+__author__ = 'Shamar D. Brown'
+__version__ = '6.0'
+
+import os
+import sys
+import time
+from poke_functions_v6 import TEAM_SIZE, Pkmn, import_poke_input_file, parse_pkmn_line, parse_move_pool, coverage_types
+from poke_profile_v6 import profiler
+from poke_render_v6 import coverage_record, member_record, team_record
+
+'''
+DESCRIPTION:
+    - incremental team analysis for "poke_coverage": the setup tables stay in memory & each member's record is cached
+    - swapping a member recomputes only that member (or reuses its cached record) & the team aggregates
+    - with a CoverageAtlas (poke_atlas_v6), a new member is one lookup in the precomputed table
+    - 'interactive' reads edits from stdin ('3 fire ghost'); 'watch' re-reads poke_input.txt whenever it is saved
+
+    session = TeamSession(all_types, all_swri, all_type_counts, all_index)
+    session.set_team(pkmn_team)          # -> [changed slots]
+    session.set_member(2, ['fire', 'ghost'])
+    session.member(2), session.team()     # -> member_record(), team_record()
+
+FUNCTIONS:
+from poke_session_v6 import TeamSession, read_input_team, interactive, watch
+'''
+
+
+########################################################################################################################
+#                                              C O N S T A N T S                                                       #
+########################################################################################################################
+
+# seconds between poke_input.txt checks in watch mode
+WATCH_INTERVAL = 0.25
+
+# interactive mode commands
+SESSION_HELP = """
+\t** N TYPE1 [TYPE2]  set team member N (1-6); add ': MOVE TYPES' to limit its coverage moves
+\t** N -              remove team member N
+\t** team             show the whole team
+\t** load             re-read the input file
+\t** quit             leave (or Ctrl-D) **
+"""
+
+
+########################################################################################################################
+#                                                      CLASSES                                                         #
+########################################################################################################################
+
+
+# Create the TeamSession object; holds the team, one cached record per member & the team aggregates
+class TeamSession:
+
+    # initialize session attributes
+    def __init__(self, all_types, all_swri, all_type_counts, all_index, hit_bitsets=None, top=3, atlas=None):
+
+        """ :param       all_types:  ['all pkmn types', ]
+            :param        all_swri:  [all_strengths, all_weaknesses, all_resistances, all_immunities]
+            :param all_type_counts:  cached_tables()['all_type_counts']
+            :param       all_index:  ComboIndex, or UsageIndex (counts in % of usage; all_type_counts from it too)
+            :param     hit_bitsets:  [int(bitset of combos weak to the type) per type] (--optimal only; any
+                                     non-None value with a UsageIndex)
+            :param             top:  number of move sets kept by --optimal
+            :param           atlas:  CoverageAtlas for this chart (None = always analyse); ComboIndex counts only"""
+
+        self.all_types = all_types
+        self.all_swri = all_swri
+        self.all_type_counts = all_type_counts
+        self.all_index = all_index
+        self.hit_bitsets = hit_bitsets
+        self.top = top
+        self.atlas = atlas
+
+        # team slots; ('type1', 'type2' or None) & (legal coverage types) or None per member
+        self.members = []
+        self.pools = []
+
+        # member records by slot & every record computed so far by (type combo as entered, move pool)
+        self.records = []
+        self.memo = {}
+
+        # types no member gets stab on
+        self.nonstab_types = list(all_types)
+
+    # Set team member 'slot' (0-based; == len(members) appends); returns False if nothing changed
+    def set_member(self, slot, pokemon, pool=None):
+
+        """ :param    slot:  int()
+            :param pokemon:  ['type1', 'type2' or None]
+            :param    pool:  ['legal coverage types', ] (None = any type); parse_move_pool()"""
+
+        pokemon, pool = self._check_member(slot, pokemon, pool)
+        if not 0 <= slot <= min(len(self.members), TEAM_SIZE - 1):
+            raise ValueError(f'member {slot + 1} is out of range (1-{min(len(self.members) + 1, TEAM_SIZE)})')
+        if slot < len(self.members) and self.members[slot] == pokemon and self.pools[slot] == pool:
+            return False
+
+        # the atlas holds unconstrained members only
+        record = self.memo.get((pokemon, pool))
+        profiler.hit('members', record is not None)
+        if record is None and self.atlas is not None and pool is None:
+            record = self.memo[pokemon, pool] = self.atlas.member(pokemon, self.hit_bitsets is not None, self.top)
+        if record is None:
+            record = self.memo[pokemon, pool] = self._analyse(pokemon, pool)
+
+        if slot == len(self.members):
+            self.members.append(pokemon)
+            self.pools.append(pool)
+            self.records.append(record)
+        else:
+            self.members[slot] = pokemon
+            self.pools[slot] = pool
+            self.records[slot] = record
+        self._update_team()
+
+        return True
+
+    # Remove team member 'slot'; later members move up
+    def remove_member(self, slot):
+
+        """ :param slot:  int()"""
+
+        if not 0 <= slot < len(self.members):
+            raise ValueError(f'member {slot + 1} is out of range (1-{len(self.members)})')
+        del self.members[slot]
+        del self.pools[slot]
+        del self.records[slot]
+        self._update_team()
+
+    # Replace the whole team; only changed members are recomputed; returns [changed slots]
+    # every member is checked first, so a bad team leaves the session as it was
+    def set_team(self, pkmn_team, pools=None):
+
+        """ :param pkmn_team:  [['type1', 'type2' or None], ]
+            :param     pools:  [['legal coverage types', ] or None per member] (None = any type for every member)"""
+
+        pools = pools or [None] * len(pkmn_team)
+        if len(pkmn_team) > TEAM_SIZE:
+            raise ValueError(f'more than {TEAM_SIZE} members')
+        for slot, (pokemon, pool) in enumerate(zip(pkmn_team, pools)):
+            self._check_member(slot, pokemon, pool)
+        changed = [slot for slot, (pokemon, pool) in enumerate(zip(pkmn_team, pools))
+                   if self.set_member(slot, pokemon, pool)]
+        if len(self.members) > len(pkmn_team):
+            del self.members[len(pkmn_team):]
+            del self.pools[len(pkmn_team):]
+            del self.records[len(pkmn_team):]
+            self._update_team()
+
+        return changed
+
+    # member_record() for 'slot', numbered by its place on the team
+    def member(self, slot):
+
+        """ :param slot:  int()"""
+
+        return dict(self.records[slot], member=slot + 1)
+
+    # team_record() for the current team
+    def team(self):
+
+        return team_record([list(pokemon) for pokemon in self.members], self.nonstab_types)
+
+    # Check one member; returns (('type1', 'type2' or None), ('legal coverage types', ) or None)
+    def _check_member(self, slot, pokemon, pool):
+
+        """ :param    slot:  int() (error messages)
+            :param pokemon:  ['type1', 'type2' or None]
+            :param    pool:  ['legal coverage types', ] or None"""
+
+        pokemon = (pokemon[0], pokemon[1] if len(pokemon) > 1 else None)
+        pool = None if pool is None else tuple(pool)
+        if not pokemon[0]:
+            raise ValueError(f'member {slot + 1} has no type')
+        unknown_types = [t for t in pokemon + (pool or ()) if t and t not in self.all_types]
+        if unknown_types:
+            raise ValueError(f"unknown type '{unknown_types[0]}'")
+
+        return pokemon, pool
+
+    # Analyse one member; the record poke_coverage renders for it (member number 0 until member() fills it in)
+    def _analyse(self, pokemon, pool=None):
+
+        """ :param pokemon:  ('type1', 'type2' or None)
+            :param    pool:  ('legal coverage types', ) or None; options & move sets only use these"""
+
+        all_types, all_type_counts, all_index = self.all_types, self.all_type_counts, self.all_index
+
+        # create pkmn
+        with profiler.stage('pkmn'):
+            this_pkmn = Pkmn(all_types, list(pokemon), self.all_swri)
+
+        with profiler.stage('coverage'):
+
+            # [last_bit_of_combos] = bitset of (type combos that 'this_pkmn' does not (2*damage) to)
+            last_bit_of_combos = all_index.combo_difference(this_pkmn.strength)
+
+            # rank this_pkmn's stab types; [stab types_header]
+            stab_coverage = coverage_types(list(pokemon), all_type_counts)
+
+            # generate options for this_pkmn coverage recommendation
+            best_movesets = None
+            if self.hit_bitsets is not None:
+
+                # exact search; options are the best move set's non-stab types, counted against combos stab can't hit
+                # a UsageIndex searches its own weights (duck-typed; importing it would load NumPy)
+                if hasattr(all_index, 'optimal_movesets'):
+                    best_movesets = all_index.optimal_movesets(list(pokemon), k=self.top, pool=pool)
+                else:
+                    from poke_search_v6 import optimal_movesets
+                    best_movesets = optimal_movesets(self.hit_bitsets, all_types, list(pokemon), k=self.top,
+                                                     pool=pool)
+                last_bit_of_combos = all_index.combo_difference(this_pkmn.types)
+                last_bit_of_counts = all_index.type_counts(all_types, last_bit_of_combos)
+                last_bit_of_coverage = coverage_types([t for t in best_movesets[0][1] if t not in this_pkmn.types],
+                                                      last_bit_of_counts)
+            else:
+                last_bit_of_counts = all_index.type_counts(all_types, last_bit_of_combos)
+                last_bit_of_coverage = coverage_types([t for t in all_types if t not in this_pkmn.types
+                                                       and (pool is None or t in pool)], last_bit_of_counts)
+
+        return member_record(0, pokemon, this_pkmn, coverage_record(stab_coverage, all_type_counts),
+                             coverage_record(last_bit_of_coverage, last_bit_of_counts), best_movesets,
+                             len(all_index.combos))
+
+    # track the types that your pokemon team should cover
+    def _update_team(self):
+
+        team_types = {t for pokemon in self.members for t in pokemon}
+        self.nonstab_types = [t for t in self.all_types if t not in team_types]
+
+
+########################################################################################################################
+#                                                    FUNCTIONS                                                         #
+########################################################################################################################
+
+# Read the input file's team & move pools; a missing file is a ValueError, so the session keeps running
+def read_input_team(filename):
+
+    """ :param filename:  'path_to_input_file'"""
+
+    if not os.path.isfile(filename):
+        raise ValueError(f'no input file {filename}')
+
+    return import_poke_input_file(filename, move_pools=True)
+
+
+# Render the changed members & the team summary; text output also reports the update time
+def render_update(session, renderer, changed, elapsed, text=True):
+
+    """ :param  session:  TeamSession
+        :param renderer:  Renderer
+        :param  changed:  [changed slots]
+        :param  elapsed:  seconds the update took (None = no timing line)
+        :param     text:  True = text renderer (adds the timing line)"""
+
+    with profiler.stage('render'):
+        for slot in changed:
+            renderer.member(session.member(slot))
+        renderer.team(session.team())
+        if text and elapsed is not None:
+            renderer.add(f'\t** {len(changed)} member(s) updated in {elapsed * 1e3:.3f} ms **\n')
+        renderer.close()
+
+
+# Edit the team from stdin; one command per line (SESSION_HELP)
+def interactive(session, renderer, filename, stream=sys.stdin, text=True):
+
+    """ :param  session:  TeamSession (already holding the input file's team)
+        :param renderer:  Renderer
+        :param filename:  'path_to_input_file' ('load' command)
+        :param   stream:  command lines (default stdin)
+        :param     text:  True = text renderer (prompts, help & timing lines)"""
+
+    if text:
+        print(SESSION_HELP)
+    while True:
+        if text:
+            print('>>> ', end='', flush=True)
+        line = stream.readline()
+        if not line:
+            break
+        command = line.split()
+        if not command:
+            continue
+        if command[0] in ('quit', 'exit', 'q'):
+            break
+        if command[0] == 'team':
+            render_update(session, renderer, list(range(len(session.members))), None, text)
+            continue
+
+        start = time.perf_counter()
+        try:
+            if command[0] == 'load':
+                changed = session.set_team(*read_input_team(filename))
+            elif command[0].isdigit() and len(command) > 1:
+                slot = int(command[0]) - 1
+                if command[1] == '-':
+                    session.remove_member(slot)
+                    changed = list(range(slot, len(session.members)))
+                else:
+                    member = ' '.join(command[1:])
+                    changed = [slot] if session.set_member(slot, parse_pkmn_line(member), parse_move_pool(member)) \
+                        else []
+            else:
+                print(SESSION_HELP if text else f'unknown command: {line.strip()}', file=sys.stderr)
+                continue
+        except ValueError as session_error:
+            print(f'\t** {session_error} **', file=sys.stderr)
+            continue
+        render_update(session, renderer, changed, time.perf_counter() - start, text)
+
+
+# Re-analyse the input file each time it is saved; only changed members are recomputed & rendered
+def watch(session, renderer, filename, interval=WATCH_INTERVAL, text=True):
+
+    """ :param  session:  TeamSession (already holding the input file's team)
+        :param renderer:  Renderer
+        :param filename:  'path_to_input_file'
+        :param interval:  seconds between checks
+        :param     text:  True = text renderer (status & timing lines)"""
+
+    if text:
+        print(f'\n** Watching {filename} (Ctrl-C to stop)\n')
+    last_modified = os.stat(filename).st_mtime_ns
+    try:
+        while True:
+            time.sleep(interval)
+            try:
+                modified = os.stat(filename).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            if modified == last_modified:
+                continue
+            last_modified = modified
+
+            start = time.perf_counter()
+            try:
+                changed = session.set_team(*read_input_team(filename))
+            except ValueError as session_error:
+                print(f'\t** {session_error} **', file=sys.stderr)
+                continue
+            render_update(session, renderer, changed, time.perf_counter() - start, text)
+    except KeyboardInterrupt:
+        pass
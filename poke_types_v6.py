@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+__author__ = 'Shamar D. Brown'
+__version__ = '6.0'
+
+import os
+import json
+
+'''
+DESCRIPTION:
+    - type charts for "poke_coverage", loaded from JSON data files (charts/*.json)
+    - a chart file holds the 4 static dictionaries & the unused combos:
+        {"name", "types": [...], "strengths": {...}, "weaknesses": {...}, "resistances": {...}, "immunities": {...},
+         "unused_combos": [[type1, type2], ]}
+    - {"name", "inverse_of": "gen6"} derives an inverse-battle chart from another chart
+    - bundled: gen1, gen2-5, gen6 (the default) & inverse; fan rulesets are any other file, by name or by path
+    - each file is parsed once per run; compile_type_chart() & cached_tables() cache the compiled forms
+
+CONSTANTS:
+from poke_types_v6 import (all_types, all_strengths, all_weaknesses, all_resistances, all_immunities, all_swri,
+                           unused_combos)
+
+FUNCTIONS:
+from poke_types_v6 import chart_path, list_charts, load_chart, invert_chart
+'''
+
+
+########################################################################################################################
+#                                              C O N S T A N T S                                                       #
+########################################################################################################################
+
+# bundled chart files
+CHART_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'charts')
+
+# chart used when none is chosen
+DEFAULT_CHART = 'gen6'
+
+# parsed charts; {(path, mtime): chart}
+_loaded_charts = {}
+
+
+########################################################################################################################
+#                                                    FUNCTIONS                                                         #
+########################################################################################################################
+
+# Resolve a chart name ('gen1') or a file path to the chart file
+def chart_path(chart):
+
+    """ :param chart:  'chart name' (a file in CHART_DIR) or 'path_to_chart.json'"""
+
+    if os.path.exists(chart):
+        return os.path.abspath(chart)
+
+    path = os.path.join(CHART_DIR, f'{chart}.json')
+    if not os.path.exists(path):
+        raise ValueError(f"unknown chart '{chart}' (bundled: {', '.join(list_charts())})")
+
+    return path
+
+
+# List the bundled chart names
+def list_charts():
+
+    return sorted(name[:-len('.json')] for name in os.listdir(CHART_DIR) if name.endswith('.json'))
+
+
+# Load a chart; {'chart': 'gen6', 'name', 'all_types', 'all_swri', 'unused_combos'}
+def load_chart(chart=DEFAULT_CHART):
+
+    """ :param chart:  'chart name' or 'path_to_chart.json'"""
+
+    path = chart_path(chart)
+    key = (path, os.stat(path).st_mtime_ns)
+    if key in _loaded_charts:
+        return _loaded_charts[key]
+
+    with open(path, 'r', encoding='utf-8') as chart_file:
+        data = json.load(chart_file)
+
+    label = os.path.basename(path)[:-len('.json')] if path.endswith('.json') else os.path.basename(path)
+    if 'inverse_of' in data:
+        base = data['inverse_of']
+        sibling = os.path.join(os.path.dirname(path), base if base.endswith('.json') else f'{base}.json')
+        loaded = dict(invert_chart(load_chart(sibling if os.path.exists(sibling) else base)), chart=label,
+                      name=data.get('name', label))
+    else:
+        loaded = {'chart': label, 'name': data.get('name', label), 'all_types': list(data['types']),
+                  'all_swri': [data['strengths'], data['weaknesses'], data['resistances'], data['immunities']],
+                  'unused_combos': [list(combo) for combo in data.get('unused_combos', [])]}
+        _check_chart(path, loaded)
+
+    _loaded_charts[key] = loaded
+
+    return loaded
+
+
+# Invert a chart (inverse battles): super-effective -> resisted; resisted & no effect -> super-effective
+def invert_chart(chart):
+
+    """ :param chart:  load_chart()"""
+
+    types = chart['all_types']
+    strengths, weaknesses, resistances, immunities = chart['all_swri']
+    inv_weaknesses = {d: [a for a in types if a in resistances.get(d, []) or a in immunities.get(d, [])]
+                      for d in types}
+    inv_strengths = {a: [d for d in types if a in inv_weaknesses[d]] for a in types}
+    inv_resistances = {d: list(dict.fromkeys(weaknesses.get(d, []))) for d in types}
+
+    return {'chart': f'inverse-{chart["chart"]}', 'name': f'Inverse {chart["name"]}', 'all_types': list(types),
+            'all_swri': [inv_strengths, inv_weaknesses, inv_resistances, {}],
+            'unused_combos': [list(combo) for combo in chart['unused_combos']]}
+
+
+# Check that a chart only names its own types
+def _check_chart(path, chart):
+
+    """ :param  path:  'path_to_chart.json'
+        :param chart:  load_chart()"""
+
+    types = set(chart['all_types'])
+    if len(types) != len(chart['all_types']):
+        raise ValueError(f'{path}: duplicate types')
+
+    named = set()
+    for type_dict in chart['all_swri']:
+        for t, listed in type_dict.items():
+            named.add(t)
+            named.update(listed)
+    for combo in chart['unused_combos']:
+        named.update(combo)
+    if named - types:
+        raise ValueError(f'{path}: unknown types {sorted(named - types)}')
+
+
+########################################################################################################################
+#                                                     S E T U P                                                        #
+########################################################################################################################
+
+# the default chart; the module-level names poke_coverage & other modules import
+_default_chart = load_chart(DEFAULT_CHART)
+
+# list of all types of pokemon
+all_types = _default_chart['all_types']
+
+# static dictionaries: strengths (offensive), weaknesses, resistances & immunities (defensive)
+all_swri = _default_chart['all_swri']
+all_strengths, all_weaknesses, all_resistances, all_immunities = all_swri
+
+# Unused type combinations (for canon Pokémon)
+unused_combos = _default_chart['unused_combos']
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+
+__author__ = 'Shamar D. Brown'
+__version__ = '6.0'
+
+import csv
+import json
+from itertools import combinations
+import numpy as np
+from poke_matrix_v6 import SUPER_EFFECTIVE, NEUTRAL, build_type_matrix, build_combo_matrix
+
+'''
+DESCRIPTION:
+    - usage-weighted coverage for "poke_coverage": a combo counts by how often it is used, not once
+    - the usage file is streamed & aggregated in chunks (np.bincount); memory does not grow with the row count
+    - usage rows name a combo ('fire grass', 'fire/grass', 'fire,grass') or a species looked up in a species file
+    - a combo's usage is split evenly over its orderings in the combo list ('fire grass' & 'grass fire'),
+      so each combo's usage is counted once
+    - counts are % of usage: the [weak; resist; immune] x combo table times the weights, one dot product
+    - UsageIndex has ComboIndex's combo_difference() / type_counts() interface (a bool mask instead of an int bitset)
+
+    CSV:    fire grass,1520        or   fire,grass,1520      or   venusaur,1520 (--species)
+    JSONL:  {"types": ["fire", "grass"], "weight": 1520}    or   {"species": "venusaur", "usage": 0.12}
+
+FUNCTIONS:
+from poke_usage_v6 import (UsageIndex, read_species, read_usage_rows, load_usage, read_usage_file,
+                           build_usage_index)
+'''
+
+
+########################################################################################################################
+#                                              C O N S T A N T S                                                       #
+########################################################################################################################
+
+# usage rows aggregated per np.bincount()
+USAGE_CHUNK = 100000
+
+# weight keys accepted in JSONL rows
+USAGE_WEIGHT_KEYS = ('weight', 'usage', 'count')
+
+
+########################################################################################################################
+#                                                      CLASSES                                                         #
+########################################################################################################################
+
+
+# Create the UsageIndex object; weighted counterpart of ComboIndex
+class UsageIndex:
+
+    # initialize index attributes
+    def __init__(self, all_types, type_combos, combo_matrix, weights):
+
+        """ :param    all_types:  ['all pkmn types', ]
+            :param  type_combos:  [[type combos], ['type_1','type_2' or None], ]
+            :param combo_matrix:  build_combo_matrix() over 'type_combos'
+            :param      weights:  [usage share per combo] (sums to 1); load_usage()['weights']"""
+
+        self.types = list(all_types)
+        self.combos = [tuple(combo) for combo in type_combos]
+        self.position = {t: i for i, t in enumerate(self.types)}
+        self.weights = np.asarray(weights, dtype=np.float64)
+
+        # [kind * n_types + type, combo] flags; kind = weak, resist, immune
+        self.hits = combo_matrix >= SUPER_EFFECTIVE
+        self.table = np.vstack([self.hits, (combo_matrix > 0) & (combo_matrix < NEUTRAL),
+                                combo_matrix == 0]).astype(np.float64)
+
+    # Get the mask of combos in 'subset' that none of 'atk_types' does (2*damage) to; mirrors ComboIndex
+    def combo_difference(self, atk_types, subset=None):
+
+        """ :param atk_types:  ['attacking types', ]
+            :param    subset:  bool mask over self.combos (None = every combo)"""
+
+        rows = [self.position[t] for t in atk_types if t in self.position]
+        remaining = ~self.hits[rows].any(axis=0)
+
+        return remaining if subset is None else remaining & subset
+
+    # Generate [{weak_counts}, {resist_counts}, {immune_counts}] in % of usage; same layout as type_counts()
+    def type_counts(self, pkmn_types, subset=None):
+
+        """ :param pkmn_types:  ['attacking pkmn types', ]
+            :param     subset:  bool mask over self.combos (None = every combo)
+
+            'combos' lists are left out; only 'count' is filled in"""
+
+        weights = self.weights if subset is None else self.weights * subset
+        shares = (self.table @ weights).reshape(3, len(self.types)) * 100
+        all_counts = []
+        for kind in range(3):
+            counts = {t: {'count': round(float(shares[kind, self.position[t]]), 3)}
+                      for t in pkmn_types if t in self.position}
+            all_counts.append(dict(sorted(counts.items(), key=lambda item: item[1]['count'], reverse=True)))
+
+        return all_counts
+
+    # Find the k move sets that hit the most usage super-effectively; mirrors optimal_movesets()
+    def optimal_movesets(self, stab_types, moves=4, k=1, pool=None):
+
+        """ :param stab_types:  ['attacking pkmn's types', ] ([] to search all 'moves' slots freely)
+            :param      moves:  moves per set
+            :param          k:  number of move sets to return
+            :param       pool:  ['legal coverage types', ] (None = any type)
+
+            :return: [(float(% of usage hit), ['stab types' + 'coverage types']), ] best first"""
+
+        stab = [t for t in dict.fromkeys(stab_types) if t is not None]
+        base = self.hits[[self.position[t] for t in stab]].any(axis=0)
+        free = [i for i, t in enumerate(self.types) if t not in stab and (pool is None or t in pool)]
+        slots = min(max(moves - len(stab), 0), len(free))
+
+        # every move set is one row; covered combos times the weights scores them all at once
+        picks = list(combinations(free, slots))
+        movesets = np.array(picks, dtype=np.intp).reshape(len(picks), slots)
+        covered = base | self.hits[movesets].any(axis=1)
+        scores = covered @ self.weights * 100
+
+        # best first; ties keep the candidate order
+        best = np.argsort(-scores, kind='stable')[:k]
+        return [(round(float(scores[m]), 3), stab + [self.types[i] for i in movesets[m]]) for m in best]
+
+
+########################################################################################################################
+#                                                    FUNCTIONS                                                         #
+########################################################################################################################
+
+# Load a species file into {'species': ('type1', 'type2' or None)}; CSV (species,type1[,type2]) or a JSON object
+def read_species(path):
+
+    """ :param path:  'path_to_species.csv' or 'path_to_species.json'"""
+
+    with open(path, 'r', encoding='utf-8-sig', newline='') as species_file:
+        if path.endswith('.json'):
+            rows = ([name] + list(types) for name, types in json.load(species_file).items())
+        else:
+            rows = csv.reader(species_file)
+
+        species = {}
+        for row in rows:
+            types = [t.strip().lower() for t in row[1:3] if t and t.strip()]
+            if row and types:
+                species[row[0].strip().lower()] = (types[0], types[1] if len(types) > 1 else None)
+
+    return species
+
+
+# Stream (combo, weight) from a usage file; combos are frozenset(types), or 'name' (a species or a single type)
+def read_usage_rows(stream, fmt='csv'):
+
+    """ :param stream:  open text file (or sys.stdin)
+        :param    fmt:  'csv' or 'jsonl'"""
+
+    if fmt == 'jsonl':
+        for line in stream:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            weight = next((row[key] for key in USAGE_WEIGHT_KEYS if key in row), 1)
+            if 'species' in row:
+                yield str(row['species']).strip().lower(), float(weight)
+            else:
+                yield _usage_key(row.get('types') or row.get('combo') or []), float(weight)
+        return
+
+    # the same few hundred combo / species fields repeat; parse each one once
+    keys = {}
+    for row in csv.reader(stream):
+        if len(row) < 2:
+            continue
+        try:
+            weight = float(row[-1])
+        except ValueError:
+            continue
+        fields = row[0] if len(row) == 2 else ','.join(row[:-1])
+        key = keys.get(fields)
+        if key is None:
+            key = keys[fields] = _usage_key(row[:-1])
+        yield key, weight
+
+
+# Stream & aggregate a usage file into one weight per combo; {'weights', 'rows', 'skipped', 'skipped_weight'}
+def load_usage(stream, type_combos, fmt='csv', species=None, chunk_size=USAGE_CHUNK):
+
+    """ :param      stream:  open text file (or sys.stdin)
+        :param type_combos:  [[type combos], ['type_1','type_2' or None], ] the weights line up with
+        :param         fmt:  'csv' or 'jsonl'
+        :param     species:  read_species() (rows may then name a species)
+        :param  chunk_size:  rows per np.bincount()"""
+
+    species = species or {}
+
+    # one group per unordered combo; a row's weight is added to its group, then split over the group's orderings
+    groups, group_of = [], {}
+    for column, combo in enumerate(type_combos):
+        key = frozenset(t for t in combo if t)
+        if key not in group_of:
+            group_of[key] = len(groups)
+            groups.append([])
+        groups[group_of[key]].append(column)
+
+    totals = np.zeros(len(groups), dtype=np.float64)
+    ids, weights = [], []
+    rows, skipped, skipped_weight = 0, 0, 0.0
+    for key, weight in read_usage_rows(stream, fmt):
+        rows += 1
+        if isinstance(key, str):
+            key = frozenset(t for t in species[key] if t) if key in species else frozenset([key])
+        group = group_of.get(key)
+        if group is None:
+            skipped += 1
+            skipped_weight += weight
+            continue
+        ids.append(group)
+        weights.append(weight)
+        if len(ids) >= chunk_size:
+            totals += np.bincount(ids, weights, minlength=len(groups))
+            ids, weights = [], []
+    if ids:
+        totals += np.bincount(ids, weights, minlength=len(groups))
+
+    if totals.sum() <= 0:
+        raise ValueError('no usage rows matched a type combo')
+
+    combo_weights = np.zeros(len(type_combos), dtype=np.float64)
+    for group, columns in enumerate(groups):
+        combo_weights[columns] = totals[group] / len(columns)
+
+    return {'weights': combo_weights / combo_weights.sum(), 'rows': rows, 'skipped': skipped,
+            'skipped_weight': skipped_weight}
+
+
+# Load a usage file by path; the format comes from the extension ('.jsonl' / '.json' = JSONL, anything else = CSV)
+def read_usage_file(path, type_combos, species_path=None):
+
+    """ :param         path:  'path_to_usage_file'
+        :param  type_combos:  [[type combos], ['type_1','type_2' or None], ] the weights line up with
+        :param species_path:  'path_to_species_file' (optional)"""
+
+    species = read_species(species_path) if species_path else None
+    fmt = 'jsonl' if path.endswith(('.jsonl', '.json')) else 'csv'
+    with open(path, 'r', encoding='utf-8-sig', newline='') as usage_file:
+        return load_usage(usage_file, type_combos, fmt, species)
+
+
+# Build the weighted index for one chart
+def build_usage_index(all_types, all_swri, type_combos, weights):
+
+    """ :param   all_types:  ['all pkmn types', ]
+        :param    all_swri:  [all_strengths, all_weaknesses, all_resistances, all_immunities]
+        :param type_combos:  [[type combos], ['type_1','type_2' or None], ]
+        :param     weights:  load_usage()['weights']"""
+
+    combo_matrix = build_combo_matrix(build_type_matrix(all_types, all_swri), all_types, type_combos)
+
+    return UsageIndex(all_types, type_combos, combo_matrix, weights)
+
+
+# Convert a usage key ('fire grass', 'fire/grass', ['fire', 'grass'], 'dragon' or 'venusaur') to a frozenset of
+# types, or to one name (a species or a single type)
+def _usage_key(fields):
+
+    """ :param fields:  'type1 type2' or ['type1 type2'] or ['type1', 'type2'] or ['name']"""
+
+    fields = [fields] if isinstance(fields, str) else fields
+    types = ' '.join(t for t in fields if t).replace('/', ' ').lower().split()
+
+    return types[0] if len(types) == 1 else frozenset(types)